@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bot.query_profiler.QueryProfilerMiddleware',  # No-op unless QUERY_PROFILER_ENABLED
 ]
 
 ROOT_URLCONF = 'auto_parts_bot.urls'
@@ -147,6 +148,12 @@ ADMIN_MEDIA_PREFIX = '/static/admin/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Dashboard media thumbnails (generated with Pillow, cached under MEDIA_ROOT/thumbnails)
+THUMBNAIL_SIZE = config('THUMBNAIL_SIZE', default=320, cast=int)
+THUMBNAIL_FORMAT = config('THUMBNAIL_FORMAT', default='WEBP')
+THUMBNAIL_QUALITY = config('THUMBNAIL_QUALITY', default=70, cast=int)
+THUMBNAIL_WORKERS = config('THUMBNAIL_WORKERS', default=2, cast=int)
+
 # Custom user model
 AUTH_USER_MODEL = 'bot.User'
 
@@ -181,6 +188,40 @@ CSRF_TRUSTED_ORIGINS = [
 # Telegram Bot settings
 TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN', default='')
 TELEGRAM_WEBHOOK_URL = config('TELEGRAM_WEBHOOK_URL', default='http://localhost:8000/bot/webhook/telegram/')
+# Bot API server; the token is appended (point at a local stub for load tests)
+TELEGRAM_API_BASE_URL = config('TELEGRAM_API_BASE_URL', default='https://api.telegram.org/bot')
+# Conversation state file; empty means <tempdir>/bot_user_states.pickle
+BOT_USER_STATES_FILE = config('BOT_USER_STATES_FILE', default='')
+# In-memory conversation states are capped; idle and least recently used ones spill to <states file>.spill/
+BOT_STATE_MAX_USERS = config('BOT_STATE_MAX_USERS', default=5000, cast=int)
+BOT_STATE_IDLE_SECONDS = config('BOT_STATE_IDLE_SECONDS', default=3600, cast=int)  # 0 = only spill on overflow
+BOT_STATE_SPILL_RETENTION_DAYS = config('BOT_STATE_SPILL_RETENTION_DAYS', default=30, cast=int)  # manage.py bot_state_report --purge
+# Webhook updates are acked immediately and processed by a per-chat ordered worker pool. That process
+# also keeps the conversation state and runs the expiry scheduler and broadcast sender, so run a single
+# web worker process (threads are fine); a second one refuses to start (lock on <states file>.lock)
+WEBHOOK_ASYNC_PROCESSING = config('WEBHOOK_ASYNC_PROCESSING', default=True, cast=bool)
+WEBHOOK_WORKERS = config('WEBHOOK_WORKERS', default=8, cast=int)
+WEBHOOK_MAX_PENDING = config('WEBHOOK_MAX_PENDING', default=1000, cast=int)
+WEBHOOK_STATE_SAVE_SECONDS = config('WEBHOOK_STATE_SAVE_SECONDS', default=2.0, cast=float)  # Conversation state flush interval
+# Redelivered update_ids and repeated confirm/accept/reject/offer actions are absorbed for this long
+IDEMPOTENCY_TTL_SECONDS = config('IDEMPOTENCY_TTL_SECONDS', default=600, cast=int)
+IDEMPOTENCY_MAX_ENTRIES = config('IDEMPOTENCY_MAX_ENTRIES', default=10000, cast=int)
+# Polling: updates processed at once (serialized per user; 1 = sequential), long-poll timeout, update types
+BOT_CONCURRENT_UPDATES = config('BOT_CONCURRENT_UPDATES', default=32, cast=int)
+BOT_POLL_TIMEOUT = config('BOT_POLL_TIMEOUT', default=30, cast=int)
+BOT_ALLOWED_UPDATES = config('BOT_ALLOWED_UPDATES', default='message,callback_query', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
+# Dashboard sends: pooled connections to the Bot API, background send workers (off = send inline)
+TELEGRAM_SERVICE_POOL_SIZE = config('TELEGRAM_SERVICE_POOL_SIZE', default=20, cast=int)
+TELEGRAM_SERVICE_TIMEOUT = config('TELEGRAM_SERVICE_TIMEOUT', default=10, cast=int)
+TELEGRAM_SERVICE_WORKERS = config('TELEGRAM_SERVICE_WORKERS', default=4, cast=int)
+TELEGRAM_SERVICE_BACKGROUND = config('TELEGRAM_SERVICE_BACKGROUND', default=True, cast=bool)
+# Audit log of Telegram traffic (TelegramMessage): ring buffer flushed in batches by a writer thread
+MESSAGE_LOG_ENABLED = config('MESSAGE_LOG_ENABLED', default=True, cast=bool)
+MESSAGE_LOG_BUFFER_SIZE = config('MESSAGE_LOG_BUFFER_SIZE', default=10000, cast=int)
+MESSAGE_LOG_BATCH_SIZE = config('MESSAGE_LOG_BATCH_SIZE', default=500, cast=int)
+MESSAGE_LOG_FLUSH_MS = config('MESSAGE_LOG_FLUSH_MS', default=1000, cast=int)
+MESSAGE_LOG_DROP_POLICY = config('MESSAGE_LOG_DROP_POLICY', default='oldest')  # oldest | newest
+MESSAGE_LOG_RETENTION_DAYS = config('MESSAGE_LOG_RETENTION_DAYS', default=30, cast=int)
 
 # n8n Integration
 N8N_WEBHOOK_URL = config('N8N_WEBHOOK_URL', default='http://n8n:5678')
@@ -190,6 +231,64 @@ DEFAULT_COMMISSION_PERCENTAGE = config('DEFAULT_COMMISSION_PERCENTAGE', default=
 DEFAULT_PAYMENT_URL = config('DEFAULT_PAYMENT_URL', default='https://your-payment-gateway.com')
 REQUEST_EXPIRY_HOURS = config('REQUEST_EXPIRY_HOURS', default=6, cast=int)
 
+# Customer offer comparison board (bot/offer_board.py): ranking weights, paging, cache lifetime
+OFFER_RANK_PRICE_WEIGHT = config('OFFER_RANK_PRICE_WEIGHT', default=0.6, cast=float)
+OFFER_RANK_RATING_WEIGHT = config('OFFER_RANK_RATING_WEIGHT', default=0.3, cast=float)
+OFFER_RANK_VERIFIED_WEIGHT = config('OFFER_RANK_VERIFIED_WEIGHT', default=0.1, cast=float)
+OFFER_BOARD_PAGE_SIZE = config('OFFER_BOARD_PAGE_SIZE', default=5, cast=int)
+OFFER_BOARD_CACHE_SECONDS = config('OFFER_BOARD_CACHE_SECONDS', default=300, cast=int)
+
+# Order fan-out by brand specialization (bot/matching.py; manage.py rebuild_junkyard_index)
+MATCHING_ENABLED = config('MATCHING_ENABLED', default=True, cast=bool)
+MATCHING_HISTORY_DAYS = config('MATCHING_HISTORY_DAYS', default=180, cast=int)
+MATCHING_MIN_HISTORY = config('MATCHING_MIN_HISTORY', default=5, cast=int)  # Offers before history counts as specialization
+MATCHING_DECLARED_WEIGHT = config('MATCHING_DECLARED_WEIGHT', default=10.0, cast=float)
+MATCHING_ACCEPTED_WEIGHT = config('MATCHING_ACCEPTED_WEIGHT', default=3.0, cast=float)
+MATCHING_RESPONSIVENESS_WEIGHT = config('MATCHING_RESPONSIVENESS_WEIGHT', default=5.0, cast=float)  # Times the share of orders answered
+MATCHING_MIN_RECIPIENTS = config('MATCHING_MIN_RECIPIENTS', default=3, cast=int)  # Fewer specialists = whole city
+MATCHING_MAX_RECIPIENTS = config('MATCHING_MAX_RECIPIENTS', default=0, cast=int)  # 0 = no cap
+
+# Metrics (/metrics in the web process; the bot process serves METRICS_PORT, 0 = off)
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_PORT = config('METRICS_PORT', default=0, cast=int)
+METRICS_EVENT_LOOP_INTERVAL = config('METRICS_EVENT_LOOP_INTERVAL', default=1.0, cast=float)
+
+# Query profiler / N+1 detector (per bot update and per dashboard request, opt-in)
+QUERY_PROFILER_ENABLED = config('QUERY_PROFILER_ENABLED', default=False, cast=bool)
+QUERY_PROFILER_REPEAT_THRESHOLD = config('QUERY_PROFILER_REPEAT_THRESHOLD', default=5, cast=int)
+QUERY_PROFILER_BUDGET = config('QUERY_PROFILER_BUDGET', default=50, cast=int)  # 0 disables the budget check
+QUERY_PROFILER_LOG_INTERVAL = config('QUERY_PROFILER_LOG_INTERVAL', default=300, cast=int)
+
+# Broadcast campaigns (sent by the polling bot, the web process in webhook mode, or `manage.py run_broadcasts`)
+BROADCAST_WORKER_ENABLED = config('BROADCAST_WORKER_ENABLED', default=True, cast=bool)
+BROADCAST_RATE_PER_SECOND = config('BROADCAST_RATE_PER_SECOND', default=25.0, cast=float)  # Telegram allows ~30/s
+BROADCAST_CONCURRENCY = config('BROADCAST_CONCURRENCY', default=20, cast=int)
+BROADCAST_BATCH_SIZE = config('BROADCAST_BATCH_SIZE', default=200, cast=int)  # Recipients per checkpoint
+BROADCAST_LEASE_SECONDS = config('BROADCAST_LEASE_SECONDS', default=60, cast=int)
+BROADCAST_POLL_SECONDS = config('BROADCAST_POLL_SECONDS', default=5, cast=int)
+
+# Request expiry scheduler (runs inside the bot process)
+EXPIRY_SCHEDULER_ENABLED = config('EXPIRY_SCHEDULER_ENABLED', default=True, cast=bool)
+EXPIRY_REMINDER_MINUTES = config('EXPIRY_REMINDER_MINUTES', default=60, cast=int)  # 0 disables reminders
+EXPIRY_RESYNC_SECONDS = config('EXPIRY_RESYNC_SECONDS', default=300, cast=int)
+EXPIRY_BATCH_SIZE = config('EXPIRY_BATCH_SIZE', default=500, cast=int)
+
+# JSON feeds (bot/api/...) - cursor paging and streaming
+API_FEED_PAGE_SIZE = config('API_FEED_PAGE_SIZE', default=1000, cast=int)
+API_FEED_MAX_PAGE_SIZE = config('API_FEED_MAX_PAGE_SIZE', default=5000, cast=int)
+API_FEED_CHUNK_SIZE = config('API_FEED_CHUNK_SIZE', default=500, cast=int)
+
+# Changes feed (bot/api/changes/)
+CHANGE_FEED_SAFETY_LAG_SECONDS = config('CHANGE_FEED_SAFETY_LAG_SECONDS', default=2, cast=int)
+CHANGE_LOG_RETENTION_DAYS = config('CHANGE_LOG_RETENTION_DAYS', default=30, cast=int)
+
+# Hot/cold tiering: closed requests older than this move to ArchivedRequest (manage.py archive_requests)
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=180, cast=int)
+
+# Admin changelists on large tables show the planner's row estimate above this many rows (bot/admin_paging.py)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=10000, cast=int)
+
 # Feature flags
 FEATURE_DEPRECATE_OLD_FIELDS = config('FEATURE_DEPRECATE_OLD_FIELDS', default=True, cast=bool)
 FEATURE_UNIT_PRICING = config('FEATURE_UNIT_PRICING', default=True, cast=bool)
@@ -198,31 +297,44 @@ FEATURE_UNIT_PRICING = config('FEATURE_UNIT_PRICING', default=True, cast=bool)
 GOOGLE_SHEETS_API_KEY = config('GOOGLE_SHEETS_API_KEY', default='')
 GOOGLE_SHEETS_SPREADSHEET_ID = config('GOOGLE_SHEETS_SPREADSHEET_ID', default='')
 
-# Logging
+# Logging: records are queued and written by a listener thread (bot/log_pipeline.py)
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_FORMAT = config('LOG_FORMAT', default='json')  # json | text
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+# Per-logger budget for records below ERROR; 0 disables rate limiting
+LOG_RATE_LIMIT_PER_SECOND = config('LOG_RATE_LIMIT_PER_SECOND', default=50, cast=float)
+LOG_RATE_LIMIT_BURST = config('LOG_RATE_LIMIT_BURST', default=200, cast=int)
+# Messages longer than this are truncated, and only one in LOG_PAYLOAD_SAMPLE_EVERY is kept
+LOG_PAYLOAD_MAX_CHARS = config('LOG_PAYLOAD_MAX_CHARS', default=2000, cast=int)
+LOG_PAYLOAD_SAMPLE_EVERY = config('LOG_PAYLOAD_SAMPLE_EVERY', default=100, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
+        'queue': {
+            'level': LOG_LEVEL,
+            'class': 'bot.log_pipeline.QueueingHandler',
             'filename': BASE_DIR / 'logs' / 'django.log',
-        },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
+            'console': True,
+            'json_format': LOG_FORMAT == 'json',
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['file', 'console'],
-            'level': 'INFO',
-            'propagate': True,
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
         },
         'bot': {
-            'handlers': ['file', 'console'],
-            'level': 'INFO',
-            'propagate': True,
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'dashboard': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
         },
     },
 }
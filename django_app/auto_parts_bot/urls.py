@@ -7,6 +7,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse
 from django.shortcuts import redirect
+from bot.views import metrics_endpoint
 
 def health_check(request):
     """Health check endpoint for Docker"""
@@ -19,6 +20,7 @@ def root_redirect(request):
 urlpatterns = [
     path('', root_redirect, name='root'),
     path('health/', health_check, name='health_check'),
+    path('metrics', metrics_endpoint, name='metrics'),
     path('admin/', admin.site.urls),
     path('bot/', include('bot.urls')),
     path('dashboard/', include('dashboard.urls')),
@@ -0,0 +1,7 @@
+"""
+Benchmark harnesses for the bot.
+
+Run them through the management commands (e.g. ``python manage.py
+benchmark_webhook``) so Django is configured and an isolated test
+database is used.
+"""
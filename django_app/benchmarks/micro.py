@@ -0,0 +1,357 @@
+"""
+Micro-benchmarks for bot hot paths.
+
+Each benchmark is a setup function registered with ``@benchmark``. It builds
+its fixtures and returns the zero-argument callable to time. Timing uses
+stdlib ``timeit`` (autorange, then ``repeat`` rounds) and results are plain
+dicts so they can be saved as JSON and compared between runs.
+
+The benchmarks write to the database, so run them against a test database
+(the ``benchmark_micro`` command creates and destroys one).
+"""
+
+import asyncio
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import timeit
+from datetime import timedelta
+
+import django
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+# name -> {'group': str, 'setup': callable(context) -> callable}
+BENCHMARKS = {}
+
+USER_STATE_SIZES = (10_000, 100_000)
+ORDER_ID_DAILY_VOLUMES = (100, 5_000)
+
+# Part names as customers type them: diacritics, tatweel, Arabic-Indic digits
+ARABIC_PARTS = [
+    'مصد أمامي', 'مصد خلفي', 'مرآة جانبية يمين', 'مرآة جانبية يسار', 'فانوس خلفي',
+    'شمعة أمامية', 'كبوت', 'رديتر', 'كمبروسر مكيف', 'دينمو', 'سلف', 'قير أوتوماتيك',
+    'مكينة كاملة', 'باب أمامي يمين', 'باب خلفي يسار', 'زجاج أمامي', 'جنط ١٧ بوصة',
+    'طرمبة بنزين', 'كمبيوتر مكينة', 'شبك أمامي', 'رفرف يمين', 'صدام أمامـــي',
+    'مُكَيِّف خلفي', 'عكس يسار', 'ردياتير ماء', 'بلف ٤ قطع', 'حساس أكسجين', 'ثلاجة مكيف',
+]
+
+POPULAR_BRANDS = ['تويوتا', 'هوندا', 'نيسان', 'هيونداي', 'كيا', 'مازدا', 'فورد', 'شيفروليه']
+
+
+def benchmark(name, group):
+    """Register a benchmark setup function"""
+    def decorator(setup):
+        BENCHMARKS[name] = {'group': group, 'setup': setup}
+        return setup
+    return decorator
+
+
+def arabic_corpus(size, seed=7):
+    """Deterministic list of Arabic part descriptions"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        words = rng.sample(ARABIC_PARTS, rng.randint(1, 3))
+        corpus.append('، '.join(words))
+    return corpus
+
+
+class _FakeQuery:
+    """CallbackQuery stand-in that captures the rendered reply"""
+
+    def __init__(self, telegram_user):
+        self.from_user = telegram_user
+        self.text = None
+        self.reply_markup = None
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.text = text
+        self.reply_markup = reply_markup
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+class _TelegramUser:
+    def __init__(self, user):
+        self.id = user.telegram_id
+        self.username = user.username
+        self.first_name = user.first_name
+
+
+class BenchmarkContext:
+    """Shared fixtures, event loop and scratch space for one run"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.tmpdir = tempfile.mkdtemp(prefix='bot-micro-')
+        self._settings = override_settings(
+            BOT_USER_STATES_FILE=os.path.join(self.tmpdir, 'user_states.pickle'),
+            EXPIRY_SCHEDULER_ENABLED=False,
+        )
+        self._settings.enable()
+        self._fixtures = None
+
+    def close(self):
+        self._settings.disable()
+        self.loop.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def run_async(self, coroutine_function, *args):
+        return lambda: self.loop.run_until_complete(coroutine_function(*args))
+
+    @property
+    def fixtures(self):
+        if self._fixtures is None:
+            self._fixtures = self._seed()
+        return self._fixtures
+
+    def _seed(self):
+        from bot.models import (Brand, City, Junkyard, Model, Offer, Request,
+                                RequestItem, User)
+
+        city = City.objects.create(name='الرياض', code='RUH')
+        brands = [Brand.objects.create(name=name) for name in POPULAR_BRANDS]
+        brands += [Brand.objects.create(name=f'ماركة {i}') for i in range(32)]
+        brand = brands[0]
+        models = [Model.objects.create(brand=brand, name=f'موديل {i}') for i in range(15)]
+
+        customer = User.objects.create(username='micro_customer', first_name='عبدالله', telegram_id=5_000_001)
+        junkyard_user = User.objects.create(
+            username='micro_junkyard', first_name='تشليح النخبة', telegram_id=5_000_002, user_type='junkyard'
+        )
+        junkyard = Junkyard.objects.create(user=junkyard_user, phone='0500000000', city=city, location='الرياض')
+
+        request = Request.objects.create(user=customer, city=city, brand=brand, model=models[0], year=2018)
+        RequestItem.objects.bulk_create([
+            RequestItem(request=request, name=name,
+                        media_files=[{'type': 'photo', 'file_id': f'f{i}'}] if i % 3 == 0 else [])
+            for i, name in enumerate(arabic_corpus(10))
+        ])
+        offer = Offer.objects.create(request=request, junkyard=junkyard, price=850, delivery_time='٣ أيام')
+
+        return {
+            'city': city,
+            'brand': brand,
+            'customer': customer,
+            'request': Request.objects.select_related('user', 'city', 'brand', 'model').get(id=request.id),
+            'offer': Offer.objects.select_related('request', 'junkyard__user').get(id=offer.id),
+        }
+
+    def bot_with_draft(self):
+        """TelegramBot whose customer has an open draft"""
+        from bot.telegram_bot import TelegramBot
+
+        bot = TelegramBot()
+        customer = self.fixtures['customer']
+        bot.user_states[customer.telegram_id] = {
+            'drafts': {'bench': {'id': 'bench', 'name': 'طلب تجريبي', 'step': 'select_city', 'request_data': {}}},
+            'current_draft': 'bench',
+        }
+        return bot, customer, _FakeQuery(_TelegramUser(customer))
+
+
+# Arabic text paths
+@benchmark('text.parts_description', group='text')
+def bench_parts_description(context):
+    from bot.services import OrderWorkflowService
+
+    service = OrderWorkflowService()
+    return context.run_async(service._get_request_parts_description, context.fixtures['request'])
+
+
+@benchmark('text.arabic_corpus_join', group='text')
+def bench_arabic_corpus_join(context):
+    corpus = arabic_corpus(1_000)
+
+    def render():
+        return '\n'.join(f'{i}️⃣ 📦 {name.strip()}' for i, name in enumerate(corpus, 1))
+    return render
+
+
+# Keyboard construction
+@benchmark('keyboard.brands', group='keyboard')
+def bench_brand_keyboard(context):
+    bot, customer, query = context.bot_with_draft()
+    data = f"city_{context.fixtures['city'].id}"
+    return context.run_async(bot.handle_city_selection, query, customer, data)
+
+
+@benchmark('keyboard.models', group='keyboard')
+def bench_model_keyboard(context):
+    bot, customer, query = context.bot_with_draft()
+    data = f"brand_{context.fixtures['brand'].id}"
+    return context.run_async(bot.handle_brand_selection, query, customer, data)
+
+
+# OrderWorkflowService message rendering
+@benchmark('render.junkyard_notification', group='render')
+def bench_junkyard_notification(context):
+    from bot.services import OrderWorkflowService
+
+    service = OrderWorkflowService()
+    return context.run_async(service._prepare_junkyard_notification_message, context.fixtures['request'])
+
+
+@benchmark('render.customer_offer', group='render')
+def bench_customer_offer(context):
+    from bot.services import OrderWorkflowService
+
+    service = OrderWorkflowService()
+    return context.run_async(service._prepare_customer_offer_message, context.fixtures['offer'])
+
+
+# Order id generation with a busy day already in the table
+def _order_id_benchmark(daily_volume):
+    def setup(context):
+        from bot.models import City, Request
+
+        fixtures = context.fixtures
+        city = City.objects.create(name=f'مدينة {daily_volume}', code=f'V{daily_volume}')
+        date_str = timezone.now().strftime('%y%m%d')
+        expires_at = timezone.now() + timedelta(hours=6)
+        Request.objects.bulk_create([
+            Request(
+                order_id=f'{city.code}{date_str}{str(i + 1).zfill(3)}', user=fixtures['customer'], city=city,
+                brand=fixtures['brand'], model=fixtures['request'].model, year=2018, expires_at=expires_at,
+            )
+            for i in range(daily_volume)
+        ], batch_size=1_000)
+        request = Request(user=fixtures['customer'], city=city, brand=fixtures['brand'],
+                          model=fixtures['request'].model, year=2018)
+        return request.generate_order_id
+    return setup
+
+
+for _volume in ORDER_ID_DAILY_VOLUMES:
+    benchmark(f'order_id.generate[{_volume}/day]', group='order_id')(_order_id_benchmark(_volume))
+
+
+# Conversation state persistence
+def _user_states(count):
+    now = timezone.now().isoformat()
+    corpus = arabic_corpus(64)
+    return {
+        7_000_000 + i: {
+            'drafts': {
+                f'd{i}': {
+                    'id': f'd{i}', 'name': 'طلب 01/01 10:00', 'step': 'manage_items', 'created_at': now,
+                    'request_data': {
+                        'city_id': 1, 'brand_id': 1, 'model_id': 1, 'year': 2018,
+                        'items': [{'name': corpus[i % 64], 'quantity': 1, 'media_files': []}],
+                    },
+                },
+            },
+            'current_draft': f'd{i}',
+        }
+        for i in range(count)
+    }
+
+
+def _user_states_benchmark(count, operation):
+    def setup(context):
+        from bot.telegram_bot import TelegramBot
+
+        bot = TelegramBot()
+        bot.user_states = _user_states(count)
+        bot.save_user_states()
+        return getattr(bot, operation)
+    return setup
+
+
+for _count in USER_STATE_SIZES:
+    benchmark(f'user_states.save[{_count}]', group='user_states')(_user_states_benchmark(_count, 'save_user_states'))
+    benchmark(f'user_states.load[{_count}]', group='user_states')(_user_states_benchmark(_count, 'load_user_states'))
+
+
+# Runner
+def measure(function, repeat=5):
+    """Time one callable; returns per-call statistics in microseconds"""
+    timer = timeit.Timer(function)
+    loops, _ = timer.autorange()
+    samples = [total / loops * 1e6 for total in timer.repeat(repeat=repeat, number=loops)]
+    median = statistics.median(samples)
+    return {
+        'loops': loops,
+        'repeat': repeat,
+        'min_us': round(min(samples), 3),
+        'median_us': round(median, 3),
+        'mean_us': round(statistics.fmean(samples), 3),
+        'stdev_us': round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+        'ops_per_s': round(1e6 / median, 2) if median else None,
+    }
+
+
+def select(patterns=None):
+    """Benchmark names matching any of the substrings (all when empty)"""
+    return [name for name in BENCHMARKS if not patterns or any(p in name for p in patterns)]
+
+
+def run_benchmarks(names, repeat=5, progress=None):
+    """Run the named benchmarks; returns {'meta': ..., 'results': {name: stats}}"""
+    context = BenchmarkContext()
+    results = {}
+    try:
+        for name in names:
+            entry = BENCHMARKS[name]
+            function = entry['setup'](context)
+            results[name] = dict(group=entry['group'], **measure(function, repeat=repeat))
+            if progress:
+                progress(name, results[name])
+    finally:
+        context.close()
+    return {'meta': run_metadata(), 'results': results}
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    """
+    Compare two result sets by their fastest round.
+
+    Returns one row per benchmark with status 'regression', 'improvement',
+    'unchanged' or 'new'.
+    """
+    rows = []
+    baseline_results = baseline.get('results', {})
+    for name, stats in current['results'].items():
+        before = baseline_results.get(name)
+        if not before:
+            rows.append({'name': name, 'status': 'new', 'current_us': stats['min_us']})
+            continue
+        change = stats['min_us'] / before['min_us'] - 1 if before['min_us'] else 0.0
+        if change > threshold:
+            status = 'regression'
+        elif change < -threshold:
+            status = 'improvement'
+        else:
+            status = 'unchanged'
+        rows.append({
+            'name': name,
+            'status': status,
+            'baseline_us': before['min_us'],
+            'current_us': stats['min_us'],
+            'change': round(change, 4),
+        })
+    return rows
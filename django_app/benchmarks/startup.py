@@ -0,0 +1,65 @@
+"""
+Import-time benchmark for process startup.
+
+Every ``manage.py`` command, test run and web worker boots Django and (for
+the system checks and request handling) imports the URLconf and its views.
+``measure`` runs that in a fresh interpreter under ``python -X importtime``
+and parses the per-module report, so tests can hold startup to a budget and
+check that the Telegram machinery (python-telegram-bot, httpx, the bot
+itself) is only imported by the processes that use it.
+"""
+
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+
+# Modules a plain Django process (migrate, shell, web workers) must not import
+HEAVY_MODULES = ('telegram', 'httpx', 'bot.telegram_bot', 'bot.services')
+
+# Cumulative import time of the URLconf and its views, in milliseconds
+URLCONF_BUDGET_MS = 1500
+
+STARTUP_SCRIPT = (
+    "import django; django.setup(); "
+    "from django.conf import settings; import importlib; importlib.import_module(settings.ROOT_URLCONF)"
+)
+
+
+def parse_importtime(output):
+    """module name -> (self us, cumulative us) from ``-X importtime`` stderr"""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Header row
+        modules[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return modules
+
+
+def measure(script=STARTUP_SCRIPT):
+    """Run ``script`` in a fresh interpreter with -X importtime; returns parse_importtime's dict"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'auto_parts_bot.settings'))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"startup script failed: {result.stderr.strip().splitlines()[-1:]}")
+    return parse_importtime(result.stderr)
+
+
+def heavy_imports(modules):
+    """The HEAVY_MODULES (or their submodules) found in ``modules``"""
+    return sorted(
+        name for name in modules
+        if any(name == heavy or name.startswith(heavy + '.') for heavy in HEAVY_MODULES)
+    )
+
+
+def cumulative_ms(modules, name):
+    """Cumulative import time of ``name`` in milliseconds (0 if it was already imported)"""
+    return modules.get(name, (0, 0))[1] / 1000
@@ -0,0 +1,191 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+A threaded HTTP server that answers ``/bot<token>/<method>`` the way the
+real API does, with configurable latency and 429 injection. Every call is
+recorded so a load driver can read the keyboards the bot sent to each chat
+and count outbound API calls per method.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Methods whose result is a Message object
+MESSAGE_METHODS = {
+    'sendMessage', 'sendPhoto', 'sendVideo', 'sendDocument',
+    'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption',
+}
+
+
+class TelegramApiStub:
+    """In-process Bot API server with latency and rate limit injection"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0,
+                 rate_limit_ratio: float = 0.0, retry_after: int = 1, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_ids = {}
+        self._keyboards = defaultdict(list)  # chat_id -> [(seq, message_id, buttons)]
+        self._seq = 0
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self._server = None
+        self._thread = None
+
+    # Lifecycle
+    def start(self):
+        handler = type('StubHandler', (_StubRequestHandler,), {'stub': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='telegram-api-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        """Value for TELEGRAM_API_BASE_URL (the token is appended)"""
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/bot'
+
+    # Recorded state
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.rate_limited.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.calls), dict(self.rate_limited)
+
+    def keyboard_position(self, chat_id: int) -> int:
+        """Sequence number of the latest keyboard sent to a chat"""
+        with self._lock:
+            keyboards = self._keyboards.get(chat_id)
+            return keyboards[-1][0] if keyboards else 0
+
+    def find_button(self, chat_id: int, prefix: str, after: int = 0, exact: bool = False):
+        """Return (message_id, callback_data) of the newest matching button"""
+        with self._lock:
+            for seq, message_id, buttons in reversed(self._keyboards.get(chat_id, [])):
+                if seq <= after:
+                    break
+                for data in buttons:
+                    if data == prefix or (not exact and data.startswith(prefix)):
+                        return message_id, data
+        return None
+
+    # Request handling
+    def handle(self, method: str, params: dict):
+        """Return (status, payload) for one API call"""
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+        with self._lock:
+            self.calls[method] += 1
+            if method != 'getMe' and self.rate_limit_ratio and self._random.random() < self.rate_limit_ratio:
+                self.rate_limited[method] += 1
+                return 429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }
+            return 200, {'ok': True, 'result': self._result(method, params)}
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+        if method not in MESSAGE_METHODS and method != 'sendMediaGroup':
+            return True
+
+        chat_id = int(params.get('chat_id', 0))
+        if method == 'sendMediaGroup':
+            return [self._message(chat_id, self._next_message_id(chat_id)) for _ in params.get('media', [])]
+
+        if method.startswith('edit') and params.get('message_id'):
+            message_id = int(params['message_id'])
+        else:
+            message_id = self._next_message_id(chat_id)
+
+        buttons = [
+            button['callback_data']
+            for row in (params.get('reply_markup') or {}).get('inline_keyboard', [])
+            for button in row if 'callback_data' in button
+        ]
+        if buttons:
+            self._seq += 1
+            self._keyboards[chat_id].append((self._seq, message_id, buttons))
+        return self._message(chat_id, message_id, params.get('text', ''))
+
+    def _next_message_id(self, chat_id):
+        self._message_ids[chat_id] = self._message_ids.get(chat_id, 0) + 1
+        return self._message_ids[chat_id]
+
+    @staticmethod
+    def _message(chat_id, message_id, text=''):
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text,
+        }
+
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+    stub = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        method = self.path.rstrip('/').rsplit('/', 1)[-1]
+        status, payload = self.stub.handle(method, self._parse_params(body))
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST
+
+    def _parse_params(self, body: bytes) -> dict:
+        content_type = self.headers.get('Content-Type', '')
+        if 'application/json' in content_type:
+            return json.loads(body or b'{}')
+        if 'application/x-www-form-urlencoded' not in content_type:
+            return {}
+        params = {}
+        for key, values in parse_qs(body.decode('utf-8')).items():
+            value = values[0]
+            # python-telegram-bot JSON-encodes nested parameters
+            if value[:1] in ('{', '['):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params
+
+    def log_message(self, format, *args):
+        pass
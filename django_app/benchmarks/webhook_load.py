@@ -0,0 +1,385 @@
+"""
+End-to-end load driver for TelegramWebhookView.
+
+Simulated customers and junkyards post real Telegram updates to the webhook
+through the Django test client while the bot talks to a local
+TelegramApiStub. With background processing on, each call waits for the
+dispatcher to finish the chat's updates, so a step's latency is the full
+processing time and the immediate acknowledgement is reported separately. Each customer walks the full flow: /start, city, brand,
+model, year, items, confirm; a junkyard then sends an offer and the customer
+accepts it. Every webhook call is timed and DB queries and outbound API
+calls are counted per scenario.
+
+The driver writes to the database, so run it against a test database (the
+``benchmark_webhook`` command creates and destroys one).
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from bot import webhook_dispatcher
+
+from .telegram_stub import TelegramApiStub
+
+logger = logging.getLogger(__name__)
+
+# Preset scenarios; command line options override individual values
+SCENARIOS = {
+    'single': {'customers': 1, 'junkyards': 1},
+    'concurrent': {'customers': 20, 'junkyards': 5},
+    'slow_api': {'customers': 20, 'junkyards': 5, 'latency_ms': 100, 'jitter_ms': 30},
+    'rate_limited': {'customers': 20, 'junkyards': 5, 'rate_limit_ratio': 0.05},
+}
+
+SCENARIO_DEFAULTS = {
+    'customers': 1,
+    'junkyards': 1,
+    'items': 2,
+    'latency_ms': 0,
+    'jitter_ms': 0,
+    'rate_limit_ratio': 0.0,
+}
+
+BENCH_TOKEN = '123456:BENCHMARK'
+PROCESSING_TIMEOUT = 60
+
+
+class FlowError(Exception):
+    """A step of the simulated conversation did not get the expected reply"""
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class QueryCounter:
+    """Count SQL statements on every connection in every thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not getattr(self._local, 'paused', False):
+            with self._lock:
+                self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        connection_created.connect(self._on_connection_created)
+        self._on_each_thread(self._attach)
+
+    def uninstall(self):
+        connection_created.disconnect(self._on_connection_created)
+        self._on_each_thread(self._detach)
+
+    def _on_each_thread(self, action):
+        def apply():
+            for connection in connections.all():
+                action(connection)
+
+        apply()
+        # Handlers run their queries on asgiref's shared executor thread, whose
+        # connection may already be open (so connection_created won't fire)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(sync_to_async(apply)())
+        finally:
+            loop.close()
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        self._attach(connection)
+
+    def _attach(self, connection):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def _detach(self, connection):
+        if self in connection.execute_wrappers:
+            connection.execute_wrappers.remove(self)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+    def paused(self):
+        """Context manager excluding the driver's own lookups"""
+        counter = self
+
+        class _Paused:
+            def __enter__(self):
+                counter._local.paused = True
+
+            def __exit__(self, *exc_info):
+                counter._local.paused = False
+
+        return _Paused()
+
+
+class Conversation:
+    """One simulated Telegram user talking to the webhook"""
+
+    def __init__(self, driver, telegram_id, first_name):
+        self.driver = driver
+        self.telegram_id = telegram_id
+        self.first_name = first_name
+        self.client = Client()
+        self.mark = driver.stub.keyboard_position(telegram_id)
+
+    def _user(self):
+        return {'id': self.telegram_id, 'is_bot': False, 'first_name': self.first_name,
+                'username': f'bench{self.telegram_id}'}
+
+    def _chat(self):
+        return {'id': self.telegram_id, 'type': 'private', 'first_name': self.first_name}
+
+    def send_text(self, text):
+        message = {
+            'message_id': next(self.driver.message_ids),
+            'date': int(time.time()),
+            'chat': self._chat(),
+            'from': self._user(),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self._post(text.split()[0] if text.startswith('/') else 'text', {'message': message})
+
+    def press(self, prefix, exact=False):
+        """Press the newest button (since our last action) whose callback data matches"""
+        step = prefix.rstrip('_0123456789') or prefix
+        found = self.driver.stub.find_button(self.telegram_id, prefix, after=self.mark, exact=exact)
+        if not found:
+            raise FlowError(f"no '{step}' button in reply")
+        message_id, data = found
+        callback_query = {
+            'id': str(next(self.driver.message_ids)),
+            'from': self._user(),
+            'message': {'message_id': message_id, 'date': int(time.time()), 'chat': self._chat()},
+            'chat_instance': 'benchmark',
+            'data': data,
+        }
+        self._post(step, {'callback_query': callback_query})
+
+    def _post(self, step, payload):
+        payload['update_id'] = next(self.driver.update_ids)
+        self.mark = self.driver.stub.keyboard_position(self.telegram_id)
+        started = time.perf_counter()
+        response = self.client.post(self.driver.webhook_url, payload, content_type='application/json')
+        acked = time.perf_counter() - started
+        dispatcher = webhook_dispatcher.active_dispatcher()
+        if response.status_code == 200 and dispatcher:
+            if not dispatcher.wait_for_chat(self.telegram_id, PROCESSING_TIMEOUT):
+                raise FlowError(f"update not processed within {PROCESSING_TIMEOUT}s at '{step}'")
+        self.driver.record(step, time.perf_counter() - started, response.status_code == 200, acked)
+        if response.status_code != 200:
+            raise FlowError(f"webhook returned {response.status_code} at '{step}'")
+
+
+class WebhookLoadDriver:
+    """Run load scenarios against the webhook with a stubbed Bot API"""
+
+    def __init__(self):
+        self.stub = None
+        self.queries = QueryCounter()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.webhook_url = reverse('bot:telegram_webhook')
+        self._telegram_ids = itertools.count(900_000_000)
+        self._lock = threading.Lock()
+        self._samples = []
+
+    def record(self, step, seconds, ok, ack_seconds):
+        with self._lock:
+            self._samples.append((step, seconds, ok, ack_seconds))
+
+    # Fixtures
+    def _seed(self, name, customers, junkyards):
+        from bot.models import Brand, City, Junkyard, Model, User
+
+        city = City.objects.create(name=f'Bench {name} {time.time_ns()}', code=f'B{time.time_ns() % 10**8}')
+        brand, _ = Brand.objects.get_or_create(name='تويوتا')
+        model, _ = Model.objects.get_or_create(brand=brand, name='كامري')
+
+        junkyard_ids = [next(self._telegram_ids) for _ in range(junkyards)]
+        users = User.objects.bulk_create([
+            User(username=f'bench_junkyard_{tid}', first_name=f'Junkyard {tid}', telegram_id=tid,
+                 user_type='junkyard')
+            for tid in junkyard_ids
+        ])
+        Junkyard.objects.bulk_create([
+            Junkyard(user=user, phone='0500000000', city=city, location='Benchmark', is_active=True)
+            for user in users
+        ])
+        customer_ids = [next(self._telegram_ids) for _ in range(customers)]
+        return {'city': city.id, 'brand': brand.id, 'model': model.id,
+                'customers': customer_ids, 'junkyards': junkyard_ids}
+
+    def _latest_request_id(self, telegram_id):
+        from bot.models import Request
+
+        with self.queries.paused():
+            return (
+                Request.objects.filter(user__telegram_id=telegram_id)
+                .order_by('-id').values_list('id', flat=True).first()
+            )
+
+    # Flow
+    def _deal(self, fixtures, index, items, junkyard_locks):
+        customer = Conversation(self, fixtures['customers'][index], f'Customer {index}')
+        junkyard_index = index % len(fixtures['junkyards'])
+        try:
+            customer.send_text('/start')
+            customer.press('start_bot')
+            customer.press('start_ordering')
+            customer.press('new_request')
+            customer.press(f"city_{fixtures['city']}", exact=True)
+            customer.press(f"brand_{fixtures['brand']}", exact=True)
+            customer.press(f"model_{fixtures['model']}", exact=True)
+            customer.press('year_range_')
+            customer.press('year_')
+            for item in range(items):
+                if item:
+                    customer.press('add_item_')
+                customer.send_text(f'قطعة رقم {item + 1}')
+                customer.press('skip_item_photo_')
+
+            # The junkyard's conversation state holds one offer at a time
+            with junkyard_locks[junkyard_index]:
+                junkyard = Conversation(self, fixtures['junkyards'][junkyard_index], f'Junkyard {junkyard_index}')
+                customer.press('confirm_request_')
+                request_id = self._latest_request_id(customer.telegram_id)
+                junkyard.press(f'offer_add_{request_id}', exact=True)
+                junkyard.send_text('150')
+                junkyard.send_text('3 أيام')
+
+            customer.press('offer_accept_')
+            return None
+        except FlowError as e:
+            return str(e)
+        finally:
+            connections.close_all()
+
+    # Scenarios
+    def run_scenario(self, name, **options):
+        config = dict(SCENARIO_DEFAULTS, **options)
+        self.stub.latency_ms = config['latency_ms']
+        self.stub.jitter_ms = config['jitter_ms']
+        self.stub.rate_limit_ratio = 0.0
+        fixtures = self._seed(name, config['customers'], config['junkyards'])
+        junkyard_locks = [threading.Lock() for _ in fixtures['junkyards']]
+
+        with self._lock:
+            self._samples = []
+        self.stub.reset_stats()
+        self.stub.rate_limit_ratio = config['rate_limit_ratio']
+        self.queries.reset()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=config['customers']) as pool:
+            outcomes = list(pool.map(
+                lambda index: self._deal(fixtures, index, config['items'], junkyard_locks),
+                range(config['customers']),
+            ))
+        elapsed = time.perf_counter() - started
+
+        self.stub.rate_limit_ratio = 0.0
+        return self._summarize(name, config, elapsed, outcomes)
+
+    def _summarize(self, name, config, elapsed, outcomes):
+        with self._lock:
+            samples = list(self._samples)
+        api_calls, rate_limited = self.stub.snapshot()
+        latencies = sorted(seconds * 1000 for _, seconds, _, _ in samples)
+        acks = sorted(ack * 1000 for _, _, _, ack in samples)
+        updates = len(samples)
+        failures = [outcome for outcome in outcomes if outcome]
+
+        by_step = {}
+        for step in dict.fromkeys(step for step, _, _, _ in samples):
+            step_latencies = sorted(seconds * 1000 for s, seconds, _, _ in samples if s == step)
+            by_step[step] = {
+                'count': len(step_latencies),
+                'p50_ms': round(percentile(step_latencies, 50), 2),
+                'p95_ms': round(percentile(step_latencies, 95), 2),
+            }
+
+        return {
+            'scenario': name,
+            'config': config,
+            'deals_completed': len(outcomes) - len(failures),
+            'deals_failed': len(failures),
+            'failures': dict(Counter(failures).most_common(5)),
+            'updates': updates,
+            'webhook_errors': sum(1 for _, _, ok, _ in samples if not ok),
+            'elapsed_s': round(elapsed, 3),
+            'throughput_updates_per_s': round(updates / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2) if latencies else 0.0,
+            },
+            'ack_ms': {
+                'p50': round(percentile(acks, 50), 2),
+                'p95': round(percentile(acks, 95), 2),
+                'p99': round(percentile(acks, 99), 2),
+            },
+            'db_queries': self.queries.count,
+            'db_queries_per_update': round(self.queries.count / updates, 2) if updates else 0.0,
+            'api_calls': sum(api_calls.values()),
+            'api_calls_per_update': round(sum(api_calls.values()) / updates, 2) if updates else 0.0,
+            'api_calls_by_method': dict(sorted(api_calls.items())),
+            'rate_limited': sum(rate_limited.values()),
+            'steps': by_step,
+        }
+
+    def run(self, scenarios, seed=None, inline=False):
+        """Run (name, options) scenarios in order; returns one result dict per scenario
+
+        ``inline`` processes each update inside the webhook request instead of
+        handing it to the background dispatcher.
+        """
+        results = []
+        states_dir = tempfile.mkdtemp(prefix='bot-bench-')
+        states_file = os.path.join(states_dir, 'user_states.pickle')
+
+        with TelegramApiStub(seed=seed) as stub:
+            self.stub = stub
+            self.queries.install()
+            try:
+                with override_settings(
+                    TELEGRAM_BOT_TOKEN=BENCH_TOKEN,
+                    TELEGRAM_API_BASE_URL=stub.base_url,
+                    BOT_USER_STATES_FILE=states_file,
+                    EXPIRY_SCHEDULER_ENABLED=False,
+                    WEBHOOK_ASYNC_PROCESSING=not inline,
+                ):
+                    for name, options in scenarios:
+                        logger.info(f"🏁 Running webhook scenario '{name}'")
+                        results.append(self.run_scenario(name, **options))
+            finally:
+                webhook_dispatcher.shutdown_dispatcher()
+                self.queries.uninstall()
+                shutil.rmtree(states_dir, ignore_errors=True)
+        return results
@@ -1,13 +1,22 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Count
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
+from .admin_paging import EstimatedCountPaginator
 from .models import (
     User, City, Brand, Model, Junkyard, Request, 
-    Offer, Conversation, JunkyardRating, SystemSetting, TelegramMessage
+    Offer, Conversation, JunkyardRating, SystemSetting, TelegramMessage, MediaAsset,
+    ArchivedRequest, JunkyardSpecialization, JunkyardStats
 )
 
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist for tables that grow without bound: estimated totals, no second full count"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ('username', 'first_name', 'last_name', 'user_type', 'telegram_id', 'is_active_telegram', 'date_joined')
@@ -36,9 +45,13 @@ class BrandAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     list_editable = ('is_active',)
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(models_total=Count('models'))
+    
     def models_count(self, obj):
-        return obj.models.count()
+        return obj.models_total
     models_count.short_description = _('عدد أسماء السيارات')
+    models_count.admin_order_field = 'models_total'
 
 
 @admin.register(Model)
@@ -47,6 +60,7 @@ class ModelAdmin(admin.ModelAdmin):
     list_filter = ('brand', 'is_active')
     search_fields = ('name', 'brand__name')
     list_editable = ('is_active',)
+    list_select_related = ('brand',)
 
 
 @admin.register(Junkyard)
@@ -56,6 +70,8 @@ class JunkyardAdmin(admin.ModelAdmin):
     search_fields = ('user__first_name', 'user__last_name', 'phone')
     readonly_fields = ('total_ratings', 'average_rating', 'created_at')
     list_editable = ('is_active', 'is_verified')
+    list_select_related = ('user', 'city')
+    filter_horizontal = ('brands',)
     
     def rating_display(self, obj):
         if obj.total_ratings > 0:
@@ -66,22 +82,42 @@ class JunkyardAdmin(admin.ModelAdmin):
 
 
 @admin.register(Request)
-class RequestAdmin(admin.ModelAdmin):
+class RequestAdmin(LargeTableAdmin):
     list_display = ('order_id', 'user', 'city', 'brand', 'model', 'year', 'status', 'created_at', 'expires_at')
     list_filter = ('status', 'city', 'brand', 'created_at')
     search_fields = ('order_id', 'user__first_name', 'user__last_name', 'parts')
     readonly_fields = ('order_id', 'created_at', 'expires_at')
     date_hierarchy = 'created_at'
     list_editable = ('status',)
+    list_select_related = ('user', 'city', 'brand', 'model__brand')
+    raw_id_fields = ('user',)
 
 
 @admin.register(Offer)
-class OfferAdmin(admin.ModelAdmin):
+class OfferAdmin(LargeTableAdmin):
     list_display = ('request', 'junkyard', 'price', 'status', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('request__order_id', 'junkyard__user__first_name')
     date_hierarchy = 'created_at'
     list_editable = ('status',)
+    list_select_related = ('request__user', 'junkyard__user', 'junkyard__city')
+    raw_id_fields = ('request', 'junkyard')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('request__items')
+
+
+@admin.register(MediaAsset)
+class MediaAssetAdmin(LargeTableAdmin):
+    list_display = ('request', 'request_item', 'media_type', 'file_unique_id', 'file_size', 'thumbnail_status', 'created_at')
+    list_filter = ('media_type', 'thumbnail_status')
+    search_fields = ('request__order_id', 'file_unique_id')
+    readonly_fields = ('created_at',)
+    raw_id_fields = ('request', 'request_item')
+    list_select_related = ('request__user', 'request_item__request')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('request__items')
 
 
 @admin.register(Conversation)
@@ -90,6 +126,11 @@ class ConversationAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'started_at')
     search_fields = ('client__first_name', 'junkyard__first_name', 'request__order_id')
     readonly_fields = ('started_at',)
+    list_select_related = ('client', 'junkyard', 'request__user')
+    raw_id_fields = ('client', 'junkyard', 'request')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('request__items')
 
 
 @admin.register(JunkyardRating)
@@ -98,6 +139,11 @@ class JunkyardRatingAdmin(admin.ModelAdmin):
     list_filter = ('rating', 'created_at')
     search_fields = ('junkyard__user__first_name', 'client__first_name')
     readonly_fields = ('created_at',)
+    list_select_related = ('junkyard__user', 'junkyard__city', 'client', 'request__user')
+    raw_id_fields = ('junkyard', 'client', 'request')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('request__items')
 
 
 @admin.register(SystemSetting)
@@ -108,12 +154,45 @@ class SystemSettingAdmin(admin.ModelAdmin):
 
 
 @admin.register(TelegramMessage)
-class TelegramMessageAdmin(admin.ModelAdmin):
+class TelegramMessageAdmin(LargeTableAdmin):
     list_display = ('user', 'message_type', 'telegram_message_id', 'created_at')
     list_filter = ('message_type', 'created_at')
     search_fields = ('user__first_name', 'message_type')
     readonly_fields = ('created_at',)
     date_hierarchy = 'created_at'
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(ArchivedRequest)
+class ArchivedRequestAdmin(LargeTableAdmin):
+    list_display = ('order_id', 'user', 'city', 'status', 'created_at', 'archived_at')
+    list_filter = ('status', 'city')
+    search_fields = ('order_id',)
+    readonly_fields = ('order_id', 'original_id', 'user', 'city', 'status', 'created_at', 'archived_at', 'data')
+    date_hierarchy = 'created_at'
+    list_select_related = ('user', 'city')
+
+
+@admin.register(JunkyardSpecialization)
+class JunkyardSpecializationAdmin(admin.ModelAdmin):
+    list_display = ('junkyard', 'city', 'brand', 'declared', 'offers_count', 'accepted_count', 'score', 'updated_at')
+    list_filter = ('city', 'brand', 'declared')
+    search_fields = ('junkyard__user__first_name',)
+    list_select_related = ('junkyard__user', 'junkyard__city', 'city', 'brand')
+    readonly_fields = ('junkyard', 'city', 'brand', 'declared', 'offers_count', 'accepted_count', 'score', 'updated_at')
+
+
+@admin.register(JunkyardStats)
+class JunkyardStatsAdmin(admin.ModelAdmin):
+    list_display = ('junkyard', 'requests_received', 'offers_made', 'offers_accepted', 'median_response_seconds', 'last_offer_at')
+    search_fields = ('junkyard__user__first_name',)
+    list_select_related = ('junkyard__user', 'junkyard__city')
+    exclude = ('response_estimator',)
+    readonly_fields = (
+        'junkyard', 'requests_received', 'offers_made', 'offers_accepted', 'last_notified_at', 'last_offer_at',
+        'median_response_seconds', 'updated_at',
+    )
 
 
 # Customize admin site
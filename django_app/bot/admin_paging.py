@@ -0,0 +1,61 @@
+"""
+Estimated row counts for admin changelists on large tables.
+
+An unfiltered changelist pays for ``SELECT COUNT(*)`` over the whole table on
+every page view, which on Request, Offer or TelegramMessage costs more than
+the page itself. EstimatedCountPaginator asks the database's planner
+statistics instead:
+
+- PostgreSQL: ``pg_class.reltuples`` (kept current by autovacuum/ANALYZE)
+- SQLite: the row count in ``sqlite_stat1`` (written by ``ANALYZE``)
+
+The estimate is only used when the changelist is unfiltered and the estimate
+is at least ADMIN_ESTIMATED_COUNT_THRESHOLD rows; below that, with filters or
+a search, or when no statistics exist, the exact count is cheap enough (or
+necessary) and is used as before. Pair it with ``show_full_result_count =
+False`` so filtered pages don't count the whole table a second time.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+def estimated_row_count(model, using='default'):
+    """The planner's row count for ``model``'s table, or None if there is none"""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None  # No statistics table yet (SQLite before the first ANALYZE)
+    if not row or row[0] is None:
+        return None
+    estimate = int(float(str(row[0]).split()[0]))
+    return estimate if estimate >= 0 else None  # reltuples is -1 before the first ANALYZE
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses estimated_row_count for unfiltered querysets on large tables"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000):
+                return estimate
+        return super().count
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class BotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bot'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import metrics, query_profiler
+        
+        if metrics.enabled():
+            metrics.install_db_instrumentation()
+        if query_profiler.enabled():
+            query_profiler.install()
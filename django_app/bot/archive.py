@@ -0,0 +1,123 @@
+"""
+Hot/cold tiering for closed requests.
+
+Every query on Request, RequestItem, Offer and OfferItem otherwise carries
+years of finished orders. ``manage.py archive_requests`` moves closed
+requests (accepted, expired or cancelled) older than ARCHIVE_AFTER_DAYS
+into ArchivedRequest: one row per order holding a JSON snapshot of the
+request with its items, offers (and their item prices), media and
+conversations, after which the hot rows are deleted. Each batch is copied
+and deleted in one transaction, so an order is always in exactly one tier.
+
+Ratings are snapshotted too but stay in JunkyardRating with their request
+set to NULL: they are what Junkyard.update_rating averages, and archiving
+an order must not change a junkyard's reputation.
+
+``find_order`` looks an order up in the hot table first, then the archive.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import ArchivedRequest, JunkyardRating, Offer, Request
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ('accepted', 'expired', 'cancelled')
+
+
+def _row(obj, **extra):
+    """Concrete field values of a model instance (foreign keys as ids)"""
+    data = {field.attname: getattr(obj, field.attname) for field in obj._meta.concrete_fields}
+    data.update(extra)
+    return data
+
+
+def snapshot(request):
+    """JSON-ready copy of a request and everything hanging off it (expects archivable_requests' prefetches)"""
+    return _row(
+        request,
+        city_name=request.city.name,
+        brand_name=request.brand.name,
+        model_name=request.model.name,
+        items=[_row(item) for item in request.items.all()],
+        offers=[
+            _row(
+                offer,
+                junkyard_name=offer.junkyard.user.first_name,
+                items=[_row(offer_item) for offer_item in offer.items.all()],
+            )
+            for offer in request.offers.all()
+        ],
+        media_assets=[_row(asset) for asset in request.media_assets.all()],
+        conversations=[_row(conversation) for conversation in request.conversations.all()],
+        ratings=[_row(rating) for rating in request.ratings.all()],
+    )
+
+
+def archivable_requests(older_than_days=None):
+    """Closed requests created before the cutoff, oldest first"""
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 180)
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return (
+        Request.objects.filter(status__in=CLOSED_STATUSES, created_at__lt=cutoff)
+        .select_related('city', 'brand', 'model')
+        .prefetch_related(
+            'items', 'media_assets', 'conversations', 'ratings',
+            Prefetch('offers', queryset=Offer.objects.select_related('junkyard__user').prefetch_related('items')),
+        )
+        .order_by('id')
+    )
+
+
+def archive_requests(requests):
+    """Copy ``requests`` into the archive and delete them from the hot tables; returns the count"""
+    requests = list(requests)
+    if not requests:
+        return 0
+
+    archived = [
+        ArchivedRequest(
+            order_id=request.order_id, original_id=request.id, user_id=request.user_id,
+            city_id=request.city_id, status=request.status, created_at=request.created_at,
+            data=snapshot(request),
+        )
+        for request in requests
+    ]
+    request_ids = [request.id for request in requests]
+    with transaction.atomic():
+        ArchivedRequest.objects.bulk_create(archived)
+        JunkyardRating.objects.filter(request_id__in=request_ids).update(request=None)
+        # Cascades to items, offers, offer items, media assets and conversations
+        Request.objects.filter(id__in=request_ids).delete()
+    return len(requests)
+
+
+def run_archive(older_than_days=None, batch_size=500, limit=None):
+    """Archive in batches until nothing (or ``limit`` requests) is left; returns the count"""
+    total = 0
+    while limit is None or total < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        archived = archive_requests(archivable_requests(older_than_days)[:size])
+        if not archived:
+            break
+        total += archived
+        logger.info(f"🗄️ Archived {total} requests so far")
+    return total
+
+
+def find_order(order_id):
+    """(tier, object) for an order id: ('hot', Request), ('archived', ArchivedRequest) or (None, None)"""
+    request = Request.objects.filter(order_id=order_id).first()
+    if request:
+        return 'hot', request
+    archived = ArchivedRequest.objects.filter(order_id=order_id).first()
+    if archived:
+        return 'archived', archived
+    return None, None
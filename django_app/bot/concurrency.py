@@ -0,0 +1,59 @@
+"""
+Concurrent update processing for polling mode.
+
+PTB processes polled updates one at a time by default, so a slow handler
+(the fan-out in confirm_request) stalls every other user. With
+BOT_CONCURRENT_UPDATES > 1 the application processes that many updates at
+once through PerUserUpdateProcessor, which still serializes the updates of
+any single user. A user's handlers therefore never race each other on their
+``user_states`` entry, and their taps are handled in the order they arrived
+(asyncio locks are FIFO).
+"""
+
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def update_user_id(update):
+    user = getattr(update, 'effective_user', None)
+    return user.id if user else None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently across users, sequentially per user"""
+
+    __slots__ = ('_locks',)
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # user id -> [lock, holders + waiters]
+
+    async def do_process_update(self, update, coroutine):
+        user_id = update_user_id(update)
+        if user_id is None:
+            await coroutine
+            return
+
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]
+
+    @property
+    def active_users(self):
+        return len(self._locks)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._locks.clear()
@@ -0,0 +1,307 @@
+"""
+Bounded in-memory conversation state for the bot (TelegramBot.user_states).
+
+Every user who ever opened a draft used to keep a dict of dicts in RAM and in
+the state pickle forever. Now:
+
+* ConversationState and Draft are ``__slots__`` records for the keys the
+  handlers use (anything else goes to a small overflow dict). They keep
+  dict-style access, so handler code such as ``state["drafts"][draft_id]``
+  is unchanged.
+* StateStore holds at most BOT_STATE_MAX_USERS states in LRU order. States
+  idle for BOT_STATE_IDLE_SECONDS, and the least recently used ones beyond
+  the cap, are *spilled*: pickled to one small file per user under
+  ``<states file>.spill/`` and dropped from memory. The next access loads a
+  spilled state back, so a user returning to a draft finds it intact.
+* ``manage.py bot_state_report`` reports what the state file and the spill
+  directory hold, and ``--purge`` deletes abandoned spilled drafts.
+
+The hot set, and therefore the state pickle written after every update, stays
+bounded however many users the bot has seen.
+"""
+
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SPILLS = metrics.REGISTRY.counter(
+    'bot_user_states_spilled_total', 'Conversation states moved from memory to disk', ['reason']
+)
+RESTORES = metrics.REGISTRY.counter(
+    'bot_user_states_restored_total', 'Spilled conversation states loaded back into memory'
+)
+
+_UNSET = object()
+
+
+def states_file_path():
+    """The conversation state file; BOT_USER_STATES_FILE or <tempdir>/bot_user_states.pickle"""
+    return (
+        getattr(settings, 'BOT_USER_STATES_FILE', '')
+        or os.path.join(tempfile.gettempdir(), "bot_user_states.pickle")
+    )
+
+
+class _Record(MutableMapping):
+    """Slotted record with dict-style access; unknown keys go to an overflow dict"""
+
+    __slots__ = ('_extra',)
+    FIELDS = frozenset()
+
+    def __init__(self, data=(), **kwargs):
+        self._extra = None
+        for field in self.FIELDS:
+            setattr(self, field, _UNSET)
+        self.update(data, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not _UNSET:
+                return value
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.FIELDS and getattr(self, key) is not _UNSET:
+            setattr(self, key, _UNSET)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field) is not _UNSET:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    # Pickled as a plain dict: the sentinel must not leak into files
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+
+class Draft(_Record):
+    """A customer's request draft"""
+
+    __slots__ = ('id', 'name', 'step', 'request_data', 'created_at', 'current_item_index', 'temp_item')
+    FIELDS = frozenset(__slots__)
+
+
+class DraftMap(dict):
+    """draft id -> Draft; plain dicts stored here become Drafts"""
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value if isinstance(value, Draft) else Draft(value))
+
+
+class ConversationState(_Record):
+    """One user's conversation step, drafts and in-progress offer or registration"""
+
+    __slots__ = ('step', 'drafts', 'current_draft', 'request_id', 'offer_data', 'junkyard_data', 'touched_at')
+    FIELDS = frozenset(__slots__) - {'touched_at'}
+
+    def __init__(self, data=(), **kwargs):
+        self.touched_at = time.time()
+        super().__init__(data, **kwargs)
+
+    def __setitem__(self, key, value):
+        if key == 'drafts' and not isinstance(value, DraftMap):
+            drafts = DraftMap()
+            for draft_id, draft in value.items():
+                drafts[draft_id] = draft
+            value = drafts
+        super().__setitem__(key, value)
+
+    def __getstate__(self):
+        return {'data': dict(self), 'touched_at': self.touched_at}
+
+    def __setstate__(self, state):
+        self.__init__(state['data'])
+        self.touched_at = state['touched_at']
+
+
+class StateStore(MutableMapping):
+    """telegram_id -> ConversationState, bounded in memory and spilling to disk
+
+    ``len()`` and iteration cover the in-memory states only; lookups also
+    find spilled ones.
+    """
+
+    def __init__(self, spill_dir=None, max_users=None, idle_seconds=None):
+        self.spill_dir = spill_dir
+        self.max_users = max_users or getattr(settings, 'BOT_STATE_MAX_USERS', 5000)
+        self.idle_seconds = idle_seconds if idle_seconds is not None else getattr(settings, 'BOT_STATE_IDLE_SECONDS', 3600)
+        self._states = OrderedDict()  # Least recently used first
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.pickle")
+
+    def _spill(self, key, state, reason):
+        SPILLS.inc(reason=reason)
+        if not self.spill_dir:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = self._spill_path(key)
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            logger.error("Error spilling state for %s: %s", key, e)
+
+    def _restore(self, key):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("Error restoring state for %s: %s", key, e)
+            return None
+        RESTORES.inc()
+        return state
+
+    def _discard_spilled(self, key):
+        if self.spill_dir:
+            try:
+                os.remove(self._spill_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _evict_overflow(self):
+        while len(self._states) > self.max_users:
+            key, state = self._states.popitem(last=False)
+            self._spill(key, state, 'overflow')
+
+    def __getitem__(self, key):
+        state = self._states.get(key)
+        if state is None:
+            state = self._restore(key)
+            if state is None:
+                raise KeyError(key)
+            self._states[key] = state
+            self._evict_overflow()
+        state.touched_at = time.time()
+        self._states.move_to_end(key)
+        return state
+
+    def __setitem__(self, key, value):
+        state = value if isinstance(value, ConversationState) else ConversationState(value)
+        state.touched_at = time.time()
+        if key not in self._states:
+            self._discard_spilled(key)
+        self._states[key] = state
+        self._states.move_to_end(key)
+        self._evict_overflow()
+
+    def __delitem__(self, key):
+        found = self._states.pop(key, None) is not None
+        if self.spill_dir and os.path.exists(self._spill_path(key)):
+            self._discard_spilled(key)
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._states or bool(self.spill_dir and os.path.exists(self._spill_path(key)))
+
+    def __iter__(self):
+        return iter(self._states)
+
+    def __len__(self):
+        return len(self._states)
+
+    def evict_idle(self, now=None):
+        """Spill states idle for longer than ``idle_seconds``; returns how many"""
+        if self.idle_seconds <= 0:
+            return 0
+        cutoff = (now or time.time()) - self.idle_seconds
+        evicted = 0
+        while self._states:
+            key, state = next(iter(self._states.items()))
+            if state.touched_at >= cutoff:
+                break
+            del self._states[key]
+            self._spill(key, state, 'idle')
+            evicted += 1
+        return evicted
+
+    def snapshot(self):
+        """The in-memory states, for the state file"""
+        return dict(self._states)
+
+    def load(self, states):
+        """Replace the in-memory states (old state files hold plain dicts)"""
+        loaded = [
+            (key, state if isinstance(state, ConversationState) else ConversationState(state))
+            for key, state in states.items()
+        ]
+        loaded.sort(key=lambda item: item[1].touched_at)
+        self._states = OrderedDict(loaded)
+        self._evict_overflow()
+        self.evict_idle()
+
+
+def spilled_files(spill_dir):
+    """(path, size, mtime) for every spilled state in ``spill_dir``"""
+    if not spill_dir or not os.path.isdir(spill_dir):
+        return []
+    files = []
+    with os.scandir(spill_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.pickle'):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+    return files
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by ``obj`` and everything it references"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or obj is _UNSET:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, _Record):
+        size += sum(deep_size(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+        size += deep_size(obj._extra, seen)
+    elif isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
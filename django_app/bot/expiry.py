@@ -0,0 +1,205 @@
+"""
+In-process request expiry engine for the bot.
+
+Open requests are kept in two min-heaps keyed by time: one for the
+"expiring soon" reminder and one for the expiry itself. The heaps are
+rebuilt from the database at startup (and periodically, to pick up
+requests created by other processes). Due requests are flipped to
+'expired' with a single UPDATE per batch, and notifications are sent in
+background tasks so the timer loop never waits on Telegram.
+"""
+
+import asyncio
+import heapq
+import logging
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from .models import Request
+from .offer_decisions import _supports_update_returning
+
+logger = logging.getLogger(__name__)
+
+
+def _claim(queryset, **values) -> List[int]:
+    """Update the rows ``queryset`` matches; returns the ids this statement changed
+
+    The filter is evaluated by the UPDATE itself, so a row another scheduler
+    (or a status change) got to first is neither updated nor returned.
+    """
+    if _supports_update_returning():
+        query = queryset.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        sql, params = query.get_compiler(queryset.db).as_sql()
+        pk = connection.ops.quote_name(queryset.model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} RETURNING {pk}", params)
+            return [row[0] for row in cursor.fetchall()]
+
+    # No UPDATE ... RETURNING: lock the rows, then update exactly those
+    with transaction.atomic():
+        claimed_ids = list(queryset.select_for_update().values_list('id', flat=True))
+        if claimed_ids:
+            queryset.model.objects.filter(id__in=claimed_ids).update(**values)
+    return claimed_ids
+
+
+class RequestExpiryScheduler:
+    """Timer heap that expires requests exactly when due"""
+
+    def __init__(self, telegram_bot=None):
+        self.telegram_bot = telegram_bot
+        self._expiry_heap = []    # (expires_at timestamp, request_id)
+        self._reminder_heap = []  # (remind_at timestamp, request_id)
+        self._wakeup = None
+        self._tasks = set()
+        self.batch_size = getattr(settings, 'EXPIRY_BATCH_SIZE', 500)
+        self.reminder_lead = timedelta(minutes=getattr(settings, 'EXPIRY_REMINDER_MINUTES', 60))
+        self.resync_interval = getattr(settings, 'EXPIRY_RESYNC_SECONDS', 300)
+
+    # Scheduling
+    def schedule(self, request_id: int, expires_at, reminder_sent: bool = False):
+        """Add a request to the timer heaps (safe to call more than once)"""
+        expires_ts = expires_at.timestamp()
+        heapq.heappush(self._expiry_heap, (expires_ts, request_id))
+        if self.reminder_lead and not reminder_sent:
+            heapq.heappush(self._reminder_heap, (expires_ts - self.reminder_lead.total_seconds(), request_id))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _load_open_requests(self):
+        return list(
+            Request.objects.filter(status__in=Request.OPEN_STATUSES)
+            .values_list('id', 'expires_at', 'expiry_reminder_sent_at')
+        )
+
+    async def rebuild(self):
+        """Rebuild both heaps from the database"""
+        rows = await sync_to_async(self._load_open_requests)()
+        self._expiry_heap = []
+        self._reminder_heap = []
+        for request_id, expires_at, reminder_sent_at in rows:
+            self.schedule(request_id, expires_at, reminder_sent=reminder_sent_at is not None)
+        logger.info(f"⏰ Expiry scheduler loaded {len(rows)} open requests")
+
+    @staticmethod
+    def _pop_due(heap, now_ts: float, limit: int) -> List[int]:
+        due = []
+        while heap and heap[0][0] <= now_ts and len(due) < limit:
+            due.append(heapq.heappop(heap)[1])
+        return due
+
+    def _next_deadline(self) -> Optional[float]:
+        deadlines = [heap[0][0] for heap in (self._expiry_heap, self._reminder_heap) if heap]
+        return min(deadlines) if deadlines else None
+
+    # Database transitions
+    def _expire_requests(self, request_ids: Iterable[int]) -> List[int]:
+        """Flip due requests to 'expired' with one UPDATE; returns the ids that changed"""
+        from .models import ChangeLogEntry
+
+        now = timezone.now()
+        # Re-check expires_at: the heap may hold stale entries for extended requests
+        due = Request.objects.filter(id__in=list(request_ids), status__in=Request.OPEN_STATUSES, expires_at__lte=now)
+        with transaction.atomic():
+            expired_ids = _claim(due, status='expired')
+            if expired_ids:
+                # update() skips post_save, so record the changes for the changes feed explicitly
+                ChangeLogEntry.record('request', expired_ids)
+        return expired_ids
+
+    def _mark_reminders(self, request_ids: Iterable[int]) -> List[int]:
+        """Claim reminders with one UPDATE so each is sent at most once"""
+        now = timezone.now()
+        due = Request.objects.filter(
+            id__in=list(request_ids),
+            status__in=Request.OPEN_STATUSES,
+            expiry_reminder_sent_at__isnull=True,
+            expires_at__gt=now,
+            expires_at__lte=now + self.reminder_lead,
+        )
+        return _claim(due, expiry_reminder_sent_at=now)
+
+    async def process_due(self) -> int:
+        """Handle everything due right now; returns how many requests were expired"""
+        now_ts = timezone.now().timestamp()
+        expired_total = 0
+
+        while True:
+            due = self._pop_due(self._reminder_heap, now_ts, self.batch_size)
+            if not due:
+                break
+            reminder_ids = await sync_to_async(self._mark_reminders)(due)
+            if reminder_ids:
+                self._spawn(self._notify('notify_requests_expiring_soon', reminder_ids))
+
+        while True:
+            due = self._pop_due(self._expiry_heap, now_ts, self.batch_size)
+            if not due:
+                break
+            expired_ids = await sync_to_async(self._expire_requests)(due)
+            if expired_ids:
+                expired_total += len(expired_ids)
+                logger.info(f"⏰ Expired {len(expired_ids)} requests")
+                self._spawn(self._notify('notify_requests_expired', expired_ids))
+
+        return expired_total
+
+    # Notifications
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _notify(self, method_name: str, request_ids: List[int]):
+        if not self.telegram_bot:
+            return
+        try:
+            from .services import workflow_service
+            workflow_service.set_telegram_bot(self.telegram_bot)
+            await getattr(workflow_service, method_name)(request_ids)
+        except Exception as e:
+            logger.error(f"❌ Error in {method_name} for {len(request_ids)} requests: {e}")
+
+    # Main loop
+    async def run(self):
+        """Run until cancelled"""
+        self._wakeup = asyncio.Event()
+        await self.rebuild()
+        loop = asyncio.get_running_loop()
+        next_resync = loop.time() + self.resync_interval
+
+        while True:
+            try:
+                await self.process_due()
+
+                if loop.time() >= next_resync:
+                    await self.rebuild()
+                    next_resync = loop.time() + self.resync_interval
+                    continue
+
+                timeout = next_resync - loop.time()
+                deadline = self._next_deadline()
+                if deadline is not None:
+                    timeout = min(timeout, max(0.0, deadline - timezone.now().timestamp()))
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Expiry scheduler error: {e}")
+                await asyncio.sleep(5)
+
+
+# Set by the bot process when the scheduler is running
+expiry_scheduler: Optional[RequestExpiryScheduler] = None
@@ -0,0 +1,140 @@
+"""
+Duplicate update and double-tap protection.
+
+Telegram redelivers a webhook update when the response is slow, and users
+double-tap buttons such as "confirm request" or "accept offer". Each copy
+used to re-run the handler and start another fan-out.
+
+IdempotencyCache keeps two bounded, short-lived maps:
+
+* recent update_ids - a redelivered update is dropped before any handler runs
+* idempotency keys for state-changing actions - the first copy claims the
+  key, and later copies are answered with the cached result text (a callback
+  toast) without touching the database or notifying anyone
+
+Entries expire after IDEMPOTENCY_TTL_SECONDS and each map holds at most
+IDEMPOTENCY_MAX_ENTRIES. The cache is saved next to the conversation state
+file so it survives the per-update bot instances of inline webhook mode.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DUPLICATES = metrics.REGISTRY.counter(
+    'bot_duplicate_updates_total', 'Redelivered updates and repeated actions absorbed', ['kind']
+)
+
+IN_PROGRESS_TEXT = '⏳ جاري تنفيذ طلبك...'
+
+# Callback data prefix -> answer shown when the action already went through
+GUARDED_CALLBACKS = {
+    'confirm_request_': '✅ تم تأكيد هذا الطلب مسبقاً',
+    'offer_accept_': '✅ تم قبول هذا العرض مسبقاً',
+    'offer_reject_': 'تم رفض هذا العرض مسبقاً',
+}
+OFFER_SUBMITTED_TEXT = '✅ تم إرسال عرضك مسبقاً'
+
+_IN_PROGRESS = object()
+
+
+def callback_key(telegram_id, data):
+    """Idempotency key for a state-changing callback, None for everything else"""
+    for prefix in GUARDED_CALLBACKS:
+        if data and data.startswith(prefix):
+            return f'callback:{telegram_id}:{data}'
+    return None
+
+
+def callback_done_text(data):
+    for prefix, text in GUARDED_CALLBACKS.items():
+        if data.startswith(prefix):
+            return text
+    return None
+
+
+def offer_submit_key(telegram_id, request_id, price, delivery_time):
+    """Key for an offer submission; an offer with different terms is a new action"""
+    return f'offer_submit:{telegram_id}:{request_id}:{price}:{delivery_time}'
+
+
+class IdempotencyCache:
+    """Bounded, TTL-limited record of seen update_ids and completed actions"""
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'IDEMPOTENCY_TTL_SECONDS', 600)
+        self.max_entries = max_entries or getattr(settings, 'IDEMPOTENCY_MAX_ENTRIES', 10000)
+        self._updates = OrderedDict()  # update_id -> seen at
+        self._results = OrderedDict()  # key -> (stored at, result text)
+        self.dirty = False
+
+    # Pickling keeps only the data; in-progress claims never outlive a process
+    def __getstate__(self):
+        results = OrderedDict(
+            (key, entry) for key, entry in self._results.items() if entry[1] is not _IN_PROGRESS
+        )
+        return {'ttl': self.ttl, 'max_entries': self.max_entries, 'updates': self._updates, 'results': results}
+
+    def __setstate__(self, state):
+        self.ttl = state['ttl']
+        self.max_entries = state['max_entries']
+        self._updates = state['updates']
+        self._results = state['results']
+        self.dirty = False
+
+    def _prune(self, entries, now):
+        cutoff = now - self.ttl
+        while entries:
+            key, entry = next(iter(entries.items()))
+            stored_at = entry[0] if isinstance(entry, tuple) else entry
+            if stored_at >= cutoff and len(entries) <= self.max_entries:
+                break
+            entries.popitem(last=False)
+
+    def seen_update(self, update_id):
+        """Record ``update_id``; True when it was already processed recently"""
+        now = time.time()
+        self._prune(self._updates, now)
+        if update_id in self._updates:
+            DUPLICATES.inc(kind='update')
+            return True
+        self._updates[update_id] = now
+        self._prune(self._updates, now)
+        self.dirty = True
+        return False
+
+    def lookup(self, key):
+        """Answer text for a repeated action, or None if the action may run"""
+        now = time.time()
+        self._prune(self._results, now)
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        DUPLICATES.inc(kind='action')
+        return IN_PROGRESS_TEXT if entry[1] is _IN_PROGRESS else entry[1]
+
+    def claim(self, key):
+        """Mark ``key`` in progress; False if another copy already claimed it"""
+        if self.lookup(key) is not None:
+            return False
+        self._results[key] = (time.time(), _IN_PROGRESS)
+        return True
+
+    def complete(self, key, result):
+        self._results[key] = (time.time(), result)
+        self._results.move_to_end(key)
+        self._prune(self._results, time.time())
+        self.dirty = True
+
+    def release(self, key):
+        """Forget a claim whose action failed so the user can retry"""
+        self._results.pop(key, None)
+
+    def __len__(self):
+        return len(self._updates) + len(self._results)
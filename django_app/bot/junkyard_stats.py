@@ -0,0 +1,186 @@
+"""
+Per-junkyard responsiveness counters (JunkyardStats).
+
+The workflow service updates one row per junkyard as events happen:
+
+- notified: requests_received += 1 for every junkyard an order reached
+- offer made: offers_made += 1 and the time from request to offer is fed to
+  a streaming median estimator
+- offer accepted: offers_accepted += 1
+
+so the dashboard and bot.matching read acceptance rate, response rate and
+median time-to-offer from a single row instead of counting offers.
+
+The median uses the P² algorithm (Jain & Chlamtac): five markers, O(1)
+memory and update time, stored in JunkyardStats.response_estimator.
+
+``manage.py backfill_junkyard_stats`` recomputes the offer counters and the
+median from offer history for junkyards that predate the counters; requests
+received cannot be recovered and are only raised to at least offers made.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import JunkyardStats, Offer
+
+
+class StreamingMedian:
+    """P² estimate of the median of a stream"""
+
+    P = 0.5
+    INCREMENTS = (0, P / 2, P, (1 + P) / 2, 1)
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.samples = state.get('samples', [])  # First five observations
+        self.heights = state.get('heights')
+        self.positions = state.get('positions')
+        self.desired = state.get('desired')
+        self.count = state.get('count', len(self.samples))
+
+    def state(self):
+        if self.heights is None:
+            return {'samples': self.samples, 'count': self.count}
+        return {'heights': self.heights, 'positions': self.positions, 'desired': self.desired, 'count': self.count}
+
+    @property
+    def value(self):
+        if self.heights is not None:
+            return self.heights[2]
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        middle = len(ordered) // 2
+        return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+    def add(self, x):
+        self.count += 1
+        if self.heights is None:
+            self.samples.append(x)
+            if len(self.samples) == 5:
+                self.heights = sorted(self.samples)
+                self.positions = [1, 2, 3, 4, 5]
+                self.desired = [1, 1 + 2 * self.P, 1 + 4 * self.P, 3 + 2 * self.P, 5]
+                self.samples = []
+            return
+
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0] = x
+            cell = 0
+        elif x >= q[4]:
+            q[4] = x
+            cell = 3
+        else:
+            cell = max(i for i in range(4) if q[i] <= x)
+        for i in range(cell + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.INCREMENTS[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+
+def _ensure_rows(junkyard_ids):
+    JunkyardStats.objects.bulk_create(
+        [JunkyardStats(junkyard_id=junkyard_id) for junkyard_id in junkyard_ids], ignore_conflicts=True
+    )
+
+
+def stats_for(junkyard):
+    """The junkyard's stats row, or an unsaved empty one"""
+    try:
+        return junkyard.stats
+    except JunkyardStats.DoesNotExist:
+        return JunkyardStats(junkyard=junkyard)
+
+
+def record_notified(junkyard_ids):
+    """Count an order reaching each of ``junkyard_ids``"""
+    junkyard_ids = list(junkyard_ids)
+    if not junkyard_ids:
+        return
+    now = timezone.now()
+    _ensure_rows(junkyard_ids)
+    JunkyardStats.objects.filter(junkyard_id__in=junkyard_ids).update(
+        requests_received=F('requests_received') + 1, last_notified_at=now, updated_at=now,
+    )
+
+
+def record_offer(offer):
+    """Count a new offer and feed its time-to-offer to the median"""
+    seconds = max(0.0, (offer.created_at - offer.request.created_at).total_seconds())
+    _ensure_rows([offer.junkyard_id])
+    with transaction.atomic():
+        stats = JunkyardStats.objects.select_for_update().get(junkyard_id=offer.junkyard_id)
+        estimator = StreamingMedian(stats.response_estimator)
+        estimator.add(seconds)
+        stats.offers_made += 1
+        stats.last_offer_at = offer.created_at
+        stats.median_response_seconds = estimator.value
+        stats.response_estimator = estimator.state()
+        stats.save()
+
+
+def record_acceptance(offer):
+    """Count an accepted offer"""
+    _ensure_rows([offer.junkyard_id])
+    JunkyardStats.objects.filter(junkyard_id=offer.junkyard_id).update(
+        offers_accepted=F('offers_accepted') + 1, updated_at=timezone.now(),
+    )
+
+
+def backfill(junkyard_ids=None):
+    """Recompute offer counters and median time-to-offer from offer history; returns the junkyard count"""
+    offers = Offer.objects.order_by('created_at', 'id')
+    if junkyard_ids is not None:
+        offers = offers.filter(junkyard_id__in=junkyard_ids)
+
+    estimators = defaultdict(StreamingMedian)
+    made = defaultdict(int)
+    accepted = defaultdict(int)
+    last_offer = {}
+    for junkyard_id, status, created_at, request_created_at in offers.values_list(
+        'junkyard_id', 'status', 'created_at', 'request__created_at'
+    ).iterator(chunk_size=2000):
+        estimators[junkyard_id].add(max(0.0, (created_at - request_created_at).total_seconds()))
+        made[junkyard_id] += 1
+        accepted[junkyard_id] += status == 'accepted'
+        last_offer[junkyard_id] = created_at
+
+    _ensure_rows(made)
+    with transaction.atomic():
+        rows = list(JunkyardStats.objects.select_for_update().filter(junkyard_id__in=list(made)))
+        for stats in rows:
+            estimator = estimators[stats.junkyard_id]
+            stats.offers_made = made[stats.junkyard_id]
+            stats.offers_accepted = accepted[stats.junkyard_id]
+            stats.last_offer_at = last_offer[stats.junkyard_id]
+            stats.median_response_seconds = estimator.value
+            stats.response_estimator = estimator.state()
+            # Orders that reached a junkyard before the counters existed are unknown
+            stats.requests_received = max(stats.requests_received, stats.offers_made)
+        JunkyardStats.objects.bulk_update(rows, [
+            'offers_made', 'offers_accepted', 'last_offer_at', 'median_response_seconds',
+            'response_estimator', 'requests_received',
+        ])
+    return len(rows)
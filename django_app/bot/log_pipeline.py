@@ -0,0 +1,267 @@
+"""
+Non-blocking logging for the bot and web processes.
+
+``settings.LOGGING`` routes the ``django``, ``bot`` and ``dashboard``
+loggers to a single QueueingHandler. Handler threads (the event loop
+included) only run the cheap filters and enqueue the record; a
+QueueListener thread formats it and does the file and console I/O.
+
+On the way in:
+
+- RateLimitFilter gives every logger its own token bucket
+  (LOG_RATE_LIMIT_PER_SECOND, LOG_RATE_LIMIT_BURST) for records below
+  ERROR. Suppressed records are counted and the count is attached to the
+  next record that logger emits.
+- PayloadSamplingFilter keeps only one in LOG_PAYLOAD_SAMPLE_EVERY records
+  whose message is longer than LOG_PAYLOAD_MAX_CHARS (full update dumps
+  and the like), and JsonFormatter truncates the ones that are kept.
+- When the queue is full (LOG_QUEUE_SIZE) records are dropped, not waited
+  for.
+
+Log with ``logger.info("... %s", value)`` rather than f-strings on hot
+paths: a record that is filtered out then costs no formatting at all.
+Messages whose arguments are all immutable (strings, numbers, dates...) are
+formatted on the listener thread. Ones with dicts, lists or other objects are
+formatted when enqueued, so the log shows the values as they were, not what
+a handler changed them to later.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from decimal import Decimal
+
+from . import metrics
+
+DROPPED = metrics.REGISTRY.counter(
+    'bot_log_records_dropped_total', 'Log records dropped before output', ['reason']
+)
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, type(None), Decimal, date, dt_time, timedelta, uuid.UUID)
+_CONTAINER_TYPES = (dict, list, tuple, set, frozenset)
+
+
+def _is_immutable(value):
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+def _bounded_size(value, budget):
+    """Estimated repr() length of ``value``, walking only until it exceeds ``budget``
+
+    None for objects other than strings, scalars and containers of them:
+    their size is only known once they are formatted.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value) + 2
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return len(str(value))
+    if not isinstance(value, _CONTAINER_TYPES):
+        return None
+    size = 2
+    try:
+        items = value.items() if isinstance(value, dict) else ((item,) for item in value)
+        for item in items:
+            if size > budget:
+                break
+            for part in item:
+                part_size = _bounded_size(part, budget - size)
+                if part_size is None:
+                    return None
+                size += part_size + 2
+    except RuntimeError:
+        return None  # Changed size while we walked it
+    return size
+
+
+def _setting(name, default):
+    from django.conf import settings
+    return getattr(settings, name, default)
+
+
+class RateLimitFilter(logging.Filter):
+    """Per-logger token bucket for records below ERROR"""
+
+    def __init__(self, rate=None, burst=None):
+        super().__init__()
+        self.rate = rate if rate is not None else _setting('LOG_RATE_LIMIT_PER_SECOND', 50)
+        self.burst = burst if burst is not None else _setting('LOG_RATE_LIMIT_BURST', 200)
+        self._buckets = {}  # logger name -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or self.rate <= 0:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                DROPPED.inc(reason='rate_limited')
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class PayloadSamplingFilter(logging.Filter):
+    """Keep one in ``sample_every`` records with an oversized message"""
+
+    def __init__(self, max_chars=None, sample_every=None):
+        super().__init__()
+        self.max_chars = max_chars if max_chars is not None else _setting('LOG_PAYLOAD_MAX_CHARS', 2000)
+        self.sample_every = sample_every if sample_every is not None else _setting('LOG_PAYLOAD_SAMPLE_EVERY', 100)
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    def _size(self, record):
+        """Estimated message length without formatting; None if an argument can't be sized cheaply"""
+        size = _bounded_size(record.msg, self.max_chars)
+        if size is None or not record.args:
+            return size
+        # A single dict argument is stored as the args mapping itself
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        for arg in args:
+            if size > self.max_chars:
+                break
+            arg_size = _bounded_size(arg, self.max_chars - size)
+            if arg_size is None:
+                return None
+            size += arg_size
+        return size
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or self.max_chars <= 0:
+            return True
+        size = self._size(record)
+        if size is None:
+            # QueueingHandler.prepare formats it and calls sample_formatted
+            record._payload_unsized = True
+            return True
+        return size <= self.max_chars or self._keep(record)
+
+    def sample_formatted(self, record):
+        """Sampling decision for a record whose message is already formatted"""
+        if len(record.msg) <= self.max_chars:
+            return True
+        return self._keep(record)
+
+    def _keep(self, record):
+        with self._lock:
+            self._seen += 1
+            keep = self.sample_every <= 1 or self._seen % self.sample_every == 1
+        if keep:
+            record.sampled = self.sample_every
+        else:
+            DROPPED.inc(reason='sampled')
+        return keep
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; messages longer than LOG_PAYLOAD_MAX_CHARS are truncated"""
+
+    def __init__(self, max_chars=None):
+        super().__init__()
+        self.max_chars = max_chars if max_chars is not None else _setting('LOG_PAYLOAD_MAX_CHARS', 2000)
+
+    def format(self, record):
+        message = record.getMessage()
+        if self.max_chars > 0 and len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}... (+{len(message) - self.max_chars} chars)"
+
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': message,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """Enqueue records for a background listener that owns the real handlers
+
+    ``filename`` adds a file sink and ``console`` a stderr sink; ``json_format``
+    picks JsonFormatter over the plain text format for both.
+    """
+
+    def __init__(self, filename=None, console=True, json_format=True, queue_size=None):
+        super().__init__(queue.Queue(queue_size if queue_size is not None else _setting('LOG_QUEUE_SIZE', 10000)))
+        formatter = JsonFormatter() if json_format else logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s: %(message)s'
+        )
+        sinks = []
+        if filename:
+            sinks.append(logging.FileHandler(filename, encoding='utf-8'))
+        if console:
+            sinks.append(logging.StreamHandler())
+        for sink in sinks:
+            sink.setFormatter(formatter)
+
+        self.sampler = PayloadSamplingFilter()
+        self.addFilter(self.sampler)
+        self.addFilter(RateLimitFilter())
+        self.listener = logging.handlers.QueueListener(self.queue, *sinks, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Messages with only immutable arguments are formatted on the listener
+        # thread. Others are formatted now, while the arguments still hold the
+        # values being logged, as is the traceback
+        record = copy.copy(record)
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if not _is_immutable(record.msg) or (record.args and not all(_is_immutable(arg) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+            if record.__dict__.pop('_payload_unsized', False) and not self.sampler.sample_formatted(record):
+                return None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if record is None:
+            return  # Sampled out in prepare (None would also stop the listener)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc(reason='queue_full')
+
+    def stop(self):
+        """Drain the queue and stop the listener"""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        for sink in self.listener.handlers:
+            sink.close()
+        super().close()
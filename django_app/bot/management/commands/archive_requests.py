@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to move old closed requests to the archive
+
+Usage:
+    python manage.py archive_requests                 # Closed requests older than ARCHIVE_AFTER_DAYS
+    python manage.py archive_requests --days 365      # Only requests older than a year
+    python manage.py archive_requests --limit 10000   # Stop after 10000 requests
+    python manage.py archive_requests --dry-run       # Only count what would be archived
+
+Archived orders are still found by order id (bot.archive.find_order and the
+dashboard requests search).
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bot.archive import archivable_requests, run_archive
+
+
+class Command(BaseCommand):
+    help = 'Move closed requests older than the retention period to the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'ARCHIVE_AFTER_DAYS', 180),
+            help='Archive closed requests created more than this many days ago',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Requests copied and deleted per transaction',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Maximum number of requests to archive in this run',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many requests would be archived without moving them',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archivable_requests(options['days']).count()
+            self.stdout.write(f'🔍 سيتم أرشفة {count} طلب')
+            return
+
+        archived = run_archive(options['days'], batch_size=options['batch_size'], limit=options['limit'])
+        if not archived:
+            self.stdout.write(self.style.SUCCESS('✅ لا توجد طلبات قديمة للأرشفة'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'🗄️ تمت أرشفة {archived} طلب أقدم من {options["days"]} يوم'))
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to rebuild junkyard responsiveness counters
+(offers made, accepted and median time-to-offer) from offer history
+
+Usage:
+    python manage.py backfill_junkyard_stats                 # All junkyards
+    python manage.py backfill_junkyard_stats --junkyard 12   # One junkyard
+"""
+
+from django.core.management.base import BaseCommand
+
+from bot.junkyard_stats import backfill
+
+
+class Command(BaseCommand):
+    help = 'Recompute junkyard offer counters and median time-to-offer from offer history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--junkyard',
+            type=int,
+            action='append',
+            help='Only rebuild this junkyard (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        count = backfill(options['junkyard'])
+        self.stdout.write(self.style.SUCCESS(f'✅ تم تحديث إحصائيات {count} تشليح'))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to run the hot-path micro-benchmarks
+
+Usage:
+    python manage.py benchmark_micro                                  # Run everything
+    python manage.py benchmark_micro --filter keyboard --filter render
+    python manage.py benchmark_micro --json results/micro.json
+    python manage.py benchmark_micro --compare results/micro.json --fail-on-regression
+
+Runs against a throwaway test database. Comparison uses the fastest round of
+each benchmark; a change above --threshold counts as a regression.
+"""
+
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import micro
+from benchmarks.database import isolated_test_database
+
+
+class Command(BaseCommand):
+    help = 'Run the micro-benchmark suite and optionally compare against a saved run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', action='append', help='Only run benchmarks whose name contains this')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing rounds per benchmark')
+        parser.add_argument('--json', dest='json_path', help='Write the results to this JSON file')
+        parser.add_argument('--compare', dest='baseline_path', help='Saved JSON results to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error on regressions')
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+
+    def handle(self, *args, **options):
+        names = micro.select(options['filter'])
+        if options['list']:
+            for name in names:
+                self.stdout.write(f"{micro.BENCHMARKS[name]['group']:<12} {name}")
+            return
+        if not names:
+            raise CommandError('No benchmark matches the given --filter')
+
+        baseline = None
+        if options['baseline_path']:
+            with open(options['baseline_path'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        if options['verbosity'] < 2:
+            logging.getLogger('bot').setLevel(logging.ERROR)
+
+        self.stdout.write(f'⏱️ تشغيل {len(names)} اختبار أداء...')
+        with isolated_test_database():
+            report = micro.run_benchmarks(names, repeat=options['repeat'], progress=self._print_result)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"💾 تم حفظ النتائج في {options['json_path']}")
+
+        if baseline:
+            self._print_comparison(micro.compare(report, baseline, options['threshold']), options)
+
+    def _print_result(self, name, stats):
+        self.stdout.write(
+            f"   {name:<32} median {self._format_us(stats['median_us']):>10}  "
+            f"min {self._format_us(stats['min_us']):>10}  ±{self._format_us(stats['stdev_us'])}"
+        )
+
+    def _print_comparison(self, rows, options):
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING('📊 المقارنة مع النتائج السابقة:'))
+        regressions = []
+        for row in rows:
+            if row['status'] == 'new':
+                self.stdout.write(f"   🆕 {row['name']}")
+                continue
+            line = (
+                f"   {row['name']:<32} {self._format_us(row['baseline_us']):>10} → "
+                f"{self._format_us(row['current_us']):>10} ({row['change']:+.1%})"
+            )
+            if row['status'] == 'regression':
+                regressions.append(row['name'])
+                self.stdout.write(self.style.ERROR(f'{line} ⚠️'))
+            elif row['status'] == 'improvement':
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"Performance regressions: {', '.join(regressions)}")
+
+    @staticmethod
+    def _format_us(value):
+        if value >= 1_000_000:
+            return f'{value / 1_000_000:.2f}s'
+        if value >= 1_000:
+            return f'{value / 1_000:.2f}ms'
+        return f'{value:.1f}µs'
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to load test the Telegram webhook end to end
+
+Usage:
+    python manage.py benchmark_webhook                            # All preset scenarios
+    python manage.py benchmark_webhook --scenario concurrent      # One preset
+    python manage.py benchmark_webhook --customers 50 --latency-ms 80
+    python manage.py benchmark_webhook --json results/webhook.json
+    python manage.py benchmark_webhook --inline                   # Process inside the request (no dispatcher)
+
+Runs against a throwaway test database and a local Bot API stub, so it
+never touches real data or the real Telegram API.
+"""
+
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.database import isolated_test_database
+from benchmarks.webhook_load import SCENARIOS, WebhookLoadDriver
+
+
+class Command(BaseCommand):
+    help = 'Load test TelegramWebhookView against a local Telegram Bot API stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=sorted(SCENARIOS),
+            help='Preset scenario to run (repeatable, default: all)',
+        )
+        parser.add_argument('--customers', type=int, help='Concurrent customers per scenario')
+        parser.add_argument('--junkyards', type=int, help='Junkyards receiving each request')
+        parser.add_argument('--items', type=int, help='Items added to each request')
+        parser.add_argument('--latency-ms', type=float, help='Bot API stub latency')
+        parser.add_argument('--jitter-ms', type=float, help='Bot API stub latency jitter')
+        parser.add_argument(
+            '--rate-limit-ratio',
+            type=float,
+            help='Fraction of Bot API calls answered with 429 Too Many Requests',
+        )
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for latency and 429 injection')
+        parser.add_argument('--json', dest='json_path', help='Write the results to this JSON file')
+        parser.add_argument(
+            '--inline',
+            action='store_true',
+            help='Process updates inside the webhook request instead of the background dispatcher',
+        )
+
+    def handle(self, *args, **options):
+        overrides = {
+            key: options[key]
+            for key in ('customers', 'junkyards', 'items', 'latency_ms', 'jitter_ms', 'rate_limit_ratio')
+            if options[key] is not None
+        }
+        if overrides.get('customers', 1) < 1 or overrides.get('junkyards', 1) < 1:
+            raise CommandError('--customers and --junkyards must be at least 1')
+
+        scenarios = [
+            (name, dict(SCENARIOS[name], **overrides))
+            for name in (options['scenario'] or SCENARIOS)
+        ]
+
+        if options['verbosity'] < 2:
+            for name in ('bot', 'django', 'httpx', 'telegram'):
+                logging.getLogger(name).setLevel(logging.ERROR)
+
+        self.stdout.write('🧪 إنشاء قاعدة بيانات مؤقتة للاختبار...')
+        with isolated_test_database():
+            results = WebhookLoadDriver().run(scenarios, seed=options['seed'], inline=options['inline'])
+
+        for result in results:
+            self._print_result(result)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"💾 تم حفظ النتائج في {options['json_path']}")
+
+    def _print_result(self, result):
+        config = result['config']
+        latency = result['latency_ms']
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"📊 {result['scenario']}: {config['customers']} عميل، {config['junkyards']} تشليح، "
+            f"تأخير {config['latency_ms']}ms، نسبة 429 {config['rate_limit_ratio']}"
+        ))
+        self.stdout.write(
+            f"   صفقات مكتملة: {result['deals_completed']} / "
+            f"{result['deals_completed'] + result['deals_failed']}"
+        )
+        for failure, count in result['failures'].items():
+            self.stdout.write(self.style.WARNING(f"   ⚠️ {count}× {failure}"))
+        self.stdout.write(
+            f"   التحديثات: {result['updates']} في {result['elapsed_s']}s "
+            f"({result['throughput_updates_per_s']} تحديث/ث)"
+        )
+        self.stdout.write(
+            f"   زمن الاستجابة: p50={latency['p50']}ms p95={latency['p95']}ms "
+            f"p99={latency['p99']}ms max={latency['max']}ms"
+        )
+        self.stdout.write(
+            f"   زمن الرد على Telegram: p50={result['ack_ms']['p50']}ms p95={result['ack_ms']['p95']}ms "
+            f"p99={result['ack_ms']['p99']}ms"
+        )
+        self.stdout.write(
+            f"   استعلامات قاعدة البيانات: {result['db_queries']} "
+            f"({result['db_queries_per_update']} لكل تحديث)"
+        )
+        self.stdout.write(
+            f"   طلبات Bot API: {result['api_calls']} ({result['api_calls_per_update']} لكل تحديث)، "
+            f"429: {result['rate_limited']}"
+        )
+        methods = ', '.join(f'{method}={count}' for method, count in result['api_calls_by_method'].items())
+        self.stdout.write(f'   {methods}')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to report how much conversation state the bot keeps
+in memory (the state file) and on disk (spilled states), and to purge
+abandoned spilled drafts
+
+Usage:
+    python manage.py bot_state_report                  # Report only
+    python manage.py bot_state_report --top 20         # Also list the 20 largest states
+    python manage.py bot_state_report --purge          # Delete spilled states older than BOT_STATE_SPILL_RETENTION_DAYS
+    python manage.py bot_state_report --purge --days 7
+"""
+
+import os
+import pickle
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bot.conversation_state import StateStore, deep_size, spilled_files, states_file_path
+
+
+class Command(BaseCommand):
+    help = 'Report conversation state memory use and purge old spilled states'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='State file (default: the bot\'s)')
+        parser.add_argument('--top', type=int, default=5, help='How many of the largest states to list')
+        parser.add_argument('--purge', action='store_true', help='Delete old spilled states')
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'BOT_STATE_SPILL_RETENTION_DAYS', 30),
+            help='Age in days after which spilled states are purged',
+        )
+
+    def handle(self, *args, **options):
+        states_file = options['file'] or states_file_path()
+        spill_dir = states_file + '.spill'
+
+        store = StateStore(max_users=10**9, idle_seconds=0)
+        if os.path.exists(states_file):
+            with open(states_file, 'rb') as f:
+                store.load(pickle.load(f))
+            file_size = os.path.getsize(states_file)
+        else:
+            file_size = 0
+
+        states = store.snapshot()
+        sizes = {telegram_id: deep_size(state) for telegram_id, state in states.items()}
+        drafts = sum(len(state.get('drafts') or {}) for state in states.values())
+        items = sum(
+            len((draft.get('request_data') or {}).get('items', []))
+            for state in states.values() for draft in (state.get('drafts') or {}).values()
+        )
+
+        self.stdout.write(f'📄 ملف الحالات: {states_file} ({file_size / 1024:.1f} KB)')
+        self.stdout.write(
+            f'🧠 في الذاكرة: {len(states)} مستخدم، {drafts} مسودة، {items} قطعة '
+            f'(~{sum(sizes.values()) / 1024:.1f} KB، الحد {getattr(settings, "BOT_STATE_MAX_USERS", 5000)})'
+        )
+        for telegram_id, size in sorted(sizes.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'   {telegram_id}: ~{size / 1024:.1f} KB')
+
+        spilled = spilled_files(spill_dir)
+        now = time.time()
+        oldest = max((now - mtime for _, _, mtime in spilled), default=0)
+        self.stdout.write(
+            f'💾 على القرص: {len(spilled)} مستخدم ({sum(size for _, size, _ in spilled) / 1024:.1f} KB)، '
+            f'الأقدم منذ {oldest / 86400:.1f} يوم'
+        )
+
+        if options['purge']:
+            cutoff = now - options['days'] * 86400
+            purged = 0
+            for path, _, mtime in spilled:
+                if mtime < cutoff:
+                    os.remove(path)
+                    purged += 1
+            self.stdout.write(self.style.SUCCESS(f'🗑️ تم حذف {purged} حالة أقدم من {options["days"]} يوم'))
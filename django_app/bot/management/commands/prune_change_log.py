@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to prune old changes feed entries
+
+Usage:
+    python manage.py prune_change_log              # Keep CHANGE_LOG_RETENTION_DAYS days
+    python manage.py prune_change_log --days 7     # Keep the last 7 days
+    python manage.py prune_change_log --dry-run    # Only count what would be deleted
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from bot.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = 'Delete changes feed entries older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'CHANGE_LOG_RETENTION_DAYS', 30),
+            help='Number of days of change log to keep',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many entries would be deleted without deleting them',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Delete by id range so the delete walks the primary key
+        last_old = ChangeLogEntry.objects.filter(created_at__lt=cutoff).order_by('-id').values_list('id', flat=True).first()
+
+        if last_old is None:
+            self.stdout.write(self.style.SUCCESS('✅ لا توجد سجلات قديمة للحذف'))
+            return
+
+        old_entries = ChangeLogEntry.objects.filter(id__lte=last_old)
+        if options['dry_run']:
+            self.stdout.write(f'🔍 سيتم حذف {old_entries.count()} سجل')
+            return
+
+        deleted, _ = old_entries.delete()
+        self.stdout.write(self.style.SUCCESS(f'🗑️ تم حذف {deleted} سجل أقدم من {options["days"]} يوم'))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to prune old Telegram message log rows
+
+Usage:
+    python manage.py prune_message_log                     # Keep MESSAGE_LOG_RETENTION_DAYS days
+    python manage.py prune_message_log --days 7            # Keep the last 7 days
+    python manage.py prune_message_log --batch-size 1000   # Smaller deletes, shorter locks
+    python manage.py prune_message_log --dry-run           # Only count what would be deleted
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from bot.models import TelegramMessage
+
+
+class Command(BaseCommand):
+    help = 'Delete Telegram message log rows older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'MESSAGE_LOG_RETENTION_DAYS', 30),
+            help='Number of days of message log to keep',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows deleted per statement',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many rows would be deleted without deleting them',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Rows are written in time order, so everything up to the newest old id is old
+        last_old = TelegramMessage.objects.filter(created_at__lt=cutoff).order_by('-id').values_list('id', flat=True).first()
+
+        if last_old is None:
+            self.stdout.write(self.style.SUCCESS('✅ لا توجد رسائل قديمة للحذف'))
+            return
+
+        if options['dry_run']:
+            count = TelegramMessage.objects.filter(id__lte=last_old).count()
+            self.stdout.write(f'🔍 سيتم حذف {count} رسالة')
+            return
+
+        # Delete in id-range batches so no single statement holds the table for long
+        deleted = 0
+        while True:
+            batch_end = (
+                TelegramMessage.objects.filter(id__lte=last_old).order_by('id')
+                .values_list('id', flat=True)[options['batch_size'] - 1:options['batch_size']].first()
+            ) or last_old
+            batch_deleted, _ = TelegramMessage.objects.filter(id__lte=batch_end).delete()
+            deleted += batch_deleted
+            if batch_end == last_old:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'🗑️ تم حذف {deleted} رسالة أقدم من {options["days"]} يوم'))
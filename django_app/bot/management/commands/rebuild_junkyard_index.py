@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to rebuild the junkyard specialization index
+used to target order notifications (see bot.matching)
+
+Usage:
+    python manage.py rebuild_junkyard_index                 # All junkyards
+    python manage.py rebuild_junkyard_index --junkyard 12   # One junkyard
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from bot.matching import rebuild_index
+from bot.models import JunkyardSpecialization
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the (city, brand) -> junkyard index from declared makes and offer history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--junkyard',
+            type=int,
+            action='append',
+            help='Only rebuild this junkyard (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_index(options['junkyard'])
+        specialists = JunkyardSpecialization.objects.aggregate(count=Count('junkyard', distinct=True))['count']
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ تم بناء {rows} سجل تخصص ({specialists} تشليح متخصص)'
+        ))
@@ -3,6 +3,11 @@
 """
 Management command to run Telegram Bot
 Supports both polling (development) and webhook (production) modes
+
+Usage:
+    python manage.py run_bot                                    # Polling, settings defaults
+    python manage.py run_bot --concurrent-updates 64 --poll-timeout 50
+    python manage.py run_bot --allowed-updates message,callback_query,my_chat_member
 """
 
 import asyncio
@@ -32,6 +37,24 @@ class Command(BaseCommand):
             type=str,
             help='Webhook URL for production mode (e.g., https://yourdomain.com/bot/webhook/telegram/)'
         )
+        parser.add_argument(
+            '--concurrent-updates',
+            type=int,
+            default=settings.BOT_CONCURRENT_UPDATES,
+            help='Updates processed at once in polling mode, serialized per user (1 = sequential)'
+        )
+        parser.add_argument(
+            '--poll-timeout',
+            type=int,
+            default=settings.BOT_POLL_TIMEOUT,
+            help='Long-poll timeout in seconds for getUpdates'
+        )
+        parser.add_argument(
+            '--allowed-updates',
+            type=lambda v: [s.strip() for s in v.split(',') if s.strip()],
+            default=settings.BOT_ALLOWED_UPDATES,
+            help='Comma-separated update types to receive (e.g. message,callback_query)'
+        )
 
     def handle(self, *args, **options):
         mode = options['mode']
@@ -47,21 +70,25 @@ class Command(BaseCommand):
         
         try:
             if mode == 'polling':
-                asyncio.run(self.run_polling())
+                asyncio.run(self.run_polling(options))
             else:
-                asyncio.run(self.setup_webhook(webhook_url))
+                asyncio.run(self.setup_webhook(webhook_url, options['allowed_updates']))
         except KeyboardInterrupt:
             self.stdout.write(self.style.SUCCESS('Bot stopped by user.'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Bot error: {e}'))
 
-    async def run_polling(self):
+    async def run_polling(self, options):
         """Run bot in polling mode (for development)"""
         self.stdout.write("🚀 Starting bot in polling mode...")
+        self.stdout.write(
+            f"⚙️ concurrent updates: {options['concurrent_updates']}, poll timeout: {options['poll_timeout']}s, "
+            f"allowed updates: {', '.join(options['allowed_updates'])}"
+        )
         self.stdout.write("Press Ctrl+C to stop the bot")
         
         bot = TelegramBot()
-        app = bot.setup_bot()
+        app = bot.setup_bot(concurrent_updates=options['concurrent_updates'])
         
         if not app:
             self.stdout.write(self.style.ERROR('Failed to setup bot!'))
@@ -81,13 +108,16 @@ class Command(BaseCommand):
         try:
             await app.initialize()
             await app.start()
+            # post_init only runs under run_polling(), so start background tasks here
+            await bot.start_background_tasks()
             
             self.stdout.write(self.style.SUCCESS('✅ Bot started successfully in polling mode!'))
             self.stdout.write('🔄 Listening for messages...')
             
             # Start polling
             await app.updater.start_polling(
-                allowed_updates=['message', 'callback_query'],
+                timeout=options['poll_timeout'],
+                allowed_updates=options['allowed_updates'],
                 drop_pending_updates=True
             )
             
@@ -102,6 +132,7 @@ class Command(BaseCommand):
         finally:
             self.stdout.write('🛑 Stopping bot...')
             try:
+                await bot.stop_background_tasks()
                 await app.updater.stop()
                 await app.stop()
                 await app.shutdown()
@@ -109,7 +140,7 @@ class Command(BaseCommand):
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'Error during shutdown: {e}'))
 
-    async def setup_webhook(self, webhook_url):
+    async def setup_webhook(self, webhook_url, allowed_updates):
         """Setup webhook for production mode"""
         import requests
         
@@ -126,7 +157,7 @@ class Command(BaseCommand):
         # Set new webhook
         webhook_data = {
             'url': webhook_url,
-            'allowed_updates': ['message', 'callback_query'],
+            'allowed_updates': allowed_updates,
             'drop_pending_updates': True
         }
         
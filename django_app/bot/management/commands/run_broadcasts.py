@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Django Management Command to send queued broadcast campaigns
+
+Usage:
+    python manage.py run_broadcasts            # Keep running and pick up new campaigns
+    python manage.py run_broadcasts --once     # Send whatever is queued, then exit
+
+The bot process already runs a sender (BROADCAST_WORKER_ENABLED); use this
+command when broadcasts should be sent from a separate worker. Several
+senders can run at once: each campaign is leased to one of them.
+"""
+
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from dashboard.broadcasts import BroadcastSender
+
+
+class Command(BaseCommand):
+    help = 'Send queued broadcast campaigns at the Telegram rate limit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no campaign is left to send')
+        parser.add_argument('--rate', type=float, help='Messages per second (default BROADCAST_RATE_PER_SECOND)')
+
+    def handle(self, *args, **options):
+        sender = BroadcastSender(rate=options['rate'])
+        self.stdout.write(f'📣 مرسل الحملات يعمل ({sender.rate} رسالة/ث)...')
+        try:
+            if options['once']:
+                asyncio.run(sender.run_pending())
+            else:
+                asyncio.run(sender.run_forever())
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('تم إيقاف المرسل'))
+            return
+        self.stdout.write(self.style.SUCCESS('✅ لا توجد حملات أخرى في الانتظار'))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 import logging
 import signal
@@ -19,6 +20,24 @@ class Command(BaseCommand):
             action='store_true',
             help='Force start even if another instance might be running',
         )
+        parser.add_argument(
+            '--concurrent-updates',
+            type=int,
+            default=settings.BOT_CONCURRENT_UPDATES,
+            help='Updates processed at once, serialized per user (1 = sequential)',
+        )
+        parser.add_argument(
+            '--poll-timeout',
+            type=int,
+            default=settings.BOT_POLL_TIMEOUT,
+            help='Long-poll timeout in seconds for getUpdates',
+        )
+        parser.add_argument(
+            '--allowed-updates',
+            type=lambda v: [s.strip() for s in v.split(',') if s.strip()],
+            default=settings.BOT_ALLOWED_UPDATES,
+            help='Comma-separated update types to receive (e.g. message,callback_query)',
+        )
     
     def handle_shutdown(self, signum, frame):
         self.stdout.write(self.style.WARNING("Received shutdown signal, stopping bot..."))
@@ -34,7 +53,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS("🚀 Starting Telegram Bot..."))
             
             # Setup bot application
-            application = telegram_bot.setup_bot()
+            application = telegram_bot.setup_bot(concurrent_updates=options['concurrent_updates'])
             if not application:
                 self.stdout.write(self.style.ERROR("Failed to setup bot application"))
                 return
@@ -46,7 +65,8 @@ class Command(BaseCommand):
             
             # Start polling (this blocks)
             application.run_polling(
-                allowed_updates=['message', 'callback_query'],
+                timeout=options['poll_timeout'],
+                allowed_updates=options['allowed_updates'],
                 drop_pending_updates=True
             )
             
@@ -0,0 +1,134 @@
+"""
+Brand-specialization matching for order fan-out.
+
+Instead of notifying every active junkyard in the city, a confirmed order
+goes to the junkyards that serve its make. JunkyardSpecialization holds a
+precomputed (city, brand) -> junkyard index with a score per row:
+
+- declared: the makes a junkyard stocks (Junkyard.brands) score
+  MATCHING_DECLARED_WEIGHT
+- learned: each offer the junkyard made on that make within
+  MATCHING_HISTORY_DAYS adds 1, each accepted one MATCHING_ACCEPTED_WEIGHT more
+- responsiveness: the share of notified orders it answered (JunkyardStats)
+  times MATCHING_RESPONSIVENESS_WEIGHT
+
+Only *specialized* junkyards get rows: ones that declared makes, or that
+have made at least MATCHING_MIN_HISTORY offers (enough to say what they
+stock). The rest are generalists and keep receiving every order in their
+city, which is also how new junkyards build up history.
+
+Recipients for an order are its city's specialists for the make, best score
+first (capped at MATCHING_MAX_RECIPIENTS, 0 = no cap), plus the city's
+generalists. With fewer than MATCHING_MIN_RECIPIENTS specialists the order
+falls back to the whole city.
+
+``manage.py rebuild_junkyard_index`` rebuilds the index (run it from cron);
+changing a junkyard's declared makes rebuilds its rows straight away.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import Junkyard, JunkyardSpecialization, JunkyardStats, Offer
+
+logger = logging.getLogger(__name__)
+
+FANOUT_MODE = metrics.REGISTRY.counter(
+    'bot_order_fanout_mode_total', 'Confirmed orders by recipient selection', ['mode']
+)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def score(declared, offers_count, accepted_count, response_rate=None):
+    return (
+        (_setting('MATCHING_DECLARED_WEIGHT', 10.0) if declared else 0)
+        + offers_count
+        + accepted_count * _setting('MATCHING_ACCEPTED_WEIGHT', 3.0)
+        + (response_rate or 0) * _setting('MATCHING_RESPONSIVENESS_WEIGHT', 5.0)
+    )
+
+
+def rebuild_index(junkyard_ids=None):
+    """Recompute the index for ``junkyard_ids`` (all junkyards by default); returns the row count"""
+    junkyards = Junkyard.objects.all()
+    if junkyard_ids is not None:
+        junkyards = junkyards.filter(id__in=junkyard_ids)
+    cities = dict(junkyards.values_list('id', 'city_id'))
+
+    declared = defaultdict(set)
+    for junkyard_id, brand_id in Junkyard.brands.through.objects.filter(
+        junkyard_id__in=cities
+    ).values_list('junkyard_id', 'brand_id'):
+        declared[junkyard_id].add(brand_id)
+
+    cutoff = timezone.now() - timedelta(days=_setting('MATCHING_HISTORY_DAYS', 180))
+    history = defaultdict(dict)  # junkyard -> brand -> (offers, accepted)
+    for row in (
+        Offer.objects.filter(junkyard_id__in=cities, created_at__gte=cutoff)
+        .values('junkyard_id', 'request__brand_id')
+        .annotate(offers=Count('id'), accepted=Count('id', filter=Q(status='accepted')))
+    ):
+        history[row['junkyard_id']][row['request__brand_id']] = (row['offers'], row['accepted'])
+
+    response_rates = {
+        stats.junkyard_id: stats.response_rate
+        for stats in JunkyardStats.objects.filter(junkyard_id__in=cities).only(
+            'junkyard_id', 'offers_made', 'requests_received'
+        )
+    }
+
+    min_history = _setting('MATCHING_MIN_HISTORY', 5)
+    rows = []
+    for junkyard_id, city_id in cities.items():
+        learned = history.get(junkyard_id, {})
+        if not declared[junkyard_id] and sum(offers for offers, _ in learned.values()) < min_history:
+            continue  # Generalist
+        for brand_id in declared[junkyard_id] | set(learned):
+            offers_count, accepted_count = learned.get(brand_id, (0, 0))
+            is_declared = brand_id in declared[junkyard_id]
+            rows.append(JunkyardSpecialization(
+                junkyard_id=junkyard_id, city_id=city_id, brand_id=brand_id, declared=is_declared,
+                offers_count=offers_count, accepted_count=accepted_count,
+                score=score(is_declared, offers_count, accepted_count, response_rates.get(junkyard_id)),
+            ))
+
+    with transaction.atomic():
+        JunkyardSpecialization.objects.filter(junkyard_id__in=cities).delete()
+        JunkyardSpecialization.objects.bulk_create(rows)
+    return len(rows)
+
+
+def recipients_for(request):
+    """(junkyards, mode) to notify about a confirmed order; mode is 'targeted' or 'city'"""
+    city_junkyards = Junkyard.objects.filter(city_id=request.city_id, is_active=True).select_related('user', 'city')
+    if not _setting('MATCHING_ENABLED', True):
+        FANOUT_MODE.inc(mode='city')
+        return list(city_junkyards), 'city'
+
+    specialists = [
+        row.junkyard
+        for row in JunkyardSpecialization.objects.filter(
+            city_id=request.city_id, brand_id=request.brand_id,
+            junkyard__city_id=request.city_id, junkyard__is_active=True,
+        ).select_related('junkyard__user', 'junkyard__city').order_by('-score', 'junkyard_id')
+    ]
+    if len(specialists) < _setting('MATCHING_MIN_RECIPIENTS', 3):
+        FANOUT_MODE.inc(mode='city')
+        return list(city_junkyards), 'city'
+
+    max_recipients = _setting('MATCHING_MAX_RECIPIENTS', 0)
+    if max_recipients:
+        specialists = specialists[:max_recipients]
+    generalists = list(city_junkyards.filter(specializations__isnull=True))
+    FANOUT_MODE.inc(mode='targeted')
+    return specialists + generalists, 'targeted'
@@ -0,0 +1,224 @@
+"""
+Buffered audit log of Telegram traffic into TelegramMessage.
+
+Handlers must not pay for auditing, so recording only appends the raw
+update (or outbound Bot API call) to an in-memory ring buffer. A writer
+thread drains it every MESSAGE_LOG_FLUSH_MS, or as soon as
+MESSAGE_LOG_BATCH_SIZE records are waiting, serializing the records and
+writing them with one bulk_create per batch (plus one query to map Telegram
+ids to users).
+
+The buffer holds at most MESSAGE_LOG_BUFFER_SIZE records. When the database
+can't keep up, MESSAGE_LOG_DROP_POLICY decides what is lost: ``oldest``
+(the default) overwrites the oldest buffered records, ``newest`` refuses new
+ones. Either way the bot keeps serving and the drops are counted. Old rows
+are removed by ``manage.py prune_message_log``.
+"""
+
+import atexit
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LOGGED = metrics.REGISTRY.counter(
+    'bot_message_log_records_total', 'Message log records by outcome', ['outcome']
+)
+BUFFERED = metrics.REGISTRY.gauge('bot_message_log_buffered', 'Message log records waiting to be written')
+
+# Outbound calls worth auditing; polling, answers and webhook calls are noise
+LOGGED_METHODS = {
+    'sendMessage', 'sendPhoto', 'sendVideo', 'sendDocument', 'sendMediaGroup',
+    'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption', 'deleteMessage',
+}
+
+
+def enabled():
+    return getattr(settings, 'MESSAGE_LOG_ENABLED', True)
+
+
+def _update_record(update):
+    """(telegram user id, message id, type, content) for an inbound update"""
+    content = update.to_dict()
+    user = update.effective_user
+    message = update.effective_message
+    kinds = [key for key in content if key != 'update_id']
+    return (
+        user.id if user else None,
+        message.message_id if message else 0,
+        f"in:{kinds[0] if kinds else 'update'}",
+        content,
+    )
+
+
+def _api_call_record(method, parameters, status_code, payload):
+    """(telegram user id, message id, type, content) for an outbound call"""
+    try:
+        response = json.loads(payload)
+    except (TypeError, ValueError):
+        response = {}
+    result = response.get('result')
+    if isinstance(result, list):
+        result = result[0] if result else None
+    message_id = result.get('message_id', 0) if isinstance(result, dict) else 0
+
+    parameters = json.loads(json.dumps(parameters, default=str))
+    content = {'request': parameters, 'status': status_code}
+    if not response.get('ok'):
+        content['error'] = response.get('description', '')
+    try:
+        chat_id = int(parameters.get('chat_id'))
+    except (TypeError, ValueError):
+        chat_id = None  # @channel usernames
+    return chat_id, message_id or 0, f"out:{method}", content
+
+
+class MessageLog:
+    """Ring buffer of Telegram traffic drained to the database by a writer thread"""
+
+    def __init__(self, buffer_size=10000, batch_size=500, flush_interval=1.0, drop_policy='oldest'):
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._buffer)
+
+    # Producer side (any thread or event loop; never touches the database)
+    def _append(self, record):
+        with self._lock:
+            if len(self._buffer) >= self.buffer_size:
+                LOGGED.inc(outcome='dropped')
+                if self.drop_policy == 'newest':
+                    return
+                self._buffer.popleft()
+            self._buffer.append(record)
+            buffered = len(self._buffer)
+        if buffered >= self.batch_size:
+            self._wakeup.set()
+
+    def record_update(self, update):
+        self._append((_update_record, (update,)))
+
+    def record_api_call(self, method, parameters, status_code, payload):
+        if method in LOGGED_METHODS:
+            self._append((_api_call_record, (method, parameters, status_code, payload)))
+
+    # Writer side
+    def _drain(self):
+        with self._lock:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            BUFFERED.set(len(self._buffer))
+        return batch
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows written"""
+        from .models import TelegramMessage, User
+
+        written = 0
+        while True:
+            batch = self._drain()
+            if not batch:
+                return written
+
+            rows = []
+            for build, args in batch:
+                try:
+                    rows.append(build(*args))
+                except Exception as e:
+                    LOGGED.inc(outcome='failed')
+                    logger.warning(f"⚠️ Could not serialize message log record: {e}")
+
+            try:
+                telegram_ids = {row[0] for row in rows if row[0] is not None}
+                users = dict(
+                    User.objects.filter(telegram_id__in=telegram_ids).values_list('telegram_id', 'id')
+                ) if telegram_ids else {}
+                TelegramMessage.objects.bulk_create([
+                    TelegramMessage(
+                        user_id=users.get(telegram_id), telegram_message_id=message_id,
+                        message_type=message_type, content=content,
+                    )
+                    for telegram_id, message_id, message_type, content in rows
+                ])
+            except Exception as e:
+                LOGGED.inc(len(rows), outcome='failed')
+                logger.error(f"❌ Could not write {len(rows)} message log records: {e}")
+                continue
+            LOGGED.inc(len(rows), outcome='written')
+            written += len(rows)
+
+    def _run(self):
+        try:
+            while not self._stopping:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self.flush()
+            self.flush()
+        finally:
+            connection.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='message-log-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Flush what is left and stop the writer"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_message_log = None
+_message_log_lock = threading.Lock()
+
+
+def get_message_log():
+    """The process-wide message log, started on first use"""
+    global _message_log
+    if _message_log is None:
+        with _message_log_lock:
+            if _message_log is None:
+                _message_log = MessageLog(
+                    buffer_size=getattr(settings, 'MESSAGE_LOG_BUFFER_SIZE', 10000),
+                    batch_size=getattr(settings, 'MESSAGE_LOG_BATCH_SIZE', 500),
+                    flush_interval=getattr(settings, 'MESSAGE_LOG_FLUSH_MS', 1000) / 1000,
+                    drop_policy=getattr(settings, 'MESSAGE_LOG_DROP_POLICY', 'oldest'),
+                ).start()
+    return _message_log
+
+
+def shutdown_message_log(timeout=10):
+    global _message_log
+    with _message_log_lock:
+        message_log, _message_log = _message_log, None
+    if message_log:
+        message_log.stop(timeout)
+
+
+atexit.register(shutdown_message_log)
+
+
+async def record_update(update, context=None):
+    """Group -2 TypeHandler: audit every inbound update"""
+    get_message_log().record_update(update)
+
+
+def record_api_call(method, parameters, status_code, payload):
+    get_message_log().record_api_call(method, parameters, status_code, payload)
@@ -0,0 +1,416 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms live in one module-level registry and are
+rendered by ``render()`` for the ``/metrics`` endpoint (web process) or by
+the small HTTP server the bot process starts on METRICS_PORT. Each process
+(and each gunicorn worker) keeps its own numbers; Prometheus sums them.
+
+Per-update DB statistics use a context variable: the handler wrapper opens
+a scope and a connection execute wrapper adds each query to it. asgiref
+copies the context into sync_to_async threads, so queries made from
+handlers are attributed to the update that caused them.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value)"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        for suffix, values, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_label_text(self.labelnames, values, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            yield '', values, (), value
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            yield '', values, (), value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state['count'] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self._values.items())
+        for values, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                yield '_bucket', values, (('le', _format_value(bound)),), cumulative
+            yield '_sum', values, (), state['sum']
+            yield '_count', values, (), state['count']
+
+
+class MetricsRegistry:
+    """Ordered collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+# Updates and handlers
+UPDATES = REGISTRY.counter('bot_updates_total', 'Telegram updates handled', ['handler'])
+HANDLER_ERRORS = REGISTRY.counter('bot_handler_errors_total', 'Handler calls that raised', ['handler', 'route'])
+HANDLER_LATENCY = REGISTRY.histogram(
+    'bot_handler_duration_seconds', 'Handler latency per callback route', ['handler', 'route']
+)
+UPDATE_DB_QUERIES = REGISTRY.histogram(
+    'bot_update_db_queries', 'DB queries per handled update', ['handler'], buckets=COUNT_BUCKETS
+)
+UPDATE_DB_SECONDS = REGISTRY.histogram('bot_update_db_seconds', 'DB time per handled update', ['handler'])
+DB_QUERIES = REGISTRY.counter('bot_db_queries_total', 'DB queries executed by this process')
+
+# Telegram Bot API
+TELEGRAM_API_LATENCY = REGISTRY.histogram(
+    'bot_telegram_api_duration_seconds', 'Bot API call latency', ['method']
+)
+TELEGRAM_API_ERRORS = REGISTRY.counter(
+    'bot_telegram_api_errors_total', 'Bot API calls that failed, by error class', ['method', 'error']
+)
+
+# Workflow
+ORDER_FANOUT = REGISTRY.histogram(
+    'bot_order_fanout_junkyards', 'Junkyards notified per confirmed order', buckets=COUNT_BUCKETS
+)
+USER_STATES = REGISTRY.gauge('bot_user_states', 'Conversations held in the state store')
+EVENT_LOOP_LAG = REGISTRY.gauge('bot_event_loop_lag_seconds', 'Latest event loop scheduling lag')
+EVENT_LOOP_LAG_SECONDS = REGISTRY.histogram(
+    'bot_event_loop_lag_distribution_seconds', 'Event loop scheduling lag',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+# Routes
+_ID_TOKEN = re.compile(r'\d')
+
+
+def callback_route(data):
+    """Collapse callback data to its route: 'offer_accept_42' -> 'offer_accept'"""
+    if not data:
+        return 'unknown'
+    tokens = []
+    for token in data.split('_'):
+        # Ids and draft ids (short uuid hex) contain digits; stop at the first one
+        if _ID_TOKEN.search(token):
+            break
+        tokens.append(token)
+    return '_'.join(tokens) or 'unknown'
+
+
+def update_route(update):
+    callback_query = getattr(update, 'callback_query', None)
+    if callback_query is not None:
+        return callback_route(callback_query.data)
+    message = getattr(update, 'effective_message', None)
+    text = getattr(message, 'text', None) or ''
+    if text.startswith('/'):
+        return text.split()[0].split('@')[0].lstrip('/')
+    if message is not None and (message.photo or message.video):
+        return 'media'
+    return 'text'
+
+
+# Per-update DB statistics
+_update_db_stats = contextvars.ContextVar('bot_update_db_stats', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERIES.inc()
+        stats = _update_db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - started
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install_db_instrumentation():
+    """Count queries on every DB connection opened from now on"""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_on_connection_created, dispatch_uid='bot_metrics_db')
+    for connection in connections.all():
+        _on_connection_created(None, connection)
+
+
+def instrument_handler(handler_name, callback):
+    """Wrap a python-telegram-bot handler callback with latency and DB metrics"""
+    @wraps(callback)
+    async def wrapper(update, context):
+        route = update_route(update)
+        stats = [0, 0.0]
+        token = _update_db_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=handler_name, route=route)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=handler_name, route=route)
+            UPDATES.inc(handler=handler_name)
+            UPDATE_DB_QUERIES.observe(stats[0], handler=handler_name)
+            UPDATE_DB_SECONDS.observe(stats[1], handler=handler_name)
+            _update_db_stats.reset(token)
+    return wrapper
+
+
+# Telegram API calls
+def telegram_error_class(status_code, description=''):
+    """Classify a failed Bot API call"""
+    description = (description or '').lower()
+    if status_code == 429:
+        return 'rate_limited'
+    if 'chat not found' in description:
+        return 'chat_not_found'
+    if status_code == 403:
+        return 'forbidden'
+    if 'message is not modified' in description:
+        return 'not_modified'
+    return f'http_{status_code}'
+
+
+def observe_telegram_call(method, seconds, status_code=200, description=''):
+    TELEGRAM_API_LATENCY.observe(seconds, method=method)
+    if status_code is None:
+        TELEGRAM_API_ERRORS.inc(method=method, error='network')
+    elif status_code >= 400:
+        TELEGRAM_API_ERRORS.inc(method=method, error=telegram_error_class(status_code, description))
+
+
+def _instrumented_request_class():
+    from telegram.request import HTTPXRequest
+
+    class InstrumentedHTTPXRequest(HTTPXRequest):
+        """HTTPXRequest that records Bot API latency and error classes (and feeds the message log)"""
+
+        __slots__ = ('_observe_metrics', '_log_messages')
+
+        def __init__(self, *args, observe_metrics=True, log_messages=False, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._observe_metrics = observe_metrics
+            self._log_messages = log_messages
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None):
+            api_method = url.rsplit('/', 1)[-1]
+            started = time.perf_counter()
+            try:
+                status_code, content = await super().do_request(
+                    url, method, request_data=request_data, read_timeout=read_timeout,
+                    write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+                )
+            except Exception:
+                if self._observe_metrics:
+                    observe_telegram_call(api_method, time.perf_counter() - started, None)
+                raise
+            if self._observe_metrics:
+                description = ''
+                if status_code >= 400:
+                    try:
+                        description = json.loads(content).get('description', '')
+                    except (ValueError, AttributeError):
+                        pass
+                observe_telegram_call(api_method, time.perf_counter() - started, status_code, description)
+            if self._log_messages:
+                from . import message_log
+                message_log.record_api_call(
+                    api_method, request_data.parameters if request_data else {}, status_code, content
+                )
+            return status_code, content
+
+    return InstrumentedHTTPXRequest
+
+
+def instrumented_request(connection_pool_size=256, **kwargs):
+    """Bot API request object for ApplicationBuilder.request()
+
+    ``observe_metrics`` and ``log_messages`` pick what is recorded per call.
+    """
+    return _instrumented_request_class()(connection_pool_size=connection_pool_size, **kwargs)
+
+
+# Event loop lag
+async def monitor_event_loop_lag(interval=1.0):
+    """Measure how late the loop wakes us up; runs until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+
+# Exposition for processes without Django's HTTP stack (the polling bot)
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0].rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, addr='0.0.0.0'):
+    """Serve /metrics from a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((addr, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"📈 Metrics server listening on {addr}:{server.server_address[1]}/metrics")
+    return server
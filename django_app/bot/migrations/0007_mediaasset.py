@@ -0,0 +1,87 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_media_assets(apps, schema_editor):
+    """Create MediaAsset rows from the existing media_files JSON fields"""
+    Request = apps.get_model('bot', 'Request')
+    RequestItem = apps.get_model('bot', 'RequestItem')
+    MediaAsset = apps.get_model('bot', 'MediaAsset')
+
+    def build(request_id, media, item_id=None):
+        media_type = media.get('type', 'photo')
+        file_id = media['file_id']
+        return MediaAsset(
+            request_id=request_id,
+            request_item_id=item_id,
+            media_type=media_type,
+            file_id=file_id,
+            file_unique_id=media.get('file_unique_id') or file_id,
+            thumb_file_id=media.get('thumb_file_id') or (file_id if media_type == 'photo' else ''),
+            file_size=media.get('file_size'),
+            width=media.get('width'),
+            height=media.get('height'),
+            thumbnail_status='pending' if media_type == 'photo' else 'not_applicable',
+        )
+
+    # Flushed every BATCH_SIZE assets so memory stays flat on large tables; the
+    # unique (request, file_unique_id) constraint drops repeats (ignore_conflicts),
+    # and item media is inserted first so it wins over the same file on the request
+    batch_size = 500
+    batch = []
+
+    def add(asset):
+        batch.append(asset)
+        if len(batch) >= batch_size:
+            flush()
+
+    def flush():
+        MediaAsset.objects.bulk_create(batch, ignore_conflicts=True)
+        batch.clear()
+
+    for item in RequestItem.objects.exclude(media_files=[]).only('id', 'request_id', 'media_files').iterator(chunk_size=batch_size):
+        for media in item.media_files or []:
+            if media.get('file_id'):
+                add(build(item.request_id, media, item.id))
+    for request in Request.objects.exclude(media_files=[]).only('id', 'media_files').iterator(chunk_size=batch_size):
+        for media in request.media_files or []:
+            if media.get('file_id'):
+                add(build(request.id, media))
+    flush()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_offeritem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_type', models.CharField(choices=[('photo', 'Photo'), ('video', 'Video')], default='photo', max_length=10)),
+                ('file_id', models.CharField(help_text='Telegram file_id of the original file', max_length=255)),
+                ('file_unique_id', models.CharField(help_text='Telegram file_unique_id used for deduplication', max_length=100)),
+                ('thumb_file_id', models.CharField(blank=True, help_text='Telegram file_id of a smaller photo size', max_length=255)),
+                ('file_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('thumbnail_status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed'), ('not_applicable', 'Not applicable')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_assets', to='bot.request')),
+                ('request_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='media_assets', to='bot.requestitem')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['request', 'media_type'], name='bot_media_request_type_idx'), models.Index(fields=['thumb_file_id'], name='bot_media_thumb_file_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mediaasset',
+            constraint=models.UniqueConstraint(fields=('request', 'file_unique_id'), name='unique_media_per_request'),
+        ),
+        migrations.RunPython(backfill_media_assets, migrations.RunPython.noop),
+    ]
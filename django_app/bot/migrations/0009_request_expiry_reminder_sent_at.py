@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_changelogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='expiry_reminder_sent_at',
+            field=models.DateTimeField(blank=True, help_text="When the 'expiring soon' reminder was sent", null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_request_expiry_reminder_sent_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='junkyard',
+            index=models.Index(fields=['city', 'is_active'], name='bot_junkyard_city_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['request', 'status'], name='bot_offer_request_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['request'], name='bot_offer_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['status'], name='bot_request_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['city', '-created_at'], name='bot_request_city_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['user', '-created_at'], name='bot_request_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['expires_at'], name='bot_request_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('status__in', ['new', 'active'])), fields=['expires_at'], name='bot_request_open_expires_idx'),
+        ),
+    ]
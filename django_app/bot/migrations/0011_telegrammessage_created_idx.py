@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='telegrammessage',
+            index=models.Index(fields=['created_at'], name='bot_tgmessage_created_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:20
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0011_telegrammessage_created_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='junkyardrating',
+            name='request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ratings', to='bot.request'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.CharField(max_length=20, unique=True)),
+                ('original_id', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('new', 'New'), ('active', 'Active'), ('accepted', 'Accepted'), ('expired', 'Expired'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('created_at', models.DateTimeField(help_text='When the original request was created')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Snapshot of the request and its related rows')),
+                ('city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bot.city')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='bot_archived_user_created_idx')],
+            },
+        ),
+    ]
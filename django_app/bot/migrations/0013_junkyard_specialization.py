@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_archived_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='junkyard',
+            name='brands',
+            field=models.ManyToManyField(blank=True, help_text='Makes the junkyard stocks (empty = all makes)', related_name='junkyards', to='bot.brand'),
+        ),
+        migrations.CreateModel(
+            name='JunkyardSpecialization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('declared', models.BooleanField(default=False)),
+                ('offers_count', models.PositiveIntegerField(default=0)),
+                ('accepted_count', models.PositiveIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.brand')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.city')),
+                ('junkyard', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='specializations', to='bot.junkyard')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['city', 'brand', '-score'], name='bot_jyspec_city_brand_idx')],
+                'unique_together': {('junkyard', 'brand')},
+            },
+        ),
+    ]
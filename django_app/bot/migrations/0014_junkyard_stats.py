@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_junkyard_specialization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JunkyardStats',
+            fields=[
+                ('junkyard', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='bot.junkyard')),
+                ('requests_received', models.PositiveIntegerField(default=0)),
+                ('offers_made', models.PositiveIntegerField(default=0)),
+                ('offers_accepted', models.PositiveIntegerField(default=0)),
+                ('last_notified_at', models.DateTimeField(blank=True, null=True)),
+                ('last_offer_at', models.DateTimeField(blank=True, null=True)),
+                ('median_response_seconds', models.FloatField(blank=True, help_text='Estimated median time from request to offer', null=True)),
+                ('response_estimator', models.JSONField(blank=True, default=dict, help_text='Streaming median estimator state')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
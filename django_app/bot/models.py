@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from datetime import timedelta
 import json
@@ -64,6 +65,9 @@ class Junkyard(models.Model):
     location = models.TextField(help_text="Location description or Google Maps link")
     is_active = models.BooleanField(default=True)
     is_verified = models.BooleanField(default=False)
+    brands = models.ManyToManyField(
+        Brand, blank=True, related_name='junkyards', help_text="Makes the junkyard stocks (empty = all makes)"
+    )
     commission_percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     payment_url = models.URLField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -72,6 +76,11 @@ class Junkyard(models.Model):
     total_ratings = models.PositiveIntegerField(default=0)
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['city', 'is_active'], name='bot_junkyard_city_active_idx'),
+        ]
+    
     def update_rating(self):
         """Update average rating based on all ratings"""
         ratings = self.ratings.all()
@@ -111,6 +120,22 @@ class Request(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new')
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
+    expiry_reminder_sent_at = models.DateTimeField(null=True, blank=True, help_text="When the 'expiring soon' reminder was sent")
+    
+    OPEN_STATUSES = ('new', 'active')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='bot_request_status_idx'),
+            models.Index(fields=['city', '-created_at'], name='bot_request_city_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='bot_request_user_created_idx'),
+            models.Index(fields=['expires_at'], name='bot_request_expires_idx'),
+            # Partial index for the expiry scheduler and open-request feeds
+            models.Index(
+                fields=['expires_at'], name='bot_request_open_expires_idx',
+                condition=models.Q(status__in=['new', 'active']),
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.expires_at:
@@ -156,21 +181,27 @@ class Request(models.Model):
     def is_expired(self):
         return timezone.now() > self.expires_at
     
+    def _prefetched_items(self):
+        """The items loaded by prefetch_related('items'), or None"""
+        return getattr(self, '_prefetched_objects_cache', {}).get('items')
+    
     @property
     def has_items(self):
         """Check if request has individual items"""
-        return self.items.exists()
+        items = self._prefetched_items()
+        return bool(items) if items is not None else self.items.exists()
     
     @property
     def items_count(self):
         """Get count of individual items"""
-        return self.items.count()
+        items = self._prefetched_items()
+        return len(items) if items is not None else self.items.count()
     
     @property
     def all_parts_description(self):
-        """Get all parts as a combined description"""
-        if self.has_items:
-            items = self.items.all()
+        """Get all parts as a combined description (no query when items are prefetched)"""
+        items = self.items.all()
+        if items:
             parts_list = []
             for item in items:
                 parts_list.append(f"• {item.name}" + (f" - {item.description}" if item.description else ""))
@@ -192,7 +223,8 @@ class Request(models.Model):
         return sum(item.calculate_line_total() for item in self.items.all())
     
     def __str__(self):
-        parts_preview = self.all_parts_description[:50] if self.all_parts_description else "No items"
+        parts = self.all_parts_description
+        parts_preview = parts[:50] if parts else "No items"
         return f"{self.order_id} - {self.user.first_name} - {parts_preview}"
 
 
@@ -210,6 +242,11 @@ class RequestItem(models.Model):
     class Meta:
         ordering = ['created_at']
     
+    @property
+    def photos(self):
+        """Photo entries from media_files (used for dashboard thumbnails)"""
+        return [media for media in self.media_files or [] if media.get("type") == "photo"]
+    
     def calculate_line_total(self):
         """Calculate line total for this item (unit_price * quantity)"""
         unit_price = self.unit_price or 0
@@ -237,6 +274,14 @@ class Offer(models.Model):
     
     class Meta:
         unique_together = ('request', 'junkyard')
+        indexes = [
+            models.Index(fields=['request', 'status'], name='bot_offer_request_status_idx'),
+            # Partial index for pending offers (decision handling and reminders)
+            models.Index(
+                fields=['request'], name='bot_offer_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.request.order_id} - {self.junkyard.user.first_name} - {self.price}"
@@ -256,6 +301,83 @@ class OfferItem(models.Model):
         return f"{self.offer} - {self.request_item.name} - {self.price}"
 
 
+class MediaAsset(models.Model):
+    """Telegram media attached to a request or one of its items, one row per unique file"""
+    MEDIA_TYPES = (
+        ('photo', 'Photo'),
+        ('video', 'Video'),
+    )
+    THUMBNAIL_STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+        ('not_applicable', 'Not applicable'),
+    )
+    
+    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='media_assets')
+    request_item = models.ForeignKey(RequestItem, on_delete=models.CASCADE, null=True, blank=True, related_name='media_assets')
+    media_type = models.CharField(max_length=10, choices=MEDIA_TYPES, default='photo')
+    file_id = models.CharField(max_length=255, help_text="Telegram file_id of the original file")
+    file_unique_id = models.CharField(max_length=100, help_text="Telegram file_unique_id used for deduplication")
+    thumb_file_id = models.CharField(max_length=255, blank=True, help_text="Telegram file_id of a smaller photo size")
+    file_size = models.PositiveIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail_status = models.CharField(max_length=20, choices=THUMBNAIL_STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['request', 'file_unique_id'], name='unique_media_per_request'),
+        ]
+        indexes = [
+            models.Index(fields=['request', 'media_type'], name='bot_media_request_type_idx'),
+            models.Index(fields=['thumb_file_id'], name='bot_media_thumb_file_idx'),
+        ]
+    
+    @classmethod
+    def from_media_dict(cls, request, media, request_item=None):
+        """Build an unsaved asset from a legacy media_files entry"""
+        media_type = media.get("type", "photo")
+        file_id = media["file_id"]
+        return cls(
+            request=request,
+            request_item=request_item,
+            media_type=media_type,
+            file_id=file_id,
+            # Older entries have no file_unique_id; file_id is stable enough to dedupe those
+            file_unique_id=media.get("file_unique_id") or file_id,
+            thumb_file_id=media.get("thumb_file_id") or (file_id if media_type == 'photo' else ''),
+            file_size=media.get("file_size"),
+            width=media.get("width"),
+            height=media.get("height"),
+            thumbnail_status='pending' if media_type == 'photo' else 'not_applicable',
+        )
+    
+    @classmethod
+    def register_for_request(cls, request):
+        """
+        Create assets for a request's media_files and its items' media_files.
+        Duplicate files (same file_unique_id) are stored once per request.
+        """
+        assets = {}
+        for item in request.items.all():
+            for media in item.media_files or []:
+                if media.get("file_id"):
+                    asset = cls.from_media_dict(request, media, request_item=item)
+                    assets.setdefault(asset.file_unique_id, asset)
+        for media in request.media_files or []:
+            if media.get("file_id"):
+                asset = cls.from_media_dict(request, media)
+                assets.setdefault(asset.file_unique_id, asset)
+        
+        return cls.objects.bulk_create(assets.values(), ignore_conflicts=True)
+    
+    def __str__(self):
+        return f"{self.request_id} - {self.media_type} - {self.file_unique_id}"
+
+
 class Conversation(models.Model):
     """Chat conversations between clients and junkyards"""
     client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='client_conversations')
@@ -273,7 +395,8 @@ class JunkyardRating(models.Model):
     """Customer ratings for junkyards"""
     junkyard = models.ForeignKey(Junkyard, on_delete=models.CASCADE, related_name='ratings')
     client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_ratings')
-    request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='ratings')
+    # Null once the request is archived; the rating still counts for the junkyard
+    request = models.ForeignKey(Request, on_delete=models.SET_NULL, null=True, blank=True, related_name='ratings')
     rating = models.PositiveSmallIntegerField(choices=[(i, i) for i in range(1, 6)])
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -343,6 +466,42 @@ class SystemSetting(models.Model):
         return setting
 
 
+class ChangeLogEntry(models.Model):
+    """Append-only log of Request/Offer/Junkyard mutations; the id is the changes feed cursor"""
+    MODEL_CHOICES = (
+        ('request', 'Request'),
+        ('offer', 'Offer'),
+        ('junkyard', 'Junkyard'),
+    )
+    ACTION_CHOICES = (
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    )
+    
+    model_name = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='updated')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['model_name', 'id'], name='bot_changelog_model_id_idx'),
+        ]
+    
+    @classmethod
+    def record(cls, model_name, object_ids, action='updated'):
+        """Record a change for each object id (use after queryset.update(), which skips signals)"""
+        return cls.objects.bulk_create([
+            cls(model_name=model_name, object_id=object_id, action=action)
+            for object_id in object_ids
+        ])
+    
+    def __str__(self):
+        return f"#{self.id} {self.model_name}:{self.object_id} {self.action}"
+
+
 class TelegramMessage(models.Model):
     """Log of Telegram messages for debugging and analytics"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -351,5 +510,79 @@ class TelegramMessage(models.Model):
     content = models.JSONField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='bot_tgmessage_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user} - {self.message_type} - {self.created_at}"
+
+
+class ArchivedRequest(models.Model):
+    """Cold copy of a closed request with its items, offers, media and ratings (see bot.archive)"""
+    order_id = models.CharField(max_length=20, unique=True)
+    original_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_requests')
+    city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Request.STATUS_CHOICES)
+    created_at = models.DateTimeField(help_text="When the original request was created")
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder, help_text="Snapshot of the request and its related rows")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='bot_archived_user_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.order_id} (archived)"
+
+
+class JunkyardSpecialization(models.Model):
+    """Precomputed (city, brand) -> junkyard fan-out index, rebuilt by bot.matching"""
+    junkyard = models.ForeignKey(Junkyard, on_delete=models.CASCADE, related_name='specializations')
+    city = models.ForeignKey(City, on_delete=models.CASCADE)
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE)
+    declared = models.BooleanField(default=False)
+    offers_count = models.PositiveIntegerField(default=0)
+    accepted_count = models.PositiveIntegerField(default=0)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('junkyard', 'brand')
+        indexes = [
+            models.Index(fields=['city', 'brand', '-score'], name='bot_jyspec_city_brand_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.junkyard_id} - {self.brand_id} ({self.score:.1f})"
+
+
+class JunkyardStats(models.Model):
+    """Responsiveness counters kept up to date by bot.junkyard_stats on workflow events"""
+    junkyard = models.OneToOneField(Junkyard, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    requests_received = models.PositiveIntegerField(default=0)
+    offers_made = models.PositiveIntegerField(default=0)
+    offers_accepted = models.PositiveIntegerField(default=0)
+    last_notified_at = models.DateTimeField(null=True, blank=True)
+    last_offer_at = models.DateTimeField(null=True, blank=True)
+    median_response_seconds = models.FloatField(null=True, blank=True, help_text="Estimated median time from request to offer")
+    response_estimator = models.JSONField(default=dict, blank=True, help_text="Streaming median estimator state")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def acceptance_rate(self):
+        return self.offers_accepted / self.offers_made if self.offers_made else None
+    
+    @property
+    def response_rate(self):
+        return min(1.0, self.offers_made / self.requests_received) if self.requests_received else None
+    
+    @property
+    def median_response_minutes(self):
+        return self.median_response_seconds / 60 if self.median_response_seconds is not None else None
+    
+    def __str__(self):
+        return f"{self.junkyard_id}: {self.offers_made}/{self.requests_received}"
@@ -0,0 +1,154 @@
+"""
+Ranked offer comparison board for customers (the "view all offers" screen).
+
+All offers of a request are loaded with their junkyard, the junkyard's user,
+the request's car and an item count in one query, ranked server-side and
+rendered a page at a time.
+
+Ranking: accepted offers first, then pending, then the rest; within a status
+by a weighted score of
+
+- price: cheapest offer / this offer's price (1.0 for the cheapest)
+- rating: junkyard average rating / 5
+- verified: 1.0 for verified junkyards
+
+weighted by OFFER_RANK_PRICE_WEIGHT, OFFER_RANK_RATING_WEIGHT and
+OFFER_RANK_VERIFIED_WEIGHT.
+
+Rendered pages are cached per request *version*. Offer saves and deletes
+(signals) and accept/reject decisions (bot.offer_decisions) bump the
+version, so a new or changed offer shows up immediately. Rating changes and edits from
+other processes are picked up when OFFER_BOARD_CACHE_SECONDS expires.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Offer, Request
+
+STATUS_ORDER = {'accepted': 0, 'pending': 1}
+STATUS_EMOJI = {'accepted': '✅', 'pending': '⏳'}
+RANK_BADGES = {1: '🥇', 2: '🥈', 3: '🥉'}
+
+
+def _version_key(request_id):
+    return f"offer_board_version:{request_id}"
+
+
+def board_version(request_id):
+    # A fresh (or evicted) version starts from the clock so it can't match stale pages
+    cache.add(_version_key(request_id), int(time.time() * 1000), timeout=None)
+    return cache.get(_version_key(request_id))
+
+
+def bump_version(request_id):
+    """Invalidate every cached page of a request's board"""
+    try:
+        cache.incr(_version_key(request_id))
+    except ValueError:
+        board_version(request_id)
+
+
+def ranking_weights():
+    return {
+        'price': getattr(settings, 'OFFER_RANK_PRICE_WEIGHT', 0.6),
+        'rating': getattr(settings, 'OFFER_RANK_RATING_WEIGHT', 0.3),
+        'verified': getattr(settings, 'OFFER_RANK_VERIFIED_WEIGHT', 0.1),
+    }
+
+
+def load_offers(request_id, user):
+    """A customer's offers for one request, with everything the board shows, in one query"""
+    return list(
+        Offer.objects.filter(request_id=request_id, request__user=user)
+        .select_related('junkyard__user', 'request__brand', 'request__model')
+        .annotate(items_count=Count('items'))
+    )
+
+
+def score_offer(offer, cheapest, weights):
+    price_score = float(cheapest / offer.price) if offer.price else 0.0
+    rating_score = float(offer.junkyard.average_rating or 0) / 5
+    verified_score = 1.0 if offer.junkyard.is_verified else 0.0
+    return (
+        weights['price'] * price_score
+        + weights['rating'] * rating_score
+        + weights['verified'] * verified_score
+    )
+
+
+def rank_offers(offers, weights=None):
+    """Offers in board order"""
+    weights = weights or ranking_weights()
+    prices = [offer.price for offer in offers if offer.price]
+    cheapest = min(prices) if prices else 0
+    return sorted(
+        offers,
+        key=lambda offer: (
+            STATUS_ORDER.get(offer.status, 2),
+            -score_offer(offer, cheapest, weights),
+            offer.price or 0,
+            offer.id,
+        ),
+    )
+
+
+def render_page(request, ranked, page, page_size):
+    """(text, button rows) for one page; buttons are (label, callback_data) pairs"""
+    pages = max(1, -(-len(ranked) // page_size))
+    page = min(max(1, page), pages)
+    start = (page - 1) * page_size
+
+    message = "💰 **مقارنة العروض لطلبك**\n\n"
+    message += f"🆔 رقم الطلب: {request.order_id}\n"
+    message += f"🚗 السيارة: {request.brand.name} {request.model.name} {request.year}\n"
+    message += f"📊 عدد العروض: {len(ranked)} (مرتبة حسب السعر والتقييم والتوثيق)\n\n"
+
+    buttons = []
+    open_request = request.status in Request.OPEN_STATUSES
+    for rank, offer in enumerate(ranked[start:start + page_size], start + 1):
+        junkyard = offer.junkyard
+        badge = RANK_BADGES.get(rank, f"{rank}.")
+        message += f"{badge} {STATUS_EMOJI.get(offer.status, '❌')} **{junkyard.user.first_name}**"
+        message += " ☑️ موثق\n" if junkyard.is_verified else "\n"
+        message += f"💰 السعر: {offer.price} ريال"
+        if offer.items_count:
+            message += f" ({offer.items_count} قطعة)"
+        message += f"\n⭐ التقييم: {junkyard.average_rating:.1f}/5 ({junkyard.total_ratings} تقييم)\n"
+        message += f"📍 الموقع: {junkyard.location}\n"
+        if offer.delivery_time:
+            message += f"🚚 مدة التوريد: {offer.delivery_time}\n"
+        message += f"📅 تاريخ العرض: {offer.created_at.strftime('%Y-%m-%d %H:%M')}\n\n"
+
+        if open_request and offer.status == 'pending':
+            buttons.append([(f"✅ قبول العرض {rank} - {offer.price} ريال", f"offer_accept_{offer.id}")])
+
+    if pages > 1:
+        message += f"📄 الصفحة {page} من {pages}"
+        nav = []
+        if page > 1:
+            nav.append(("◀️ السابق", f"view_all_offers_{request.id}_{page - 1}"))
+        if page < pages:
+            nav.append(("التالي ▶️", f"view_all_offers_{request.id}_{page + 1}"))
+        buttons.append(nav)
+    buttons.append([("🔙 رجوع", "back_to_main")])
+    return message, buttons
+
+
+def get_board(request_id, user, page=1):
+    """Cached (text, button rows) for a page of the board; None when there are no offers"""
+    page_size = getattr(settings, 'OFFER_BOARD_PAGE_SIZE', 5)
+    key = f"offer_board:{request_id}:{user.id}:{board_version(request_id)}:{page}"
+    board = cache.get(key)
+    if board is not None:
+        return board
+
+    offers = load_offers(request_id, user)
+    if not offers:
+        return None
+    board = render_page(offers[0].request, rank_offers(offers), page, page_size)
+    cache.set(key, board, getattr(settings, 'OFFER_BOARD_CACHE_SECONDS', 300))
+    return board
@@ -0,0 +1,90 @@
+"""
+Race-free accept/reject transitions for offers.
+
+Each decision is one transaction of conditional UPDATEs, so the database
+decides who wins instead of a check-then-save in Python:
+
+accept
+    1. UPDATE request SET status='accepted' WHERE id=? AND status IN
+       Request.OPEN_STATUSES: the row lock makes a second, concurrent accept
+       wait and then match nothing, and accepted, cancelled or expired
+       requests never match
+    2. UPDATE offer SET status='accepted' WHERE id=? AND status='pending'
+    3. UPDATE offer SET status='locked' WHERE request_id=? AND
+       status='pending' RETURNING id
+    4. one INSERT of changes-feed entries (update() skips the signals)
+
+reject
+    UPDATE offer SET status='rejected' WHERE id=? AND status='pending',
+    plus its changes-feed entry
+
+A decision that lost (offer no longer pending, request no longer open)
+changes nothing and returns False.
+"""
+
+from django.db import connection, transaction
+
+from . import offer_board
+from .models import ChangeLogEntry, Offer, Request
+
+
+def _supports_update_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _lock_other_offers(request_id, accepted_offer_id):
+    """Lock the request's other pending offers; returns their ids"""
+    if _supports_update_returning():
+        table = connection.ops.quote_name(Offer._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET status = %s WHERE request_id = %s AND status = %s AND id <> %s RETURNING id",
+                ['locked', request_id, 'pending', accepted_offer_id],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    # No UPDATE ... RETURNING: lock the rows, then update exactly those
+    others = Offer.objects.filter(request_id=request_id, status='pending').exclude(id=accepted_offer_id)
+    locked_ids = list(others.select_for_update().values_list('id', flat=True))
+    Offer.objects.filter(id__in=locked_ids).update(status='locked')
+    return locked_ids
+
+
+def accept(offer):
+    """Accept ``offer`` and lock its siblings; returns (applied, locked offer ids)"""
+    with transaction.atomic():
+        claimed = Request.objects.filter(
+            id=offer.request_id, status__in=Request.OPEN_STATUSES
+        ).update(status='accepted')
+        if not claimed:
+            return False, []
+        if not Offer.objects.filter(id=offer.id, status='pending').update(status='accepted'):
+            transaction.set_rollback(True)
+            return False, []
+        locked_ids = _lock_other_offers(offer.request_id, offer.id)
+
+        ChangeLogEntry.objects.bulk_create(
+            [ChangeLogEntry(model_name='request', object_id=offer.request_id, action='updated')]
+            + [ChangeLogEntry(model_name='offer', object_id=offer_id, action='updated')
+               for offer_id in [offer.id, *locked_ids]]
+        )
+
+    offer_board.bump_version(offer.request_id)
+    offer.status = 'accepted'
+    if Offer.request.is_cached(offer):
+        offer.request.status = 'accepted'
+    return True, locked_ids
+
+
+def reject(offer):
+    """Reject ``offer`` if it is still pending; returns whether it was"""
+    with transaction.atomic():
+        if not Offer.objects.filter(id=offer.id, status='pending').update(status='rejected'):
+            return False
+        ChangeLogEntry.record('offer', [offer.id])
+
+    offer_board.bump_version(offer.request_id)
+    offer.status = 'rejected'
+    return True
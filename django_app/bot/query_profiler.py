@@ -0,0 +1,250 @@
+"""
+Opt-in per-update SQL profiler and N+1 detector.
+
+Each bot update (and each dashboard request, through the middleware) runs
+inside a profile scope held in a context variable. A connection execute
+wrapper counts every statement in the active scope. When the scope closes,
+statements are grouped by normalized shape (literals and IN lists
+collapsed). Any shape repeated QUERY_PROFILER_REPEAT_THRESHOLD times or
+more is reported as a likely N+1, and scopes over QUERY_PROFILER_BUDGET
+queries are reported as over budget.
+
+Findings are logged with the handler or view name (at most once per
+QUERY_PROFILER_LOG_INTERVAL seconds for the same finding), counted in
+/metrics, and aggregated in memory for ``worst_offenders()``.
+
+Enable with QUERY_PROFILER_ENABLED=True; it costs nothing when disabled.
+"""
+
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_OFFENDERS = 500
+
+REPEATED_QUERIES = metrics.REGISTRY.counter(
+    'bot_query_repeated_shapes_total', 'Statement shapes repeated past the N+1 threshold', ['scope']
+)
+BUDGET_EXCEEDED = metrics.REGISTRY.counter(
+    'bot_query_budget_exceeded_total', 'Updates or requests over the query budget', ['scope']
+)
+
+_active_profile = contextvars.ContextVar('bot_query_profile', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w."])\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\([^()]*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def enabled():
+    return getattr(settings, 'QUERY_PROFILER_ENABLED', False)
+
+
+def normalize_sql(sql):
+    """Collapse literals so statements differing only in values share a shape"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """Statements executed within one update or request"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._seconds = Counter()
+
+    def record(self, sql, seconds):
+        with self._lock:
+            self._counts[sql] += 1
+            self._seconds[sql] += seconds
+
+    @property
+    def total(self):
+        return sum(self._counts.values())
+
+    def shapes(self):
+        """[(shape, count, seconds)] most repeated first"""
+        counts, seconds = Counter(), Counter()
+        with self._lock:
+            for sql, count in self._counts.items():
+                shape = normalize_sql(sql)
+                counts[shape] += count
+                seconds[shape] += self._seconds[sql]
+        return [(shape, count, seconds[shape]) for shape, count in counts.most_common()]
+
+
+class _Findings:
+    """Aggregated offenders plus log de-duplication"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._offenders = {}
+        self._last_logged = {}
+
+    def add(self, scope, shape, count, seconds):
+        with self._lock:
+            entry = self._offenders.get((scope, shape))
+            if entry is None:
+                if len(self._offenders) >= MAX_OFFENDERS:
+                    smallest = min(self._offenders, key=lambda key: self._offenders[key]['queries'])
+                    del self._offenders[smallest]
+                entry = self._offenders[(scope, shape)] = {
+                    'scope': scope, 'shape': shape, 'occurrences': 0, 'queries': 0, 'max_repeats': 0, 'seconds': 0.0,
+                }
+            entry['occurrences'] += 1
+            entry['queries'] += count
+            entry['max_repeats'] = max(entry['max_repeats'], count)
+            entry['seconds'] += seconds
+
+    def should_log(self, key):
+        interval = getattr(settings, 'QUERY_PROFILER_LOG_INTERVAL', 300)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_logged.get(key)
+            if last is not None and now - last < interval:
+                return False
+            self._last_logged[key] = now
+            return True
+
+    def worst(self, limit):
+        with self._lock:
+            entries = [dict(entry) for entry in self._offenders.values()]
+        return sorted(entries, key=lambda entry: entry['queries'], reverse=True)[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._offenders.clear()
+            self._last_logged.clear()
+
+
+_findings = _Findings()
+
+
+def worst_offenders(limit=20):
+    """Repeated statement shapes seen so far, by total queries"""
+    return _findings.worst(limit)
+
+
+def reset():
+    _findings.clear()
+
+
+def log_worst_offenders(limit=10):
+    for entry in worst_offenders(limit):
+        logger.warning(
+            f"🔁 {entry['scope']}: {entry['queries']} queries in {entry['occurrences']} runs "
+            f"(max {entry['max_repeats']}×) - {entry['shape'][:300]}"
+        )
+
+
+def _report(profile):
+    threshold = getattr(settings, 'QUERY_PROFILER_REPEAT_THRESHOLD', 5)
+    budget = getattr(settings, 'QUERY_PROFILER_BUDGET', 50)
+    total = profile.total
+
+    for shape, count, seconds in profile.shapes():
+        if count < threshold:
+            break
+        REPEATED_QUERIES.inc(scope=profile.name)
+        _findings.add(profile.name, shape, count, seconds)
+        if _findings.should_log((profile.name, shape)):
+            logger.warning(
+                f"🔁 Possible N+1 in {profile.name}: {count}× ({seconds * 1000:.1f}ms) {shape[:300]}"
+            )
+
+    if budget and total > budget:
+        BUDGET_EXCEEDED.inc(scope=profile.name)
+        if _findings.should_log((profile.name, None)):
+            logger.warning(f"📊 {profile.name} ran {total} queries (budget {budget})")
+
+
+class profile_scope:
+    """Context manager profiling the statements run inside it"""
+
+    def __init__(self, name):
+        self.profile = QueryProfile(name)
+
+    def __enter__(self):
+        self._token = _active_profile.set(self.profile)
+        return self.profile
+
+    def __exit__(self, *exc_info):
+        _active_profile.reset(self._token)
+        try:
+            _report(self.profile)
+        except Exception as e:
+            logger.error(f"❌ Query profiler report failed: {e}")
+
+
+# Connection instrumentation
+def _profile_query(execute, sql, params, many, context):
+    profile = _active_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record(sql, time.perf_counter() - started)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+def install():
+    """Profile statements on every DB connection opened from now on"""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_on_connection_created, dispatch_uid='bot_query_profiler')
+    for connection in connections.all():
+        _on_connection_created(None, connection)
+
+
+# Entry points
+def profile_handler(handler_name, callback):
+    """Wrap a python-telegram-bot handler callback in a profile scope"""
+    @wraps(callback)
+    async def wrapper(update, context):
+        with profile_scope(f"{handler_name}:{metrics.update_route(update)}"):
+            return await callback(update, context)
+    return wrapper
+
+
+class QueryProfilerMiddleware:
+    """Profile each dashboard/API request (removed from the chain when disabled)"""
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        scope = profile_scope(f"{request.method} {request.path}")
+        with scope:
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            if match and match.view_name:
+                # Name the scope by view so paths with ids aggregate together
+                scope.profile.name = f"{request.method} {match.view_name}"
+        return response
@@ -8,10 +8,10 @@ from typing import List, Optional
 from django.utils import timezone
 from django.db import transaction
 from django.contrib.auth import get_user_model
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from asgiref.sync import sync_to_async
 
-from .models import Request, Junkyard, Offer, JunkyardStaff
+from . import junkyard_stats, matching, metrics, offer_decisions
+from .models import Request, Junkyard, Offer, JunkyardStaff, MediaAsset
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -21,7 +21,7 @@ class OrderWorkflowService:
     """
     Service class to handle the complete order workflow:
     1. Customer places and confirms order
-    2. Order sent to all suppliers in city
+    2. Order sent to the city's suppliers for the make (see bot.matching)
     3. Suppliers respond with prices
     4. Prices sent back to customer
     5. Customer can accept/reject offers
@@ -78,7 +78,8 @@ class OrderWorkflowService:
     
     async def notify_all_junkyards(self, request: Request):
         """
-        Send notification to all active junkyards in the same city as the request
+        Send notification to the active junkyards in the request's city that
+        serve its make (every active junkyard in the city when too few do)
         """
         try:
             logger.info(
@@ -86,8 +87,9 @@ class OrderWorkflowService:
                 f"in {request.city.name}"
             )
             
-            # Get all active junkyards in the city
-            junkyards = await self._get_active_junkyards_in_city(request.city.id)
+            # Brand specialists plus generalists, or the whole city (see bot.matching)
+            junkyards, mode = await sync_to_async(matching.recipients_for)(request)
+            metrics.ORDER_FANOUT.observe(len(junkyards))
             
             if not junkyards:
                 logger.warning(
@@ -96,8 +98,7 @@ class OrderWorkflowService:
                 return
             
             logger.info(
-                f"[INFO] Found {len(junkyards)} active junkyards "
-                f"in {request.city.name}"
+                "[INFO] Found %s %s junkyards in %s", len(junkyards), mode, request.city.name
             )
             
             # Prepare the notification message
@@ -110,6 +111,7 @@ class OrderWorkflowService:
             # Send notifications to all junkyards
             success_count = 0
             failed_count = 0
+            notified_ids = []
             
             for junkyard in junkyards:
                 try:
@@ -121,12 +123,14 @@ class OrderWorkflowService:
                         await self._send_photos_to_junkyard(junkyard, photos_to_send)
                     
                     success_count += 1
-                    logger.info(f"[SUCCESS] Notified junkyard {junkyard.user.first_name}")
+                    notified_ids.append(junkyard.id)
+                    logger.debug("[SUCCESS] Notified junkyard %s", junkyard.user.first_name)
                 except Exception as e:
                     failed_count += 1
                     logger.error(f"[ERROR] Failed to notify junkyard {junkyard.user.first_name}: {e}")
             
             logger.info(f"[STATS] Notification results: {success_count} successful, {failed_count} failed")
+            await self._record_stats(junkyard_stats.record_notified, notified_ids)
             
         except Exception as e:
             logger.error(f"[ERROR] Error notifying junkyards for order {request.order_id}: {e}")
@@ -139,6 +143,8 @@ class OrderWorkflowService:
         try:
             logger.info(f"[MONEY] Processing new offer from {offer.junkyard.user.first_name} for order {offer.request.order_id}")
             
+            await self._record_stats(junkyard_stats.record_offer, offer)
+            
             # Send offer notification to customer
             await self.notify_customer_about_offer(offer)
             
@@ -169,9 +175,12 @@ class OrderWorkflowService:
             logger.error(f"[ERROR] Error notifying customer about offer: {e}")
             raise
     
-    async def process_customer_offer_decision(self, offer: Offer, decision: str, customer_user: User):
+    async def process_customer_offer_decision(self, offer: Offer, decision: str, customer_user: User) -> bool:
         """
         Process customer's decision on an offer (accept/reject)
+        
+        Returns False, without notifying anyone, when the decision lost: the
+        offer was no longer pending or another offer was accepted first.
         """
         try:
             if decision not in ['accept', 'reject']:
@@ -179,12 +188,18 @@ class OrderWorkflowService:
             
             logger.info(f"[DIRECT_HIT] Processing customer decision '{decision}' for offer {offer.id}")
             
-            # Update offer status
-            new_status = 'accepted' if decision == 'accept' else 'rejected'
-            await self._update_offer_status(offer, new_status)
+            # Conditional status transition in one transaction (see bot.offer_decisions)
+            if decision == 'accept':
+                applied, locked_ids = await sync_to_async(offer_decisions.accept)(offer)
+            else:
+                applied = await sync_to_async(offer_decisions.reject)(offer)
+            
+            if not applied:
+                logger.info("[SKIP] Offer %s is no longer open, '%s' not applied", offer.id, decision)
+                return False
             
             if decision == 'accept':
-                await self._handle_offer_acceptance(offer)
+                await self._handle_offer_acceptance(offer, locked_ids)
             else:
                 await self._handle_offer_rejection(offer)
             
@@ -192,23 +207,23 @@ class OrderWorkflowService:
             await self._send_decision_confirmation_to_customer(offer, decision)
             
             logger.info(f"[SUCCESS] Successfully processed {decision} decision for offer {offer.id}")
+            return True
             
         except Exception as e:
             logger.error(f"[ERROR] Error processing customer decision: {e}")
             raise
     
-    async def _handle_offer_acceptance(self, offer: Offer):
+    async def _handle_offer_acceptance(self, offer: Offer, locked_ids: List[int]):
         """
-        Handle when customer accepts an offer
+        Handle when customer accepts an offer (statuses are already updated)
         """
-        # Update request status to accepted
-        await self._update_request_status(offer.request, 'accepted')
+        await self._record_stats(junkyard_stats.record_acceptance, offer)
         
         # Notify the junkyard about acceptance
         await self._notify_junkyard_about_acceptance(offer)
         
-        # Optionally reject other pending offers for the same request
-        await self._reject_other_offers_for_request(offer.request, offer.id)
+        # Tell the junkyards whose offers were locked
+        await self._notify_locked_offers(locked_ids)
     
     async def _handle_offer_rejection(self, offer: Offer):
         """
@@ -223,14 +238,12 @@ class OrderWorkflowService:
             logger.info(f"ℹ️ No more pending offers for request {offer.request.order_id}")
     
     # Helper methods
-    async def _get_active_junkyards_in_city(self, city_id: int) -> List[Junkyard]:
-        """Get all active junkyards in a specific city"""
-        
-        junkyards = await sync_to_async(list)(
-            Junkyard.objects.filter(city_id=city_id, is_active=True)
-            .select_related('user', 'city')
-        )
-        return junkyards
+    async def _record_stats(self, record, *args):
+        """Update junkyard responsiveness counters; never fails the workflow"""
+        try:
+            await sync_to_async(record)(*args)
+        except Exception as e:
+            logger.error("[ERROR] Failed to update junkyard stats: %s", e)
     
     async def _prepare_junkyard_notification_message(self, request: Request) -> str:
         """Prepare notification message for junkyards"""
@@ -256,6 +269,8 @@ class OrderWorkflowService:
     
     def _create_junkyard_action_keyboard(self, request: Request):
         """Create keyboard for junkyard actions"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
         keyboard = [
             [InlineKeyboardButton("[MONEY] إضافة عرض سعر", callback_data=f"offer_add_{request.id}")],
             [InlineKeyboardButton("📋 عرض تفاصيل الطلب", callback_data=f"request_details_{request.id}")]
@@ -263,26 +278,19 @@ class OrderWorkflowService:
         return InlineKeyboardMarkup(keyboard)
     
     async def _get_request_photos(self, request: Request) -> list:
-        """Get all photos from request items"""
-        from asgiref.sync import sync_to_async
+        """Get all photos from request items (one indexed query on MediaAsset)"""
         
-        photos = []
-        
-        # Check if request has items
-        has_items = await sync_to_async(lambda: request.items.exists())()
+        def get_photos():
+            return [
+                {"file_id": file_id, "item_name": item_name}
+                for file_id, item_name in MediaAsset.objects.filter(
+                    request_id=request.id,
+                    media_type='photo',
+                    request_item__isnull=False,
+                ).values_list('file_id', 'request_item__name')
+            ]
         
-        if has_items:
-            items = await sync_to_async(list)(request.items.all())
-            for item in items:
-                if item.media_files:
-                    for media in item.media_files:
-                        if media.get("type") == "photo":
-                            photos.append({
-                                "file_id": media.get("file_id"),
-                                "item_name": item.name
-                            })
-        
-        return photos
+        return await sync_to_async(get_photos)()
     
     async def _send_photos_to_junkyard(self, junkyard: Junkyard, photos: list):
         """Send photos to junkyard with captions"""
@@ -396,6 +404,8 @@ class OrderWorkflowService:
     
     def _create_customer_offer_keyboard(self, offer: Offer):
         """Create keyboard for customer offer decision"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
         keyboard = [
             [
                 InlineKeyboardButton("[SUCCESS] قبول العرض", callback_data=f"offer_accept_{offer.id}"),
@@ -456,6 +466,8 @@ class OrderWorkflowService:
     
     async def send_order_confirmation_to_customer(self, request: Request):
         """Send order confirmation to customer"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
         # Get parts description safely in async context
         parts_description = await self._get_request_parts_description(request)
         
@@ -483,6 +495,78 @@ class OrderWorkflowService:
         
         await self._send_message_to_customer(request.user, message, reply_markup)
     
+    async def notify_requests_expired(self, request_ids: List[int]):
+        """Tell customers their requests expired and junkyards with pending offers that they closed"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+        def load():
+            requests = list(Request.objects.filter(id__in=request_ids).select_related('user'))
+            offers = list(
+                Offer.objects.filter(request_id__in=request_ids, status='pending')
+                .select_related('request', 'junkyard__user')
+            )
+            return requests, offers
+        
+        requests, offers = await sync_to_async(load)()
+        
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🆕 طلب جديد", callback_data="new_request")],
+            [InlineKeyboardButton("📋 طلباتي", callback_data="my_requests")]
+        ])
+        for request in requests:
+            message = f"""
+⏰ انتهت صلاحية طلبك
+
+🆔 رقم الطلب: {request.order_id}
+
+💡 يمكنك إنشاء طلب جديد في أي وقت.
+            """
+            try:
+                await self._send_message_to_customer(request.user, message.strip(), keyboard)
+            except Exception as e:
+                logger.warning(f"Failed to notify customer about expired request {request.order_id}: {e}")
+        
+        for offer in offers:
+            message = f"""
+⏰ انتهت صلاحية الطلب
+
+🆔 رقم الطلب: {offer.request.order_id}
+💰 عرضك: {offer.price} ريال
+
+ℹ️ لم يعد الطلب يستقبل عروضاً.
+            """
+            try:
+                await self._send_message_to_junkyard(offer.junkyard, message.strip())
+            except Exception as e:
+                logger.warning(f"Failed to notify junkyard {offer.junkyard_id} about expired request: {e}")
+        
+        logger.info(f"[STATS] Expiry notifications: {len(requests)} customers, {len(offers)} junkyard offers")
+    
+    async def notify_requests_expiring_soon(self, request_ids: List[int]):
+        """Remind customers that their requests are about to expire"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+        requests = await sync_to_async(list)(
+            Request.objects.filter(id__in=request_ids).select_related('user')
+        )
+        
+        for request in requests:
+            message = f"""
+⚠️ تنبيه: طلبك سينتهي قريباً!
+
+🆔 رقم الطلب: {request.order_id}
+⏰ ينتهي في: {timezone.localtime(request.expires_at).strftime('%Y-%m-%d %H:%M')}
+
+📋 راجع العروض المستلمة قبل انتهاء الطلب.
+            """
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("📋 عرض جميع العروض", callback_data=f"view_all_offers_{request.id}")]
+            ])
+            try:
+                await self._send_message_to_customer(request.user, message.strip(), keyboard)
+            except Exception as e:
+                logger.warning(f"Failed to send expiry reminder for {request.order_id}: {e}")
+    
     # Database helper methods
     async def _update_request_status(self, request: Request, status: str):
         """Update request status"""
@@ -493,13 +577,6 @@ class OrderWorkflowService:
             f"[UPDATE] Updated request {request.order_id} status to {status}"
         )
     
-    async def _update_offer_status(self, offer: Offer, status: str):
-        """Update offer status"""
-        
-        offer.status = status
-        await sync_to_async(offer.save)(update_fields=['status'])
-        logger.info(f"[UPDATE] Updated offer {offer.id} status to {status}")
-    
     async def _get_offer_count_for_request(self, request: Request) -> int:
         """Get number of offers for a request"""
         
@@ -512,21 +589,14 @@ class OrderWorkflowService:
             request.offers.filter(status='pending').select_related('junkyard__user')
         )
     
-    async def _reject_other_offers_for_request(self, request: Request, accepted_offer_id: int):
-        """Lock all other offers for a request when one is accepted"""
-        
-        # Update all other pending offers to 'locked' status to prevent acceptance  
-        def update_offers():
-            return request.offers.exclude(id=accepted_offer_id).filter(status='pending').update(status='locked')
-        
-        await sync_to_async(update_offers)()
-        
-        # Get the locked offers to notify junkyards
-        def get_locked_offers():
-            return list(request.offers.filter(status='locked').exclude(id=accepted_offer_id))
-        
-        locked_offers = await sync_to_async(get_locked_offers)()
+    async def _notify_locked_offers(self, offer_ids: List[int]):
+        """Notify the junkyards whose offers were locked by an acceptance"""
+        if not offer_ids:
+            return
         
+        locked_offers = await sync_to_async(list)(
+            Offer.objects.filter(id__in=offer_ids).select_related('junkyard__user', 'request__user')
+        )
         for offer in locked_offers:
             await self._notify_junkyard_about_rejection(offer, is_auto_rejection=True)
     
@@ -540,6 +610,8 @@ class OrderWorkflowService:
     
     async def _notify_junkyard_about_acceptance(self, offer: Offer):
         """Notify junkyard that their offer was accepted"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
         # Get parts description
         parts_description = await self._get_request_parts_description(offer.request)
         
@@ -618,6 +690,8 @@ class OrderWorkflowService:
     
     async def _send_decision_confirmation_to_customer(self, offer: Offer, decision: str):
         """Send confirmation to customer about their decision"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
         if decision == 'accept':
             # Get parts description
             parts_description = await self._get_request_parts_description(offer.request)
@@ -0,0 +1,93 @@
+"""
+Signal handlers that feed the ChangeLogEntry table used by the changes API
+and the feed ETags, invalidate cached offer boards and keep the junkyard
+specialization index in step with declared makes.
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import matching, offer_board
+from .models import Brand, ChangeLogEntry, City, Junkyard, Model, Offer, Request, User
+
+TRACKED_MODELS = {
+    Request: 'request',
+    Offer: 'offer',
+    Junkyard: 'junkyard',
+}
+
+
+@receiver(post_save, sender=Request)
+@receiver(post_save, sender=Offer)
+@receiver(post_save, sender=Junkyard)
+def record_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return  # Fixture loading
+    ChangeLogEntry.objects.create(
+        model_name=TRACKED_MODELS[sender],
+        object_id=instance.pk,
+        action='created' if created else 'updated',
+    )
+
+
+# Rows whose feed entries show fields of another table: table -> (fields shown, [(model name, queryset, lookup)])
+RELATED_FEED_ROWS = {
+    User: (
+        {'first_name', 'telegram_id'},
+        [('request', Request.objects.filter(status__in=Request.OPEN_STATUSES), 'user'),
+         ('junkyard', Junkyard.objects.all(), 'user')],
+    ),
+    City: ({'name'}, [('junkyard', Junkyard.objects.all(), 'city')]),
+    Brand: ({'name'}, [('request', Request.objects.filter(status__in=Request.OPEN_STATUSES), 'brand')]),
+    Model: ({'name'}, [('request', Request.objects.filter(status__in=Request.OPEN_STATUSES), 'model')]),
+}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Model)
+def record_related_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Log the feed rows that show ``instance``'s fields as updated"""
+    fields, related = RELATED_FEED_ROWS[sender]
+    if raw or created or (update_fields is not None and not fields & set(update_fields)):
+        return  # e.g. last_login updates
+    for model_name, queryset, lookup in related:
+        object_ids = list(queryset.filter(**{lookup: instance}).values_list('id', flat=True))
+        if object_ids:
+            ChangeLogEntry.record(model_name, object_ids)
+
+
+@receiver(post_delete, sender=Request)
+@receiver(post_delete, sender=Offer)
+@receiver(post_delete, sender=Junkyard)
+def record_deleted(sender, instance, **kwargs):
+    ChangeLogEntry.objects.create(
+        model_name=TRACKED_MODELS[sender],
+        object_id=instance.pk,
+        action='deleted',
+    )
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def invalidate_offer_board(sender, instance, **kwargs):
+    offer_board.bump_version(instance.request_id)
+
+
+@receiver(post_save, sender=Request)
+def invalidate_request_board(sender, instance, raw=False, **kwargs):
+    # The request status decides whether the board shows accept buttons
+    if not raw:
+        offer_board.bump_version(instance.pk)
+
+
+@receiver(m2m_changed, sender=Junkyard.brands.through)
+def reindex_declared_brands(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        matching.rebuild_index([instance.pk])
+    else:
+        # Brand side: pk_set holds junkyard ids, except on clear
+        matching.rebuild_index(pk_set if action != 'post_clear' else None)
@@ -1,16 +1,22 @@
 import os
 import json
+import asyncio
 import logging
 import uuid
 import pickle
 from typing import Dict, Any
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.ext import (
+    Application, ApplicationHandlerStop, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes,
+    TypeHandler, filters,
+)
 from django.conf import settings
 from django.utils import timezone
 from asgiref.sync import sync_to_async
 from .models import User, City, Brand, Model, Request, Junkyard, Offer, Conversation, JunkyardRating
 from .database_utils import safe_sync_to_async, ensure_async_db_connection
+from .concurrency import PerUserUpdateProcessor
+from . import conversation_state, idempotency, message_log, metrics, offer_board, query_profiler
 from django.db import connection
 
 logger = logging.getLogger(__name__)
@@ -18,11 +24,12 @@ logger = logging.getLogger(__name__)
 class TelegramBot:
     def __init__(self):
         self.application = None
-        self.user_states = {}  # تخزين حالات المحادثة والمسودات للمستخدمين
         self.MAX_DRAFTS = 5  # الحد الأقصى لعدد المسودات لكل مستخدم
-        # Use a more reliable path for state file
-        import tempfile
-        self.states_file = os.path.join(tempfile.gettempdir(), "bot_user_states.pickle")
+        self.states_file = conversation_state.states_file_path()
+        # تخزين حالات المحادثة والمسودات للمستخدمين (idle users spill to disk, see bot.conversation_state)
+        self.user_states = conversation_state.StateStore(spill_dir=self.states_file + '.spill')
+        self.idempotency_file = self.states_file + '.idempotency'
+        self.idempotency = idempotency.IdempotencyCache()
         self.load_user_states()  # تحميل الحالات عند البدء
 
     async def safe_edit_message_text(self, query, text, reply_markup=None, parse_mode=None):
@@ -38,26 +45,52 @@ class TelegramBot:
         except Exception as e:
             if "Message is not modified" in str(e):
                 # Silently ignore this error as the message is already showing the correct content
-                logger.debug(f"Message not modified - content already displayed")
+                logger.debug("Message not modified - content already displayed")
                 pass
             else:
                 # Re-raise other exceptions
                 raise e
 
-    def setup_bot(self):
-        """Initialize the bot application"""
+    def setup_bot(self, concurrent_updates=None):
+        """Initialize the bot application
+
+        ``concurrent_updates`` overrides BOT_CONCURRENT_UPDATES for polled updates.
+        """
         if not settings.TELEGRAM_BOT_TOKEN:
             logger.error("TELEGRAM_BOT_TOKEN not found in settings")
             return None
         
         try:
-            self.application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).build()
-            
-            # Add handlers
-            self.application.add_handler(CommandHandler("start", self.start_command))
-            self.application.add_handler(CallbackQueryHandler(self.button_callback))
-            self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
-            self.application.add_handler(MessageHandler(filters.PHOTO | filters.VIDEO, self.handle_media))
+            builder = (
+                Application.builder()
+                .token(settings.TELEGRAM_BOT_TOKEN)
+                .base_url(settings.TELEGRAM_API_BASE_URL)
+                .post_init(self._post_init)
+                .post_shutdown(self._post_shutdown)
+            )
+            if metrics.enabled() or message_log.enabled():
+                builder = builder.request(metrics.instrumented_request(
+                    observe_metrics=metrics.enabled(), log_messages=message_log.enabled(),
+                ))
+            if concurrent_updates is None:
+                concurrent_updates = getattr(settings, 'BOT_CONCURRENT_UPDATES', 1)
+            if concurrent_updates > 1:
+                builder = builder.concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+            self.application = builder.build()
+            
+            def timed(name, callback):
+                if query_profiler.enabled():
+                    callback = query_profiler.profile_handler(name, callback)
+                return metrics.instrument_handler(name, callback) if metrics.enabled() else callback
+            
+            # Add handlers (every update is audited, redelivered ones are then dropped before any handler runs)
+            if message_log.enabled():
+                self.application.add_handler(TypeHandler(Update, message_log.record_update), group=-2)
+            self.application.add_handler(TypeHandler(Update, self.drop_duplicate_update), group=-1)
+            self.application.add_handler(CommandHandler("start", timed("start", self.start_command)))
+            self.application.add_handler(CallbackQueryHandler(timed("callback", self.button_callback)))
+            self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed("message", self.handle_message)))
+            self.application.add_handler(MessageHandler(filters.PHOTO | filters.VIDEO, timed("media", self.handle_media)))
             
             logger.info("Bot application setup successfully")
             return self.application
@@ -65,6 +98,66 @@ class TelegramBot:
             logger.error(f"Error setting up bot: {e}")
             return None
     
+    async def _post_init(self, application):
+        """Called by run_polling/run_webhook once the application is initialized"""
+        await self.start_background_tasks()
+    
+    async def _post_shutdown(self, application):
+        await self.stop_background_tasks()
+    
+    async def start_background_tasks(self, serve_metrics=True):
+        """Start long-running bot-process tasks (metrics, broadcasts, request expiry scheduler)
+
+        ``serve_metrics=False`` skips the METRICS_PORT server, for processes
+        that already serve /metrics.
+        """
+        from . import expiry
+        
+        if metrics.enabled():
+            self._loop_lag_task = asyncio.create_task(
+                metrics.monitor_event_loop_lag(getattr(settings, 'METRICS_EVENT_LOOP_INTERVAL', 1.0))
+            )
+            port = getattr(settings, 'METRICS_PORT', 0) if serve_metrics else 0
+            if port and not getattr(self, '_metrics_server', None):
+                try:
+                    self._metrics_server = metrics.start_http_server(port)
+                except OSError as e:
+                    logger.error(f"❌ Could not start metrics server on port {port}: {e}")
+        
+        if getattr(settings, 'BROADCAST_WORKER_ENABLED', True):
+            from dashboard.broadcasts import BroadcastSender
+            self._broadcast_task = asyncio.create_task(BroadcastSender().run_forever())
+            logger.info("📣 Broadcast sender started")
+        
+        if not getattr(settings, 'EXPIRY_SCHEDULER_ENABLED', True):
+            return
+        expiry.expiry_scheduler = expiry.RequestExpiryScheduler(self)
+        self._expiry_task = asyncio.create_task(expiry.expiry_scheduler.run())
+        logger.info("⏰ Request expiry scheduler started")
+    
+    async def stop_background_tasks(self):
+        from . import expiry
+        
+        for attr in ('_expiry_task', '_loop_lag_task', '_broadcast_task'):
+            task = getattr(self, attr, None)
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                setattr(self, attr, None)
+        expiry.expiry_scheduler = None
+        
+        if query_profiler.enabled():
+            query_profiler.log_worst_offenders()
+        
+        server = getattr(self, '_metrics_server', None)
+        if server:
+            server.shutdown()
+            server.server_close()
+            self._metrics_server = None
+    
     @sync_to_async
     def get_or_create_user(self, telegram_user) -> User:
         """Get or create user from Telegram user data with connection handling"""
@@ -124,6 +217,28 @@ class TelegramBot:
         else:
             return request.parts or "لا توجد قطع محددة"
     
+    def _build_photo_media(self, photo_sizes) -> Dict[str, Any]:
+        """
+        Build the media entry for an uploaded photo.
+        Keeps the highest resolution for junkyards plus the smallest size that is
+        still large enough for a dashboard thumbnail.
+        """
+        largest = photo_sizes[-1]
+        thumb_size = getattr(settings, 'THUMBNAIL_SIZE', 320)
+        thumb = next(
+            (size for size in photo_sizes if max(size.width, size.height) >= thumb_size),
+            largest
+        )
+        return {
+            "type": "photo",
+            "file_id": largest.file_id,
+            "file_unique_id": largest.file_unique_id,
+            "thumb_file_id": thumb.file_id,
+            "width": largest.width,
+            "height": largest.height,
+            "file_size": largest.file_size,
+        }
+
     def _format_parts_for_pricing(self, parts_description):
         """Format parts description for pricing request"""
         lines = parts_description.split('\n')
@@ -299,9 +414,43 @@ class TelegramBot:
         
         await self.safe_edit_message_text(query, policy_message, reply_markup=reply_markup, parse_mode='Markdown')
     
+    async def drop_duplicate_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Stop a redelivered update before any handler sees it"""
+        if self.idempotency.seen_update(update.update_id):
+            logger.info("🔁 Dropping redelivered update %s", update.update_id)
+            raise ApplicationHandlerStop
+    
+    async def run_once(self, key, done_text, action):
+        """Run a state-changing action once per idempotency key
+
+        ``action`` returns True when it went through; only then is ``done_text``
+        cached for repeats. Failed attempts release the key so the user can retry.
+        """
+        if not self.idempotency.claim(key):
+            return None
+        try:
+            succeeded = await action()
+        except BaseException:
+            self.idempotency.release(key)
+            raise
+        if succeeded:
+            self.idempotency.complete(key, done_text)
+        else:
+            self.idempotency.release(key)
+        return succeeded
+    
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle inline keyboard button callbacks"""
         query = update.callback_query
+        
+        # A double tap on a state-changing button gets the first tap's result
+        action_key = idempotency.callback_key(update.effective_user.id, query.data)
+        if action_key:
+            cached_answer = self.idempotency.lookup(action_key)
+            if cached_answer:
+                logger.info("🔁 Repeated '%s' from user %s, answered from cache", query.data, update.effective_user.id)
+                await query.answer(cached_answer)
+                return
         await query.answer()
         
         try:
@@ -312,7 +461,7 @@ class TelegramBot:
             user = await self.get_or_create_user(update.effective_user)
             data = query.data
             
-            logger.info(f"Button callback: user {user.telegram_id} clicked '{data}'")
+            logger.debug("Button callback: user %s clicked '%s'", user.telegram_id, data)
             
             # معالج زر "ابدأ ✅" - يقوم بتشغيل البوت وإظهار خيارات نوع الحساب
             if data == "start_bot":
@@ -342,6 +491,11 @@ class TelegramBot:
                 await self.handle_year_range_selection(query, user, data)
             elif data.startswith("year_"):
                 await self.handle_year_selection(query, user, data)
+            elif data.startswith("offer_accept_") or data.startswith("offer_reject_"):
+                await self.run_once(
+                    action_key, idempotency.callback_done_text(data),
+                    lambda: self.handle_offer_action(query, user, data),
+                )
             elif data.startswith("offer_"):
                 await self.handle_offer_action(query, user, data)
             elif data.startswith("rating_"):
@@ -351,7 +505,10 @@ class TelegramBot:
             elif data == "my_requests":
                 await self.show_user_requests(query, user)
             elif data.startswith("confirm_request_"):
-                await self.confirm_request(query, user, data)
+                await self.run_once(
+                    action_key, idempotency.callback_done_text(data),
+                    lambda: self.confirm_request(query, user, data),
+                )
             elif data == "select_brand_again":
                 await self.show_brand_selection(query, user)
             elif data == "show_more_brands":
@@ -604,7 +761,7 @@ class TelegramBot:
         brands = await sync_to_async(list)(Brand.objects.filter(is_active=True).order_by('name'))
         
         # تسجيل عدد الماركات
-        logger.info(f"Found {len(brands)} active brands for brand selection")
+        logger.debug("Found %d active brands for brand selection", len(brands))
         
         # الماركات الأكثر شيوعاً أولاً
         popular_brands = ['تويوتا', 'هوندا', 'نيسان', 'هيونداي', 'كيا', 'مازدا', 'فورد', 'شيفروليه']
@@ -652,7 +809,7 @@ class TelegramBot:
         brands = await sync_to_async(list)(Brand.objects.filter(is_active=True).order_by('name'))
         
         # تسجيل عدد الماركات
-        logger.info(f"Showing all {len(brands)} active brands")
+        logger.debug("Showing all %d active brands", len(brands))
         
         message = f"🚗 جميع الماركات المتاحة ({len(brands)} وكالة):\n\n"
         keyboard = []
@@ -877,7 +1034,7 @@ class TelegramBot:
         brands = await sync_to_async(list)(Brand.objects.filter(is_active=True).order_by('name'))
         
         # تسجيل عدد الماركات
-        logger.info(f"Found {len(brands)} active brands")
+        logger.debug("Found %d active brands", len(brands))
         
         # الماركات الأكثر شيوعاً أولاً (لتحسين تجربة المستخدم)
         popular_brands = ['تويوتا', 'هوندا', 'نيسان', 'هيونداي', 'كيا', 'مازدا', 'فورد', 'شيفروليه']
@@ -1424,8 +1581,7 @@ class TelegramBot:
                 current_draft["request_data"]["media_files"] = []
             
             if update.message.photo:
-                file_id = update.message.photo[-1].file_id  # Get highest resolution
-                current_draft["request_data"]["media_files"].append({"type": "photo", "file_id": file_id})
+                current_draft["request_data"]["media_files"].append(self._build_photo_media(update.message.photo))
             elif update.message.video:
                 file_id = update.message.video.file_id
                 current_draft["request_data"]["media_files"].append({"type": "video", "file_id": file_id})
@@ -1458,12 +1614,12 @@ class TelegramBot:
                 current_draft["request_data"]["items"] = []
             
             # Debug: Log the current state
-            logger.info(f"Photo upload - current_item_index: {current_item_index}, total items: {len(current_draft['request_data']['items'])}")
+            logger.debug("Photo upload - current_item_index: %s, total items: %d", current_item_index, len(current_draft['request_data']['items']))
             
             # If current_item_index is not set or invalid, use the last item
             if current_item_index is None or current_item_index >= len(current_draft["request_data"]["items"]):
                 current_item_index = len(current_draft["request_data"]["items"]) - 1
-                logger.info(f"Adjusted current_item_index to: {current_item_index}")
+                logger.debug("Adjusted current_item_index to: %s", current_item_index)
             
             if current_item_index >= 0 and current_item_index < len(current_draft["request_data"]["items"]):
                 current_item = current_draft["request_data"]["items"][current_item_index]
@@ -1473,8 +1629,7 @@ class TelegramBot:
                     current_item["media_files"] = []
                 
                 if update.message.photo:
-                    file_id = update.message.photo[-1].file_id  # Get highest resolution
-                    current_item["media_files"].append({"type": "photo", "file_id": file_id})
+                    current_item["media_files"].append(self._build_photo_media(update.message.photo))
                 elif update.message.video:
                     file_id = update.message.video.file_id
                     current_item["media_files"].append({"type": "video", "file_id": file_id})
@@ -1597,6 +1752,25 @@ class TelegramBot:
                     media_files=item_data.get("media_files", [])
                 )
             
+            # Schedule exact expiry (and the reminder) in the bot process
+            from .expiry import expiry_scheduler
+            if expiry_scheduler:
+                expiry_scheduler.schedule(request.id, request.expires_at)
+            
+            # Register deduplicated media assets for notifications and the dashboard
+            from .models import MediaAsset
+            await sync_to_async(MediaAsset.register_for_request)(request)
+            
+            # Pre-generate dashboard thumbnails off the request path
+            try:
+                from dashboard.thumbnails import schedule_thumbnails
+                all_media = list(request_data.get("media_files", []))
+                for item_data in items:
+                    all_media.extend(item_data.get("media_files", []))
+                schedule_thumbnails(all_media)
+            except Exception as thumb_error:
+                logger.warning(f"Could not schedule thumbnails for request {request.order_id}: {thumb_error}")
+            
             # Remove the draft from user states (it's now a real request)
             del user_state["drafts"][draft_id]
             if user_state.get("current_draft") == draft_id:
@@ -1661,6 +1835,8 @@ class TelegramBot:
                 except:
                     pass  # Don't fail if we can't send this notification
             
+            return True
+            
         except Exception as e:
             logger.error(f"❌ Error creating request: {e}")
             import traceback
@@ -1729,7 +1905,7 @@ class TelegramBot:
         
         for junkyard in junkyards:
             try:
-                logger.info(f"Processing junkyard: {junkyard.user.first_name} (ID: {junkyard.id})")
+                logger.debug("Processing junkyard: %s (ID: %s)", junkyard.user.first_name, junkyard.id)
                 # Get parts description safely in async context
                 parts_description = await self.get_request_parts_description(request)
                 
@@ -1784,21 +1960,21 @@ class TelegramBot:
                     logger.warning(f"Junkyard {junkyard.id} ({junkyard.user.first_name}) has no users with telegram_id - skipping notification")
                     continue
                 
-                logger.info(f"Found {len(users_to_notify)} users to notify for junkyard {junkyard.id}")
+                logger.debug("Found %d users to notify for junkyard %s", len(users_to_notify), junkyard.id)
                 
                 for user_info in users_to_notify:
                     user = user_info['user']
                     role = user_info['role']
                     
                     try:
-                        logger.info(f"Sending notification to {role} {user.first_name} (telegram_id: {user.telegram_id}) for junkyard {junkyard.id}")
+                        logger.debug("Sending notification to %s %s (telegram_id: %s) for junkyard %s", role, user.first_name, user.telegram_id, junkyard.id)
                         await self.application.bot.send_message(
                             chat_id=user.telegram_id,
                             text=message,
                             reply_markup=reply_markup
                         )
                         notifications_sent += 1
-                        logger.info(f"✅ Successfully sent notification to {user.first_name}")
+                        logger.debug("✅ Successfully sent notification to %s", user.first_name)
                     except Exception as e:
                         notifications_failed += 1
                         logger.error(f"❌ Failed to send notification to {user.first_name} (telegram_id: {user.telegram_id}): {e}")
@@ -1963,17 +2139,12 @@ class TelegramBot:
                 id=offer_id, request__user=user
             )
             
-            # Check if request already has an accepted offer (locking mechanism)
-            request = offer.request
-            existing_accepted = await sync_to_async(
-                request.offers.filter(status='accepted').exists
-            )()
-            
-            if existing_accepted:
+            # Validate offer has mandatory fields
+            if not offer.price:
                 message = """
-❌ عذراً، تم قبول عرض آخر لهذا الطلب مسبقاً.
+❌ هذا العرض غير مكتمل (يفتقر للسعر).
 
-لا يمكن قبول أكثر من عرض واحد للطلب الواحد.
+يرجى التواصل مع التشليح لتحديث العرض.
                 """
                 keyboard = [
                     [InlineKeyboardButton("📋 طلباتي", callback_data="my_requests")],
@@ -1983,12 +2154,15 @@ class TelegramBot:
                 await self.safe_edit_message_text(query, message, reply_markup=reply_markup)
                 return
             
-            # Validate offer has mandatory fields
-            if not offer.price:
+            # Use workflow service to process the decision; the transition is
+            # conditional, so of two quick accepts only one can win (locking mechanism)
+            from .services import workflow_service
+            workflow_service.set_telegram_bot(self)
+            if not await workflow_service.process_customer_offer_decision(offer, 'accept', user):
                 message = """
-❌ هذا العرض غير مكتمل (يفتقر للسعر).
+❌ عذراً، تم قبول عرض آخر لهذا الطلب مسبقاً.
 
-يرجى التواصل مع التشليح لتحديث العرض.
+لا يمكن قبول أكثر من عرض واحد للطلب الواحد.
                 """
                 keyboard = [
                     [InlineKeyboardButton("📋 طلباتي", callback_data="my_requests")],
@@ -1998,11 +2172,6 @@ class TelegramBot:
                 await self.safe_edit_message_text(query, message, reply_markup=reply_markup)
                 return
             
-            # Use workflow service to process the decision
-            from .services import workflow_service
-            workflow_service.set_telegram_bot(self)
-            await workflow_service.process_customer_offer_decision(offer, 'accept', user)
-            
             # Show acceptance confirmation with offer details
             message = f"""
 ✅ تم قبول العرض!
@@ -2024,6 +2193,7 @@ class TelegramBot:
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await self.safe_edit_message_text(query, message, reply_markup=reply_markup)
+            return True
             
         except Exception as e:
             logger.error(f"Error accepting offer: {e}")
@@ -2037,10 +2207,13 @@ class TelegramBot:
             # Use workflow service to process the decision
             from .services import workflow_service
             workflow_service.set_telegram_bot(self)
-            await workflow_service.process_customer_offer_decision(offer, 'reject', user)
+            if not await workflow_service.process_customer_offer_decision(offer, 'reject', user):
+                await self.safe_edit_message_text(query, "ℹ️ لم يعد هذا العرض متاحاً (تم قبوله أو رفضه مسبقاً).")
+                return True
             
             # Edit the message to show rejection confirmation
             await self.safe_edit_message_text(query, "❌ تم رفض العرض. سيتم إشعار التشليح.")
+            return True
             
         except Exception as e:
             logger.error(f"Error rejecting offer: {e}")
@@ -2056,10 +2229,10 @@ class TelegramBot:
             await self.start_offer_process(query, user, request_id)
         elif action == "accept":
             offer_id = int(action_parts[2])
-            await self.accept_offer(query, user, offer_id)
+            return await self.accept_offer(query, user, offer_id)
         elif action == "reject":
             offer_id = int(action_parts[2])
-            await self.reject_offer(query, user, offer_id)
+            return await self.reject_offer(query, user, offer_id)
     
     async def start_offer_process(self, query, user, request_id):
         """Start the offer creation process with mandatory price and delivery time"""
@@ -2244,6 +2417,14 @@ class TelegramBot:
         offer_data = user_state["offer_data"]
         offer_data["delivery_time"] = delivery_time
         
+        submit_key = idempotency.offer_submit_key(user.telegram_id, request_id, offer_data.get("price"), delivery_time)
+        cached_answer = self.idempotency.lookup(submit_key)
+        if cached_answer is None and not self.idempotency.claim(submit_key):
+            cached_answer = idempotency.IN_PROGRESS_TEXT
+        if cached_answer:
+            await update.message.reply_text(cached_answer)
+            return
+        
         try:
             # Load related fields to avoid async issues
             request = await sync_to_async(
@@ -2284,8 +2465,10 @@ class TelegramBot:
             from .services import workflow_service
             workflow_service.set_telegram_bot(self)
             await workflow_service.process_junkyard_offer(offer)
+            self.idempotency.complete(submit_key, idempotency.OFFER_SUBMITTED_TEXT)
             
         except Exception as e:
+            self.idempotency.release(submit_key)
             logger.error(f"Error creating offer: {e}")
             await update.message.reply_text("حدث خطأ أثناء إنشاء العرض. يرجى المحاولة مرة أخرى.")
     
@@ -2574,7 +2757,7 @@ class TelegramBot:
                 return
 
             draft_id = parts[3]
-            logger.info(f"Handle add item photo - user: {user.telegram_id}, draft_id: {draft_id}, data: {data}")
+            logger.debug("Handle add item photo - user: %s, draft_id: %s, data: %s", user.telegram_id, draft_id, data)
 
             # Ensure user state exists
             user_state = self.ensure_user_state(user.telegram_id)
@@ -2589,7 +2772,7 @@ class TelegramBot:
                     draft_id = list(available_drafts.keys())[0]
                     current_draft = available_drafts[draft_id]
                     user_state["current_draft"] = draft_id
-                    logger.info(f"Using available draft: {draft_id}")
+                    logger.debug("Using available draft: %s", draft_id)
                 else:
                     await self.safe_edit_message_text(query, """
 ❌ خطأ: لم يتم العثور على المسودة المطلوبة.
@@ -2623,7 +2806,7 @@ class TelegramBot:
             self.save_user_states()
             
             # Debug: Log the current state
-            logger.info(f"Setting up photo upload for item index: {current_draft['current_item_index']}, total items: {len(current_draft['request_data']['items'])}")
+            logger.debug("Setting up photo upload for item index: %s, total items: %d", current_draft['current_item_index'], len(current_draft['request_data']['items']))
             
             last_item = current_draft["request_data"]["items"][-1]
             message = f"""
@@ -2999,60 +3182,29 @@ class TelegramBot:
             await self.safe_edit_message_text(query, "❌ حدث خطأ في عرض معلومات العميل")
 
     async def handle_view_all_offers(self, query, user, data):
-        """Handle view all offers button for customers"""
+        """Handle view all offers button for customers (ranked, paged comparison board)"""
         try:
-            # Extract request_id from callback data
-            request_id = int(data.split("_")[3])
-            
-            # Get request and all offers
-            request = await sync_to_async(Request.objects.select_related('brand', 'model', 'city').get)(id=request_id, user=user)
-            offers = await sync_to_async(list)(
-                request.offers.select_related('junkyard__user').order_by('-created_at')
-            )
-            
-            if not offers:
+            # Callback data: view_all_offers_<request_id>[_<page>]
+            parts = data.split("_")
+            request_id = int(parts[3])
+            page = int(parts[4]) if len(parts) > 4 else 1
+
+            board = await sync_to_async(offer_board.get_board)(request_id, user, page)
+            if board is None:
                 message = "❌ لا توجد عروض متاحة لهذا الطلب"
                 keyboard = [[InlineKeyboardButton("🔙 رجوع", callback_data="back_to_main")]]
             else:
-                # Get request details safely
-                order_id = await sync_to_async(lambda: request.order_id)()
-                brand_name = await sync_to_async(lambda: request.brand.name)()
-                model_name = await sync_to_async(lambda: request.model.name)()
-                year = await sync_to_async(lambda: request.year)()
-                
-                message = f"💰 **جميع العروض لطلبك**\n\n"
-                message += f"🆔 رقم الطلب: {order_id}\n"
-                message += f"🚗 السيارة: {brand_name} {model_name} {year}\n\n"
-                
-                for i, offer in enumerate(offers, 1):
-                    # Get offer details safely
-                    offer_status = await sync_to_async(lambda: offer.status)()
-                    junkyard_name = await sync_to_async(lambda: offer.junkyard.user.first_name)()
-                    offer_price = await sync_to_async(lambda: offer.price)()
-                    average_rating = await sync_to_async(lambda: offer.junkyard.average_rating)()
-                    location = await sync_to_async(lambda: offer.junkyard.location)()
-                    delivery_time = await sync_to_async(lambda: offer.delivery_time)()
-                    created_at = await sync_to_async(lambda: offer.created_at)()
-                    
-                    status_emoji = "✅" if offer_status == "accepted" else "⏳" if offer_status == "pending" else "❌"
-                    message += f"{status_emoji} **العرض {i}**\n"
-                    message += f"🏪 التشليح: {junkyard_name}\n"
-                    message += f"💰 السعر: {offer_price} ريال\n"
-                    message += f"⭐ التقييم: {average_rating:.1f}/5\n"
-                    message += f"📍 الموقع: {location}\n"
-                    if delivery_time:
-                        message += f"🚚 مدة التوريد: {delivery_time}\n"
-                    message += f"📅 تاريخ العرض: {created_at.strftime('%Y-%m-%d %H:%M')}\n\n"
-                
+                message, buttons = board
                 keyboard = [
-                    [InlineKeyboardButton("🔙 رجوع", callback_data="back_to_main")]
+                    [InlineKeyboardButton(label, callback_data=callback) for label, callback in row]
+                    for row in buttons
                 ]
-            
+
             reply_markup = InlineKeyboardMarkup(keyboard)
             await self.safe_edit_message_text(query, message, reply_markup=reply_markup, parse_mode='Markdown')
-            
+
         except Exception as e:
-            logger.error(f"Error in handle_view_all_offers: {e}")
+            logger.error("Error in handle_view_all_offers: %s", e)
             await self.safe_edit_message_text(query, "❌ حدث خطأ في عرض العروض")
     
     async def start_polling(self):
@@ -3066,30 +3218,59 @@ class TelegramBot:
     
     def save_user_states(self):
         """Save user states to file with better error handling"""
-        try:
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(self.states_file), exist_ok=True)
-
-            # Use atomic write to prevent corruption
-            temp_file = self.states_file + '.tmp'
-            with open(temp_file, 'wb') as f:
-                pickle.dump(self.user_states, f)
-
-            # Atomic move
-            if os.path.exists(self.states_file):
-                os.remove(self.states_file)
-            os.rename(temp_file, self.states_file)
+        self.write_user_states(self.dump_user_states())
+    
+    def dump_user_states(self):
+        """Pickle the user states, and the idempotency cache if it changed, for write_user_states
 
-            logger.debug(f"Saved user states to {self.states_file}")
+        Call it on the thread the handlers run on, so no handler changes a
+        state mid-pickle; the file writes can then happen on any thread.
+        """
+        states = cache = None
+        try:
+            # Idle conversations move to the spill directory, keeping the file small
+            self.user_states.evict_idle()
+            states = pickle.dumps(self.user_states.snapshot(), protocol=pickle.HIGHEST_PROTOCOL)
+            metrics.USER_STATES.set(len(self.user_states))
         except Exception as e:
             logger.error(f"Error saving user states: {e}")
-            # Clean up temp file if it exists
+        if self.idempotency.dirty:
+            try:
+                cache = pickle.dumps(self.idempotency)
+                self.idempotency.dirty = False
+            except Exception as e:
+                logger.error(f"Error saving idempotency cache: {e}")
+        return states, cache
+    
+    def write_user_states(self, dumped):
+        """Atomically write what dump_user_states returned"""
+        states, cache = dumped
+        if states is not None:
             temp_file = self.states_file + '.tmp'
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+            try:
+                # Create directory if it doesn't exist
+                os.makedirs(os.path.dirname(self.states_file), exist_ok=True)
+                with open(temp_file, 'wb') as f:
+                    f.write(states)
+                os.replace(temp_file, self.states_file)
+                logger.debug("Saved user states to %s", self.states_file)
+            except Exception as e:
+                logger.error(f"Error saving user states: {e}")
+                # Clean up temp file if it exists
+                if os.path.exists(temp_file):
+                    try:
+                        os.remove(temp_file)
+                    except OSError:
+                        pass
+        if cache is not None:
+            try:
+                temp_file = self.idempotency_file + '.tmp'
+                with open(temp_file, 'wb') as f:
+                    f.write(cache)
+                os.replace(temp_file, self.idempotency_file)
+            except Exception as e:
+                self.idempotency.dirty = True
+                logger.error(f"Error saving idempotency cache: {e}")
     
     def load_user_states(self):
         """Load user states from file with better error handling"""
@@ -3099,18 +3280,30 @@ class TelegramBot:
                     loaded_states = pickle.load(f)
                     # Validate the loaded data
                     if isinstance(loaded_states, dict):
-                        self.user_states = loaded_states
+                        self.user_states.load(loaded_states)
+                        metrics.USER_STATES.set(len(self.user_states))
                         logger.info(f"Loaded user states from {self.states_file} - {len(self.user_states)} users")
                     else:
                         logger.warning("Invalid user states format, starting fresh")
-                        self.user_states = {}
+                        self.user_states.load({})
             else:
                 logger.info("No existing user states file found, starting fresh")
-                self.user_states = {}
+                self.user_states.load({})
         except Exception as e:
             logger.error(f"Error loading user states: {e}")
             logger.info("Starting with empty user states")
-            self.user_states = {}
+            self.user_states.load({})
+        self.load_idempotency()
+    
+    def load_idempotency(self):
+        try:
+            if os.path.exists(self.idempotency_file):
+                with open(self.idempotency_file, 'rb') as f:
+                    loaded = pickle.load(f)
+                if isinstance(loaded, idempotency.IdempotencyCache):
+                    self.idempotency = loaded
+        except Exception as e:
+            logger.error(f"Error loading idempotency cache: {e}")
     
     def update_user_state(self, user_id, key, value):
         """Update user state and save to file"""
@@ -3134,7 +3327,7 @@ class TelegramBot:
                 "drafts": {},
                 "current_draft": None
             }
-            logger.info(f"Initialized new user state for {user_id}")
+            logger.debug("Initialized new user state for %s", user_id)
 
         # Ensure required keys exist
         user_state = self.user_states[user_id]
@@ -3165,6 +3358,21 @@ class TelegramBot:
             return False
 
 
-# Initialize bot instance
-telegram_bot = TelegramBot()
+_telegram_bot = None
+
+
+def get_telegram_bot():
+    """The process-wide TelegramBot, created (and its state file loaded) on first use"""
+    global _telegram_bot
+    if _telegram_bot is None:
+        _telegram_bot = TelegramBot()
+    return _telegram_bot
+
+
+def __getattr__(name):
+    # ``from bot.telegram_bot import telegram_bot`` keeps working, but importing
+    # this module no longer builds the bot and unpickles the state file
+    if name == 'telegram_bot':
+        return get_telegram_bot()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
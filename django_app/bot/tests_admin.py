@@ -0,0 +1,96 @@
+"""
+Tests for admin changelist query counts and estimated totals
+"""
+
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin_paging import EstimatedCountPaginator, estimated_row_count
+from .models import (
+    Brand, City, Conversation, Junkyard, JunkyardRating, MediaAsset, Model, Offer, Request, RequestItem,
+    TelegramMessage, User,
+)
+
+CHANGELISTS = (
+    'brand', 'model', 'junkyard', 'request', 'offer', 'mediaasset', 'conversation', 'junkyardrating',
+    'telegrammessage',
+)
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Changelists run the same number of queries however many rows they show"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(self.admin)
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        self.rows = 0
+
+    def _add_rows(self):
+        self.rows += 1
+        n = self.rows
+        brand = Brand.objects.create(name=f'Brand {n}')
+        model = Model.objects.create(brand=brand, name=f'Model {n}')
+        customer = User.objects.create_user(username=f'customer{n}', telegram_id=100 + n, first_name='Client')
+        owner = User.objects.create_user(
+            username=f'junkyard{n}', telegram_id=200 + n, first_name='Yard', user_type='junkyard',
+        )
+        junkyard = Junkyard.objects.create(user=owner, phone='0500000000', city=self.city, location='-')
+        request = Request.objects.create(
+            user=customer, city=self.city, brand=brand, model=model, year=2015, expires_at=timezone.now(),
+        )
+        item = RequestItem.objects.create(request=request, name='مصد أمامي')
+        Offer.objects.create(request=request, junkyard=junkyard, price=100)
+        MediaAsset.objects.create(request=request, request_item=item, file_id=f'f{n}', file_unique_id=f'u{n}')
+        Conversation.objects.create(client=customer, junkyard=owner, request=request)
+        JunkyardRating.objects.create(junkyard=junkyard, client=customer, request=request, rating=5)
+        TelegramMessage.objects.create(user=customer, telegram_message_id=n, message_type='text', content={})
+
+    def _query_count(self, name):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f'admin:bot_{name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self._add_rows()
+        few = {name: self._query_count(name) for name in CHANGELISTS}
+        for _ in range(3):
+            self._add_rows()
+        many = {name: self._query_count(name) for name in CHANGELISTS}
+        self.assertEqual(many, few)
+
+    def test_brand_models_count_is_annotated(self):
+        self._add_rows()
+        Model.objects.create(brand=Brand.objects.get(), name='Corolla')
+        response = self.client.get(reverse('admin:bot_brand_changelist'), {'o': '3'})
+        self.assertContains(response, '<td class="field-models_count">2</td>', html=True)
+
+
+class EstimatedCountTests(TestCase):
+    """Test planner estimates for unfiltered changelists"""
+
+    def setUp(self):
+        for n in range(3):
+            City.objects.create(name=f'City {n}', code=f'C{n}')
+
+    def test_sqlite_estimate_after_analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_row_count(City), 3)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_paginator_uses_estimate_only_when_unfiltered_and_large(self):
+        cities = City.objects.order_by('id')
+        with mock.patch('bot.admin_paging.estimated_row_count', return_value=50000):
+            self.assertEqual(EstimatedCountPaginator(cities, 10).count, 50000)
+            self.assertEqual(EstimatedCountPaginator(cities.filter(code='C1'), 10).count, 1)
+        with mock.patch('bot.admin_paging.estimated_row_count', return_value=500):
+            self.assertEqual(EstimatedCountPaginator(cities, 10).count, 3)
+        with mock.patch('bot.admin_paging.estimated_row_count', return_value=None):
+            self.assertEqual(EstimatedCountPaginator(cities, 10).count, 3)
@@ -0,0 +1,192 @@
+"""
+Tests for the bot JSON API feeds
+"""
+
+import gzip
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Brand, City, Junkyard, Model, Request
+
+User = get_user_model()
+
+
+class FeedApiTests(TestCase):
+    """Test streamed, paged feeds for n8n consumers"""
+
+    def setUp(self):
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        self.brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=self.brand, name='Camry')
+        for i in range(5):
+            user = User.objects.create_user(username=f'customer{i}', telegram_id=1000 + i)
+            Request.objects.create(
+                user=user, city=self.city, brand=self.brand, model=self.model, year=2020, parts=f'part {i}'
+            )
+            junkyard_user = User.objects.create_user(
+                username=f'junkyard{i}', first_name=f'Junkyard {i}', telegram_id=2000 + i
+            )
+            Junkyard.objects.create(user=junkyard_user, phone='050', city=self.city, location='Riyadh')
+
+    def _get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        return response, content
+
+    def test_active_requests_constant_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response, content = self._get(reverse('bot:active_requests'))
+
+        data = json.loads(content)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['requests']), 5)
+        self.assertEqual(data['requests'][0]['brand'], 'Toyota')
+        self.assertIsNone(data['next_cursor'])
+        # One aggregate for the ETag, one joined SELECT for the rows
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+    def test_cursor_paging(self):
+        _, content = self._get(reverse('bot:junkyards_by_city') + '?limit=2')
+        first = json.loads(content)
+        self.assertEqual(len(first['junkyards']), 2)
+        self.assertIsNotNone(first['next_cursor'])
+
+        seen = [row['id'] for row in first['junkyards']]
+        cursor = first['next_cursor']
+        while cursor:
+            _, content = self._get(reverse('bot:junkyards_by_city') + f'?limit=2&cursor={cursor}')
+            page = json.loads(content)
+            seen.extend(row['id'] for row in page['junkyards'])
+            cursor = page['next_cursor']
+
+        self.assertEqual(seen, sorted(Junkyard.objects.values_list('id', flat=True)))
+
+    def test_etag_not_modified(self):
+        response, _ = self._get(reverse('bot:active_requests'))
+        etag = response['ETag']
+
+        response, _ = self._get(reverse('bot:active_requests'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Request.objects.filter(parts='part 0').update(status='cancelled')
+        response, _ = self._get(reverse('bot:active_requests'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_revalidates_through_gzip(self):
+        response, _ = self._get(reverse('bot:active_requests'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response, _ = self._get(reverse('bot:active_requests'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_on_in_place_edits(self):
+        def etag(name):
+            return self._get(reverse(name))[0]['ETag']
+
+        request_etag = etag('bot:active_requests')
+        request = Request.objects.get(parts='part 0')
+        request.parts = 'part 0, mirror'
+        request.save()
+        self.assertNotEqual(etag('bot:active_requests'), request_etag)
+
+        request_etag = etag('bot:active_requests')
+        self.model.name = 'Corolla'
+        self.model.save()
+        self.assertNotEqual(etag('bot:active_requests'), request_etag)
+
+        junkyard_etag = etag('bot:junkyards_by_city')
+        owner = Junkyard.objects.first().user
+        owner.first_name = 'Renamed'
+        owner.save()
+        self.assertNotEqual(etag('bot:junkyards_by_city'), junkyard_etag)
+
+        junkyard_etag = etag('bot:junkyards_by_city')
+        owner.last_login = owner.date_joined
+        owner.save(update_fields=['last_login'])
+        self.assertEqual(etag('bot:junkyards_by_city'), junkyard_etag)
+
+    def test_invalid_paging_params(self):
+        for url in (
+            reverse('bot:active_requests') + '?limit=abc',
+            reverse('bot:junkyards_by_city') + '?cursor=-1',
+            reverse('bot:changes_feed') + '?since=x',
+        ):
+            response, content = self._get(url)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("must be a non-negative integer", json.loads(content)['error'])
+
+    def test_gzip(self):
+        response, content = self._get(reverse('bot:active_requests'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(content)['requests']), 5)
+
+
+@override_settings(CHANGE_FEED_SAFETY_LAG_SECONDS=0)
+class ChangesFeedTests(TestCase):
+    """Test the incremental changes feed"""
+
+    def setUp(self):
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        self.brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=self.brand, name='Camry')
+        self.user = User.objects.create_user(username='customer', telegram_id=1000)
+
+    def _changes(self, since=0, **params):
+        query = '&'.join(f'{key}={value}' for key, value in dict(since=since, **params).items())
+        return json.loads(self.client.get(reverse('bot:changes_feed') + '?' + query).content)
+
+    def _create_request(self):
+        return Request.objects.create(
+            user=self.user, city=self.city, brand=self.brand, model=self.model, year=2020
+        )
+
+    def test_only_changes_since_cursor(self):
+        first = self._create_request()
+        cursor = self._changes()['next_cursor']
+
+        second = self._create_request()
+        first.status = 'cancelled'
+        first.save()
+
+        data = self._changes(since=cursor)
+        self.assertEqual(
+            [(change['model'], change['id'], change['action']) for change in data['changes']],
+            [('request', second.id, 'created'), ('request', first.id, 'updated')],
+        )
+        self.assertEqual(data['changes'][1]['data']['status'], 'cancelled')
+
+        # Nothing new after the returned cursor
+        self.assertEqual(self._changes(since=data['next_cursor'])['changes'], [])
+
+    def test_deleted_and_model_filter(self):
+        request = self._create_request()
+        junkyard_user = User.objects.create_user(username='junkyard', telegram_id=2000)
+        Junkyard.objects.create(user=junkyard_user, phone='050', city=self.city, location='Riyadh')
+        request_id = request.id
+        request.delete()
+
+        data = self._changes(models='request')
+        self.assertEqual(len(data['changes']), 1)
+        self.assertEqual(data['changes'][0]['id'], request_id)
+        self.assertEqual(data['changes'][0]['action'], 'deleted')
+        self.assertIsNone(data['changes'][0]['data'])
+
+    def test_paging(self):
+        for _ in range(3):
+            self._create_request()
+
+        data = self._changes(limit=2)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(len(data['changes']), 2)
+        rest = self._changes(since=data['next_cursor'])
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(len(rest['changes']), 1)
@@ -0,0 +1,87 @@
+"""
+Tests for hot/cold archival of closed requests
+"""
+
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .archive import archivable_requests, find_order, run_archive
+from .models import (
+    ArchivedRequest, Brand, City, Junkyard, JunkyardRating, Model, Offer, OfferItem, Request, RequestItem, User,
+)
+
+
+class ArchiveTests(TestCase):
+    """Test moving old closed requests to the archive table"""
+
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='customer', telegram_id=111, first_name='Client')
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        self.brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=self.brand, name='Camry')
+        junkyard_user = User.objects.create_user(username='yard', telegram_id=222, first_name='Yard', user_type='junkyard')
+        self.junkyard = Junkyard.objects.create(user=junkyard_user, phone='0500000000', city=self.city, location='-')
+
+    def _create_request(self, status, age_days):
+        request = Request.objects.create(
+            user=self.client_user, city=self.city, brand=self.brand, model=self.model, year=2015,
+            status=status, expires_at=timezone.now(),
+        )
+        Request.objects.filter(id=request.id).update(created_at=timezone.now() - timedelta(days=age_days))
+        return request
+
+    def test_archives_old_closed_requests_with_related_rows(self):
+        old = self._create_request('accepted', 400)
+        item = RequestItem.objects.create(request=old, name='مصد أمامي', unit_price=0)
+        offer = Offer.objects.create(request=old, junkyard=self.junkyard, price=500, status='accepted')
+        OfferItem.objects.create(offer=offer, request_item=item, price=500)
+        JunkyardRating.objects.create(junkyard=self.junkyard, client=self.client_user, request=old, rating=5)
+        open_request = self._create_request('new', 400)
+        recent = self._create_request('expired', 10)
+
+        self.assertEqual(list(archivable_requests(180)), [old])
+        self.assertEqual(run_archive(180, batch_size=1), 1)
+
+        self.assertFalse(Request.objects.filter(id=old.id).exists())
+        self.assertFalse(Offer.objects.exists())
+        self.assertFalse(RequestItem.objects.exists())
+        self.assertEqual(set(Request.objects.all()), {open_request, recent})
+
+        archived = ArchivedRequest.objects.get()
+        self.assertEqual((archived.order_id, archived.user, archived.status), (old.order_id, self.client_user, 'accepted'))
+        self.assertEqual(archived.data['items'][0]['name'], 'مصد أمامي')
+        self.assertEqual(archived.data['offers'][0]['junkyard_name'], 'Yard')
+        self.assertEqual(archived.data['offers'][0]['items'][0]['price'], '500.00')
+        self.assertEqual(archived.data['ratings'][0]['rating'], 5)
+
+        # The rating keeps counting for the junkyard
+        rating = JunkyardRating.objects.get()
+        self.assertIsNone(rating.request)
+        self.junkyard.update_rating()
+        self.assertEqual(self.junkyard.total_ratings, 1)
+
+    def test_find_order_checks_both_tiers(self):
+        old = self._create_request('cancelled', 400)
+        hot = self._create_request('new', 1)
+        call_command('archive_requests', stdout=StringIO())
+
+        self.assertEqual(find_order(hot.order_id), ('hot', hot))
+        tier, archived = find_order(old.order_id)
+        self.assertEqual((tier, archived.original_id), ('archived', old.id))
+        self.assertEqual(find_order('missing'), (None, None))
+
+    def test_dashboard_search_opens_archived_order(self):
+        old = self._create_request('expired', 400)
+        run_archive(180)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('dashboard:requests_list'), {'order': old.order_id})
+        detail_url = reverse('dashboard:archived_request_detail', args=[old.order_id])
+        self.assertRedirects(response, detail_url)
+        self.assertContains(self.client.get(detail_url), old.order_id)
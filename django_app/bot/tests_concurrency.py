@@ -0,0 +1,70 @@
+"""
+Tests for concurrent, per-user ordered update processing
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from .concurrency import PerUserUpdateProcessor
+from .telegram_bot import TelegramBot
+
+
+def _update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id) if user_id else None)
+
+
+class PerUserUpdateProcessorTests(SimpleTestCase):
+    """Test ordering and concurrency of PerUserUpdateProcessor"""
+
+    def _run(self, updates):
+        processor = PerUserUpdateProcessor(8)
+        events = []
+        active = {'now': 0, 'max': 0}
+
+        async def handle(label):
+            active['now'] += 1
+            active['max'] = max(active['max'], active['now'])
+            events.append(('start', label))
+            await asyncio.sleep(0.01)
+            events.append(('end', label))
+            active['now'] -= 1
+
+        async def main():
+            async with processor:
+                await asyncio.gather(*(
+                    processor.process_update(_update(user_id), handle(label))
+                    for label, user_id in updates
+                ))
+
+        async_to_sync(main)()
+        return processor, events, active['max']
+
+    def test_same_user_is_sequential_and_ordered(self):
+        processor, events, max_active = self._run([('a1', 1), ('a2', 1), ('a3', 1)])
+        self.assertEqual(events, [
+            ('start', 'a1'), ('end', 'a1'), ('start', 'a2'), ('end', 'a2'), ('start', 'a3'), ('end', 'a3'),
+        ])
+        self.assertEqual(max_active, 1)
+        self.assertEqual(processor.active_users, 0)
+
+    def test_different_users_overlap(self):
+        _, _, max_active = self._run([('a', 1), ('b', 2), ('c', 3), ('none', None)])
+        self.assertEqual(max_active, 4)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='123456:TEST')
+class SetupBotConcurrencyTests(SimpleTestCase):
+    """Test that setup_bot applies the concurrency setting"""
+
+    @override_settings(BOT_CONCURRENT_UPDATES=16)
+    def test_concurrent_by_setting(self):
+        app = TelegramBot().setup_bot()
+        self.assertEqual(app.concurrent_updates, 16)
+        self.assertIsInstance(app.update_processor, PerUserUpdateProcessor)
+
+    def test_sequential_override(self):
+        app = TelegramBot().setup_bot(concurrent_updates=1)
+        self.assertEqual(app.concurrent_updates, 1)
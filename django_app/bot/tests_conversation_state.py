@@ -0,0 +1,121 @@
+"""
+Tests for the bounded conversation state store
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from .conversation_state import ConversationState, Draft, StateStore, spilled_files
+from .telegram_bot import TelegramBot
+
+
+class ConversationStateTests(SimpleTestCase):
+    """Test the slotted state and draft records"""
+
+    def test_dict_style_access(self):
+        state = ConversationState({'drafts': {}, 'current_draft': None})
+        state['drafts']['ab12'] = {'id': 'ab12', 'name': 'طلب', 'step': 'select_city', 'request_data': {}}
+        state['custom'] = 1
+
+        draft = state['drafts']['ab12']
+        self.assertIsInstance(draft, Draft)
+        self.assertEqual(draft['step'], 'select_city')
+        self.assertNotIn('temp_item', draft)
+        self.assertIsNone(draft.get('temp_item'))
+        self.assertEqual(state.get('step', 'none'), 'none')
+        self.assertEqual(set(state), {'drafts', 'current_draft', 'custom'})
+        self.assertFalse(hasattr(draft, '__dict__'))
+
+        del state['current_draft']
+        with self.assertRaises(KeyError):
+            state['current_draft']
+
+    def test_pickle_round_trip(self):
+        state = ConversationState({'drafts': {'ab12': {'id': 'ab12', 'request_data': {'items': [1]}}}, 'step': 'x'})
+        restored = pickle.loads(pickle.dumps(state))
+        self.assertEqual(restored, state)
+        self.assertIsInstance(restored['drafts']['ab12'], Draft)
+        self.assertEqual(restored.touched_at, state.touched_at)
+
+
+class StateStoreTests(SimpleTestCase):
+    """Test LRU/TTL eviction to the spill directory"""
+
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp(prefix='bot-spill-')
+        self.addCleanup(shutil.rmtree, self.spill_dir, ignore_errors=True)
+
+    def test_overflow_spills_least_recently_used(self):
+        store = StateStore(spill_dir=self.spill_dir, max_users=2, idle_seconds=0)
+        store[1] = {'step': 'a'}
+        store[2] = {'step': 'b'}
+        store[1]['step'] = 'a2'  # 1 is now the most recently used
+        store[3] = {'step': 'c'}
+
+        self.assertEqual(list(store), [1, 3])
+        self.assertEqual(len(spilled_files(self.spill_dir)), 1)
+        self.assertIn(2, store)
+        self.assertEqual(store[2]['step'], 'b')  # Restored, and 1 spilled in turn
+        self.assertEqual(list(store), [3, 2])
+        self.assertEqual(store.get(1)['step'], 'a2')
+
+    def test_idle_states_spill_and_delete_reaches_disk(self):
+        store = StateStore(spill_dir=self.spill_dir, max_users=10, idle_seconds=60)
+        store[1] = {'step': 'a'}
+        store[2] = {'step': 'b'}
+        store._states[1].touched_at -= 120
+
+        self.assertEqual(store.evict_idle(), 1)
+        self.assertEqual(list(store), [2])
+        del store[1]
+        self.assertNotIn(1, store)
+        self.assertEqual(spilled_files(self.spill_dir), [])
+        self.assertIsNone(store.get(1))
+
+    def test_memory_stays_bounded(self):
+        store = StateStore(spill_dir=self.spill_dir, max_users=50, idle_seconds=0)
+        for telegram_id in range(500):
+            store[telegram_id] = {'drafts': {'d': {'request_data': {'media_files': ['x' * 50] * 5}}}}
+        self.assertEqual(len(store), 50)
+        self.assertEqual(len(spilled_files(self.spill_dir)), 450)
+        self.assertEqual(store[0]['drafts']['d']['request_data']['media_files'][0], 'x' * 50)
+
+    def test_loads_legacy_dict_states(self):
+        store = StateStore(max_users=10)
+        store.load({7: {'drafts': {'d': {'step': 'enter_parts'}}, 'current_draft': 'd'}})
+        self.assertIsInstance(store[7], ConversationState)
+        self.assertEqual(store[7]['drafts']['d']['step'], 'enter_parts')
+
+
+class BotStatePersistenceTests(SimpleTestCase):
+    """Test the bot's state file and spill directory across instances"""
+
+    def setUp(self):
+        states_dir = tempfile.mkdtemp(prefix='bot-states-')
+        self.addCleanup(shutil.rmtree, states_dir, ignore_errors=True)
+        self.states_file = os.path.join(states_dir, 'user_states.pickle')
+        overrides = override_settings(BOT_USER_STATES_FILE=self.states_file, BOT_STATE_MAX_USERS=1)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_spilled_drafts_survive_restart(self):
+        bot = TelegramBot()
+        bot.ensure_user_state(1)['drafts']['d'] = {'id': 'd', 'name': 'طلب', 'request_data': {}}
+        bot.ensure_user_state(2)
+        bot.save_user_states()
+
+        fresh = TelegramBot()
+        self.assertEqual(list(fresh.user_states), [2])
+        self.assertEqual(fresh.get_or_create_draft(1, 'd')['name'], 'طلب')
+
+        out = StringIO()
+        call_command('bot_state_report', stdout=out)
+        self.assertIn('1 مستخدم', out.getvalue())
+        call_command('bot_state_report', '--purge', '--days', '0', stdout=StringIO())
+        self.assertEqual(spilled_files(self.states_file + '.spill'), [])
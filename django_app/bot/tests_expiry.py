@@ -0,0 +1,140 @@
+"""
+Tests for the in-process request expiry scheduler
+"""
+
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .expiry import RequestExpiryScheduler
+from .models import Brand, ChangeLogEntry, City, Model, Request
+
+User = get_user_model()
+
+
+@override_settings(EXPIRY_REMINDER_MINUTES=60)
+class RequestExpirySchedulerTests(TransactionTestCase):
+    """Test heap-driven expiry and reminders"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='customer', telegram_id=111)
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        self.brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=self.brand, name='Camry')
+
+    def _create_request(self, expires_in, status='new'):
+        return Request.objects.create(
+            user=self.user, city=self.city, brand=self.brand, model=self.model, year=2020,
+            status=status, expires_at=timezone.now() + expires_in,
+        )
+
+    def _run(self, scheduler):
+        async def run():
+            await scheduler.rebuild()
+            expired = await scheduler.process_due()
+            await asyncio.gather(*scheduler._tasks)
+            return expired
+        return async_to_sync(run)()
+
+    def test_expires_due_requests_and_reminds(self):
+        due = self._create_request(timedelta(minutes=-1))
+        soon = self._create_request(timedelta(minutes=30))
+        later = self._create_request(timedelta(hours=5))
+        closed = self._create_request(timedelta(minutes=-1), status='accepted')
+
+        scheduler = RequestExpiryScheduler(telegram_bot=object())
+        with patch('bot.services.workflow_service.notify_requests_expired', new_callable=AsyncMock) as expired_mock, \
+                patch('bot.services.workflow_service.notify_requests_expiring_soon', new_callable=AsyncMock) as soon_mock:
+            self.assertEqual(self._run(scheduler), 1)
+
+        expired_mock.assert_awaited_once_with([due.id])
+        soon_mock.assert_awaited_once_with([soon.id])
+
+        statuses = dict(Request.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[due.id], 'expired')
+        self.assertEqual(statuses[soon.id], 'new')
+        self.assertEqual(statuses[later.id], 'new')
+        self.assertEqual(statuses[closed.id], 'accepted')
+        self.assertTrue(ChangeLogEntry.objects.filter(model_name='request', object_id=due.id).exists())
+
+        soon.refresh_from_db()
+        self.assertIsNotNone(soon.expiry_reminder_sent_at)
+
+    def test_reminder_sent_once_across_rebuilds(self):
+        self._create_request(timedelta(minutes=30))
+
+        with patch('bot.services.workflow_service.notify_requests_expiring_soon', new_callable=AsyncMock) as soon_mock:
+            self._run(RequestExpiryScheduler(telegram_bot=object()))
+            self._run(RequestExpiryScheduler(telegram_bot=object()))
+
+        self.assertEqual(soon_mock.await_count, 1)
+
+    def test_extended_request_not_expired_by_stale_entry(self):
+        request = self._create_request(timedelta(minutes=-1))
+        scheduler = RequestExpiryScheduler()
+        async_to_sync(scheduler.rebuild)()
+
+        Request.objects.filter(id=request.id).update(expires_at=timezone.now() + timedelta(hours=2))
+        self.assertEqual(async_to_sync(scheduler.process_due)(), 0)
+
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'new')
+
+    def _race_before_update(self, change):
+        """Execute wrapper that runs ``change`` just before the first UPDATE of bot_request"""
+        state = {'raced': False}
+
+        def wrapper(execute, sql, params, many, context):
+            if not state['raced'] and sql.lstrip().upper().startswith('UPDATE') and 'bot_request' in sql:
+                state['raced'] = True
+                change()
+            return execute(sql, params, many, context)
+        return connection.execute_wrapper(wrapper)
+
+    def test_status_change_racing_expiry_is_not_claimed(self):
+        request = self._create_request(timedelta(minutes=-1))
+        scheduler = RequestExpiryScheduler()
+        async_to_sync(scheduler.rebuild)()
+        entries = ChangeLogEntry.objects.filter(model_name='request', object_id=request.id)
+        logged = entries.count()
+
+        accept = lambda: Request.objects.filter(id=request.id).update(status='accepted')
+        with self._race_before_update(accept):
+            self.assertEqual(scheduler._expire_requests([request.id]), [])
+
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'accepted')
+        self.assertEqual(entries.count(), logged)
+
+    def test_second_scheduler_racing_reminder_is_not_claimed(self):
+        request = self._create_request(timedelta(minutes=30))
+        first = RequestExpiryScheduler()
+        second = RequestExpiryScheduler()
+
+        with self._race_before_update(lambda: self.assertEqual(first._mark_reminders([request.id]), [request.id])):
+            self.assertEqual(second._mark_reminders([request.id]), [])
+
+    def test_concurrent_schedulers_notify_once(self):
+        due = self._create_request(timedelta(minutes=-1))
+        schedulers = [RequestExpiryScheduler(telegram_bot=object()) for _ in range(2)]
+        entries = ChangeLogEntry.objects.filter(model_name='request', object_id=due.id)
+        logged = entries.count()
+
+        async def run():
+            for scheduler in schedulers:
+                await scheduler.rebuild()
+            expired = await asyncio.gather(*(scheduler.process_due() for scheduler in schedulers))
+            await asyncio.gather(*(task for scheduler in schedulers for task in scheduler._tasks))
+            return expired
+
+        with patch('bot.services.workflow_service.notify_requests_expired', new_callable=AsyncMock) as expired_mock:
+            self.assertEqual(sorted(async_to_sync(run)()), [0, 1])
+
+        expired_mock.assert_awaited_once_with([due.id])
+        self.assertEqual(entries.count(), logged + 1)
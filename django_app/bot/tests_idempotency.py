@@ -0,0 +1,148 @@
+"""
+Tests for duplicate update and double-tap protection
+"""
+
+import asyncio
+import os
+import pickle
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+from telegram.ext import ApplicationHandlerStop
+
+from . import idempotency
+from .idempotency import IdempotencyCache
+from .telegram_bot import TelegramBot
+
+
+class IdempotencyCacheTests(SimpleTestCase):
+    """Test the bounded update_id and action caches"""
+
+    def test_seen_update(self):
+        cache = IdempotencyCache(ttl=600, max_entries=10)
+        self.assertFalse(cache.seen_update(1))
+        self.assertTrue(cache.seen_update(1))
+        self.assertFalse(cache.seen_update(2))
+
+    def test_entries_expire_and_stay_bounded(self):
+        cache = IdempotencyCache(ttl=60, max_entries=3)
+        with mock.patch('bot.idempotency.time.time', return_value=1000):
+            for update_id in range(5):
+                cache.seen_update(update_id)
+            self.assertEqual(len(cache), 3)
+            self.assertFalse(cache.seen_update(0))
+        with mock.patch('bot.idempotency.time.time', return_value=1061):
+            self.assertFalse(cache.seen_update(4))
+            self.assertEqual(len(cache), 1)
+
+    def test_claim_complete_release(self):
+        cache = IdempotencyCache()
+        self.assertTrue(cache.claim('k'))
+        self.assertEqual(cache.lookup('k'), idempotency.IN_PROGRESS_TEXT)
+        self.assertFalse(cache.claim('k'))
+        cache.release('k')
+        self.assertIsNone(cache.lookup('k'))
+
+        cache.claim('k')
+        cache.complete('k', 'done')
+        self.assertEqual(cache.lookup('k'), 'done')
+
+    def test_pickle_drops_in_progress_claims(self):
+        cache = IdempotencyCache()
+        cache.claim('pending')
+        cache.claim('finished')
+        cache.complete('finished', 'done')
+
+        restored = pickle.loads(pickle.dumps(cache))
+        self.assertIsNone(restored.lookup('pending'))
+        self.assertEqual(restored.lookup('finished'), 'done')
+
+    def test_callback_keys(self):
+        self.assertEqual(idempotency.callback_key(7, 'offer_accept_3'), 'callback:7:offer_accept_3')
+        self.assertIsNone(idempotency.callback_key(7, 'offer_add_3'))
+        self.assertIsNone(idempotency.callback_key(7, 'city_1'))
+
+
+class _FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+class BotIdempotencyTests(SimpleTestCase):
+    """Test that repeats never reach the state-changing handlers"""
+
+    def setUp(self):
+        states_dir = tempfile.mkdtemp(prefix='bot-idempotency-')
+        self.addCleanup(shutil.rmtree, states_dir, ignore_errors=True)
+        self.states_file = os.path.join(states_dir, 'user_states.pickle')
+        overrides = override_settings(BOT_USER_STATES_FILE=self.states_file)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.bot = TelegramBot()
+        self.bot.check_user_status = mock.AsyncMock(return_value=True)
+        self.bot.get_or_create_user = mock.AsyncMock(return_value=SimpleNamespace(telegram_id=42))
+
+    def _tap(self, data):
+        query = _FakeQuery(data)
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=42), callback_query=query)
+        async_to_sync(self.bot.button_callback)(update, None)
+        return query
+
+    def test_double_tap_confirm_runs_once(self):
+        self.bot.confirm_request = mock.AsyncMock(return_value=True)
+
+        self._tap('confirm_request_ab12cd34')
+        repeat = self._tap('confirm_request_ab12cd34')
+
+        self.bot.confirm_request.assert_awaited_once()
+        self.assertEqual(repeat.answers, [idempotency.GUARDED_CALLBACKS['confirm_request_']])
+
+    def test_failed_action_can_be_retried(self):
+        self.bot.accept_offer = mock.AsyncMock(side_effect=[None, True])
+
+        self._tap('offer_accept_9')
+        self._tap('offer_accept_9')
+        repeat = self._tap('offer_accept_9')
+
+        self.assertEqual(self.bot.accept_offer.await_count, 2)
+        self.assertEqual(repeat.answers, [idempotency.GUARDED_CALLBACKS['offer_accept_']])
+
+    def test_concurrent_offer_submits_create_one_offer(self):
+        self.bot.user_states[42] = {'request_id': 7, 'offer_data': {'price': 150}}
+        user = SimpleNamespace(telegram_id=42)
+        messages = [SimpleNamespace(reply_text=mock.AsyncMock()) for _ in range(2)]
+
+        async def submit_twice():
+            await asyncio.gather(*(
+                self.bot.handle_offer_delivery_time_input(SimpleNamespace(message=message), user, '3 أيام')
+                for message in messages
+            ))
+
+        with mock.patch('bot.telegram_bot.Request') as request_model, \
+                mock.patch('bot.telegram_bot.Junkyard'), \
+                mock.patch('bot.telegram_bot.Offer') as offer_model, \
+                mock.patch('bot.services.workflow_service.process_junkyard_offer', new_callable=mock.AsyncMock):
+            request_model.objects.select_related.return_value.get.return_value = SimpleNamespace(order_id='REQ7')
+            async_to_sync(submit_twice)()
+
+        offer_model.objects.create.assert_called_once()
+        messages[1].reply_text.assert_awaited_once_with(idempotency.IN_PROGRESS_TEXT)
+
+    def test_redelivered_update_dropped_across_instances(self):
+        update = SimpleNamespace(update_id=1001)
+        async_to_sync(self.bot.drop_duplicate_update)(update, None)
+        self.bot.save_user_states()
+
+        # Inline webhook mode builds a fresh bot per update
+        fresh = TelegramBot()
+        with self.assertRaises(ApplicationHandlerStop):
+            async_to_sync(fresh.drop_duplicate_update)(update, None)
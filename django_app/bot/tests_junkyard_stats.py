@@ -0,0 +1,105 @@
+"""
+Tests for the incrementally maintained junkyard responsiveness counters
+"""
+
+import random
+import statistics
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import junkyard_stats
+from .junkyard_stats import StreamingMedian
+from .models import Brand, City, Junkyard, JunkyardStats, Model, Offer, Request, User
+
+
+class StreamingMedianTests(TestCase):
+    """Test the P² median estimator"""
+
+    def test_exact_for_small_streams(self):
+        estimator = StreamingMedian()
+        self.assertIsNone(estimator.value)
+        for x in (30, 10, 20, 40):
+            estimator.add(x)
+        self.assertEqual(estimator.value, 25)
+
+    def test_tracks_median_across_state_round_trips(self):
+        rng = random.Random(7)
+        values = [rng.expovariate(1 / 600) for _ in range(2000)]
+        state = {}
+        for x in values:
+            estimator = StreamingMedian(state)
+            estimator.add(x)
+            state = estimator.state()
+        true_median = statistics.median(values)
+        self.assertEqual(StreamingMedian(state).count, 2000)
+        self.assertAlmostEqual(StreamingMedian(state).value, true_median, delta=true_median * 0.1)
+
+
+class JunkyardStatsTests(TestCase):
+    """Test counters kept on notification, offer and acceptance events"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', telegram_id=111)
+        city = City.objects.create(name='Riyadh', code='RY')
+        brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=brand, name='Camry')
+        yard_user = User.objects.create_user(username='yard', telegram_id=222, first_name='Yard', user_type='junkyard')
+        self.junkyard = Junkyard.objects.create(user=yard_user, phone='050', city=city, location='-')
+
+    def _offer(self, minutes, status='pending'):
+        request = Request.objects.create(
+            user=self.customer, city=self.junkyard.city, brand=self.model.brand, model=self.model, year=2015,
+            status='active', expires_at=timezone.now(),
+        )
+        offer = Offer.objects.create(request=request, junkyard=self.junkyard, price=100, status=status)
+        Offer.objects.filter(id=offer.id).update(created_at=request.created_at + timedelta(minutes=minutes))
+        offer.refresh_from_db()
+        return offer
+
+    def test_records_workflow_events(self):
+        junkyard_stats.record_notified([self.junkyard.id])
+        junkyard_stats.record_notified([self.junkyard.id])
+        junkyard_stats.record_offer(self._offer(10))
+        offer = self._offer(30)
+        junkyard_stats.record_offer(offer)
+        junkyard_stats.record_acceptance(offer)
+
+        stats = JunkyardStats.objects.get(junkyard=self.junkyard)
+        self.assertEqual((stats.requests_received, stats.offers_made, stats.offers_accepted), (2, 2, 1))
+        self.assertEqual((stats.acceptance_rate, stats.response_rate), (0.5, 1.0))
+        self.assertEqual(stats.median_response_minutes, 20)
+        self.assertEqual(stats.last_offer_at, offer.created_at)
+
+    def test_reads_are_single_row(self):
+        self.assertEqual(junkyard_stats.stats_for(self.junkyard).offers_made, 0)
+        junkyard_stats.record_notified([self.junkyard.id])
+        junkyard = Junkyard.objects.get(id=self.junkyard.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(junkyard_stats.stats_for(junkyard).requests_received, 1)
+
+    def test_backfill_from_history(self):
+        for minutes in (5, 15, 60):
+            self._offer(minutes)
+        self._offer(20, status='accepted')
+        out = StringIO()
+        call_command('backfill_junkyard_stats', stdout=out)
+
+        stats = JunkyardStats.objects.get(junkyard=self.junkyard)
+        self.assertEqual((stats.offers_made, stats.offers_accepted, stats.requests_received), (4, 1, 4))
+        self.assertEqual(stats.median_response_minutes, 17.5)
+
+    def test_dashboard_shows_counters(self):
+        junkyard_stats.record_notified([self.junkyard.id])
+        junkyard_stats.record_offer(self._offer(10))
+        User.objects.create_superuser(username='admin', password='pw', telegram_id=999)
+        self.client.login(username='admin', password='pw')
+
+        response = self.client.get(reverse('dashboard:junkyard_detail', args=[self.junkyard.id]))
+        self.assertContains(response, '10 دقيقة')
+        response = self.client.get(reverse('dashboard:quick_fix_junkyard', args=[self.junkyard.id]))
+        self.assertContains(response, '1 / 1')
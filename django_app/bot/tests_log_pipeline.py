@@ -0,0 +1,126 @@
+"""
+Tests for the queued, rate-limited logging pipeline
+"""
+
+import json
+import logging
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .log_pipeline import JsonFormatter, PayloadSamplingFilter, QueueingHandler, RateLimitFilter
+
+
+def _record(msg='hello %s', args=('world',), name='bot.test', level=logging.INFO, **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class RateLimitFilterTests(SimpleTestCase):
+    """Test the per-logger token bucket"""
+
+    def test_limits_each_logger_separately(self):
+        limiter = RateLimitFilter(rate=1, burst=2)
+        with mock.patch('bot.log_pipeline.time.monotonic', return_value=100.0):
+            self.assertEqual([limiter.filter(_record()) for _ in range(4)], [True, True, False, False])
+            self.assertTrue(limiter.filter(_record(name='bot.other')))
+            self.assertTrue(limiter.filter(_record(level=logging.ERROR)))
+
+        with mock.patch('bot.log_pipeline.time.monotonic', return_value=101.0):
+            record = _record()
+            self.assertTrue(limiter.filter(record))
+            self.assertEqual(record.suppressed, 2)
+
+
+class PayloadSamplingTests(SimpleTestCase):
+    """Test sampling and truncation of oversized messages"""
+
+    def test_samples_large_payloads(self):
+        sampler = PayloadSamplingFilter(max_chars=50, sample_every=3)
+        payload = {'update_id': 1, 'message': {'text': 'x' * 100}}
+        kept = [sampler.filter(_record('Update data: %s', (payload,))) for _ in range(6)]
+        self.assertEqual(kept, [True, False, False, True, False, False])
+        self.assertTrue(sampler.filter(_record()))
+
+    def test_sizes_containers_without_rendering_them(self):
+        class Unrenderable:
+            def __repr__(self):
+                raise AssertionError('rendered')
+
+        sampler = PayloadSamplingFilter(max_chars=50, sample_every=2)
+        payload = ['x' * 100, Unrenderable()]
+        self.assertEqual([sampler.filter(_record('%s', (payload,))) for _ in range(2)], [True, False])
+
+    def test_objects_are_sized_after_formatting(self):
+        class Update:
+            def __str__(self):
+                return 'u' * 100
+
+        handler = QueueingHandler(console=False)
+        self.addCleanup(handler.close)
+        handler.sampler.max_chars, handler.sampler.sample_every = 50, 2
+        prepared = []
+        for _ in range(2):
+            record = _record('update %s', (Update(),))
+            self.assertTrue(handler.sampler.filter(record))
+            prepared.append(handler.prepare(record))
+        self.assertEqual(prepared[0].msg, 'update ' + 'u' * 100)
+        self.assertIsNone(prepared[1])
+
+    def test_json_formatter_truncates_and_keeps_extras(self):
+        formatter = JsonFormatter(max_chars=20)
+        entry = json.loads(formatter.format(_record('%s', ('y' * 30,), chat_id=7)))
+
+        self.assertEqual(entry['message'], 'y' * 20 + '... (+10 chars)')
+        self.assertEqual((entry['level'], entry['logger'], entry['chat_id']), ('INFO', 'bot.test', 7))
+
+
+class QueueingHandlerTests(SimpleTestCase):
+    """Test that records reach the sinks through the listener thread"""
+
+    def test_writes_json_lines_off_thread(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            path = os.path.join(log_dir, 'bot.log')
+            handler = QueueingHandler(filename=path, console=False)
+            logger = logging.getLogger('bot.tests_log_pipeline')
+            logger.addHandler(handler)
+            self.addCleanup(logger.removeHandler, handler)
+            try:
+                logger.warning('queued %s', 'record')
+                try:
+                    raise ValueError('boom')
+                except ValueError:
+                    logger.exception('failed')
+            finally:
+                handler.close()
+
+            with open(path, encoding='utf-8') as log_file:
+                lines = [json.loads(line) for line in log_file]
+        self.assertEqual([line['message'] for line in lines], ['queued record', 'failed'])
+        self.assertIn('ValueError: boom', lines[1]['exc'])
+
+    def test_mutable_arguments_formatted_when_enqueued(self):
+        handler = QueueingHandler(console=False)
+        self.addCleanup(handler.close)
+        state = {'step': 'select_city'}
+
+        prepared = handler.prepare(_record('state %s', (state,)))
+        state['step'] = 'confirm'
+        self.assertEqual(prepared.getMessage(), "state {'step': 'select_city'}")
+        self.assertIsNone(prepared.args)
+
+        lazy = handler.prepare(_record('user %s step %d', ('ali', 3)))
+        self.assertEqual(lazy.args, ('ali', 3))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = QueueingHandler(console=False, queue_size=1)
+        handler.listener.stop()  # Nothing drains the queue
+        try:
+            handler.handle(_record())
+            handler.handle(_record())
+            self.assertEqual(handler.queue.qsize(), 1)
+        finally:
+            handler.close()
@@ -0,0 +1,104 @@
+"""
+Tests for brand-specialization matching of order fan-out
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import matching
+from .models import Brand, City, Junkyard, JunkyardSpecialization, Model, Offer, Request, User
+
+
+@override_settings(MATCHING_MIN_RECIPIENTS=2, MATCHING_MIN_HISTORY=2)
+class MatchingTests(TestCase):
+    """Test the (city, brand) index and recipient selection"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', telegram_id=111)
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        self.other_city = City.objects.create(name='Jeddah', code='JD')
+        self.toyota = Brand.objects.create(name='Toyota')
+        self.nissan = Brand.objects.create(name='Nissan')
+        self.camry = Model.objects.create(brand=self.toyota, name='Camry')
+        self.sunny = Model.objects.create(brand=self.nissan, name='Sunny')
+
+    def _junkyard(self, name, city=None, brands=()):
+        user = User.objects.create_user(
+            username=name, telegram_id=1000 + User.objects.count(), first_name=name, user_type='junkyard',
+        )
+        junkyard = Junkyard.objects.create(user=user, phone='050', city=city or self.city, location='-')
+        junkyard.brands.set(brands)
+        return junkyard
+
+    def _request(self, model):
+        return Request.objects.create(
+            user=self.customer, city=self.city, brand=model.brand, model=model, year=2015,
+            status='active', expires_at=timezone.now(),
+        )
+
+    def _offers(self, junkyard, model, count, accepted=0):
+        for i in range(count):
+            Offer.objects.create(
+                request=self._request(model), junkyard=junkyard, price=100,
+                status='accepted' if i < accepted else 'pending',
+            )
+
+    def test_index_from_declared_brands_and_history(self):
+        declared = self._junkyard('Declared', brands=[self.toyota])
+        learned = self._junkyard('Learned')
+        self._offers(learned, self.sunny, 3, accepted=1)
+        newcomer = self._junkyard('Newcomer')
+        self._offers(newcomer, self.sunny, 1)
+
+        matching.rebuild_index()
+
+        rows = {(row.junkyard_id, row.brand_id): row for row in JunkyardSpecialization.objects.all()}
+        self.assertEqual(set(rows), {(declared.id, self.toyota.id), (learned.id, self.nissan.id)})
+        self.assertTrue(rows[declared.id, self.toyota.id].declared)
+        self.assertEqual(rows[learned.id, self.nissan.id].score, 3 + 1 * 3.0)
+
+    def test_declared_brands_reindex_immediately(self):
+        junkyard = self._junkyard('Yard', brands=[self.toyota])
+        self.assertTrue(JunkyardSpecialization.objects.filter(junkyard=junkyard, brand=self.toyota).exists())
+        junkyard.brands.set([self.nissan])
+        self.assertEqual(
+            list(JunkyardSpecialization.objects.filter(junkyard=junkyard).values_list('brand', flat=True)),
+            [self.nissan.id],
+        )
+
+    def test_targets_specialists_plus_generalists(self):
+        first = self._junkyard('Toyota1', brands=[self.toyota])
+        second = self._junkyard('Toyota2', brands=[self.toyota])
+        self._offers(second, self.camry, 1, accepted=1)
+        self._junkyard('Nissan', brands=[self.nissan])
+        generalist = self._junkyard('General')
+        self._junkyard('Elsewhere', city=self.other_city, brands=[self.toyota])
+        matching.rebuild_index()
+
+        junkyards, mode = matching.recipients_for(self._request(self.camry))
+        self.assertEqual(mode, 'targeted')
+        self.assertEqual(junkyards, [second, first, generalist])
+
+        with override_settings(MATCHING_MAX_RECIPIENTS=1):
+            junkyards, _ = matching.recipients_for(self._request(self.camry))
+        self.assertEqual(junkyards, [second, generalist])
+
+    def test_falls_back_to_whole_city(self):
+        self._junkyard('Toyota1', brands=[self.toyota])
+        self._junkyard('Nissan', brands=[self.nissan])
+        self._junkyard('General')
+
+        junkyards, mode = matching.recipients_for(self._request(self.camry))
+        self.assertEqual((mode, len(junkyards)), ('city', 3))
+
+        with override_settings(MATCHING_ENABLED=False):
+            self.assertEqual(matching.recipients_for(self._request(self.sunny))[1], 'city')
+
+    def test_rebuild_command(self):
+        self._junkyard('Yard', brands=[self.toyota, self.nissan])
+        out = StringIO()
+        call_command('rebuild_junkyard_index', stdout=out)
+        self.assertIn('2', out.getvalue())
@@ -0,0 +1,61 @@
+"""
+Tests for normalized media assets
+"""
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .models import Brand, City, MediaAsset, Model, Request, RequestItem
+from .services import OrderWorkflowService
+
+User = get_user_model()
+
+
+class MediaAssetTests(TestCase):
+    """Test MediaAsset registration and photo lookups"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='customer', telegram_id=111)
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        self.brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=self.brand, name='Camry')
+        self.request = Request.objects.create(
+            user=self.user, city=self.city, brand=self.brand, model=self.model, year=2020,
+            media_files=[{"type": "video", "file_id": "vid1", "file_unique_id": "uv1"}],
+        )
+        photo = {"type": "photo", "file_id": "big1", "file_unique_id": "u1", "thumb_file_id": "small1"}
+        self.item1 = RequestItem.objects.create(request=self.request, name='Door', media_files=[photo])
+        # Same photo re-uploaded for another item (different file_id, same file_unique_id)
+        self.item2 = RequestItem.objects.create(
+            request=self.request, name='Mirror',
+            media_files=[dict(photo, file_id='big1-again'), {"type": "photo", "file_id": "legacy"}],
+        )
+
+    def test_register_deduplicates_by_file_unique_id(self):
+        MediaAsset.register_for_request(self.request)
+
+        assets = MediaAsset.objects.filter(request=self.request)
+        self.assertEqual(assets.count(), 3)
+        self.assertEqual(assets.filter(file_unique_id='u1').count(), 1)
+        self.assertEqual(assets.get(file_unique_id='legacy').thumb_file_id, 'legacy')
+        self.assertEqual(assets.get(media_type='video').thumbnail_status, 'not_applicable')
+
+        # Registering again is a no-op
+        MediaAsset.register_for_request(self.request)
+        self.assertEqual(MediaAsset.objects.filter(request=self.request).count(), 3)
+
+    def test_request_photos_single_query(self):
+        MediaAsset.register_for_request(self.request)
+        service = OrderWorkflowService()
+
+        with CaptureQueriesContext(connection) as ctx:
+            photos = async_to_sync(service._get_request_photos)(self.request)
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(
+            sorted(photo['file_id'] for photo in photos),
+            ['big1', 'legacy'],
+        )
@@ -0,0 +1,86 @@
+"""
+Tests for the buffered Telegram message log
+"""
+
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from telegram import Update
+
+from .message_log import MessageLog
+from .models import TelegramMessage, User
+
+
+def _update(update_id, user_id=42, text='hi'):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Client'},
+        },
+    }, None)
+
+
+class MessageLogTests(TestCase):
+    """Test buffering, batching and the drop policy"""
+
+    def test_flush_writes_inbound_and_outbound(self):
+        user = User.objects.create(username='client', telegram_id=42)
+        log = MessageLog(batch_size=2)
+        log.record_update(_update(7))
+        log.record_api_call('sendMessage', {'chat_id': 42, 'text': 'reply'}, 200,
+                            json.dumps({'ok': True, 'result': {'message_id': 8}}).encode())
+        log.record_api_call('sendMessage', {'chat_id': '@channel', 'text': 'x'}, 400,
+                            json.dumps({'ok': False, 'description': 'Bad Request'}).encode())
+        log.record_api_call('getUpdates', {}, 200, b'{"ok": true, "result": []}')
+
+        self.assertEqual(len(log), 3)
+        with self.assertNumQueries(3):  # user lookup + insert, then an insert (no user ids)
+            self.assertEqual(log.flush(), 3)
+
+        inbound, outbound, failed = TelegramMessage.objects.order_by('id')
+        self.assertEqual((inbound.user, inbound.telegram_message_id, inbound.message_type), (user, 7, 'in:message'))
+        self.assertEqual(inbound.content['message']['text'], 'hi')
+        self.assertEqual((outbound.user, outbound.telegram_message_id, outbound.message_type), (user, 8, 'out:sendMessage'))
+        self.assertEqual(outbound.content['request']['text'], 'reply')
+        self.assertIsNone(failed.user)
+        self.assertEqual(failed.content['error'], 'Bad Request')
+        self.assertEqual(len(log), 0)
+
+    def test_drop_oldest(self):
+        log = MessageLog(buffer_size=2)
+        for update_id in (1, 2, 3):
+            log.record_update(_update(update_id))
+        log.flush()
+        self.assertEqual(list(TelegramMessage.objects.values_list('telegram_message_id', flat=True)), [2, 3])
+
+    def test_drop_newest(self):
+        log = MessageLog(buffer_size=2, drop_policy='newest')
+        for update_id in (1, 2, 3):
+            log.record_update(_update(update_id))
+        log.flush()
+        self.assertEqual(list(TelegramMessage.objects.values_list('telegram_message_id', flat=True)), [1, 2])
+
+
+class PruneMessageLogTests(TestCase):
+    """Test the retention command"""
+
+    def test_prunes_in_batches(self):
+        TelegramMessage.objects.bulk_create(
+            [TelegramMessage(telegram_message_id=i, message_type='in:message', content={}) for i in range(5)]
+        )
+        TelegramMessage.objects.update(created_at=timezone.now() - timedelta(days=40))
+        recent = TelegramMessage.objects.create(telegram_message_id=99, message_type='in:message', content={})
+
+        out = StringIO()
+        call_command('prune_message_log', '--days', '30', '--dry-run', stdout=out)
+        self.assertIn('5', out.getvalue())
+        self.assertEqual(TelegramMessage.objects.count(), 6)
+
+        call_command('prune_message_log', '--days', '30', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(list(TelegramMessage.objects.all()), [recent])
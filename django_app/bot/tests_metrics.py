@@ -0,0 +1,85 @@
+"""
+Tests for the in-process metrics registry and /metrics endpoint
+"""
+
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import metrics
+from .models import City
+
+
+class MetricsRegistryTests(TestCase):
+    """Test metric types and text exposition"""
+
+    def test_render_counter_and_histogram(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter('demo_calls_total', 'Demo calls', ['route'])
+        histogram = registry.histogram('demo_seconds', 'Demo latency', buckets=(0.1, 1.0))
+
+        counter.inc(route='city')
+        counter.inc(2, route='city')
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+
+        text = registry.render()
+        self.assertIn('# TYPE demo_calls_total counter', text)
+        self.assertIn('demo_calls_total{route="city"} 3', text)
+        self.assertIn('demo_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('demo_seconds_bucket{le="1"} 2', text)
+        self.assertIn('demo_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('demo_seconds_count 2', text)
+
+        with self.assertRaises(ValueError):
+            counter.inc(step='city')
+
+    def test_callback_route(self):
+        self.assertEqual(metrics.callback_route('offer_accept_42'), 'offer_accept')
+        self.assertEqual(metrics.callback_route('confirm_request_3fa9c2d1'), 'confirm_request')
+        self.assertEqual(metrics.callback_route('year_range_2020_2024'), 'year_range')
+        self.assertEqual(metrics.callback_route('start_bot'), 'start_bot')
+        self.assertEqual(metrics.callback_route(''), 'unknown')
+
+    def test_telegram_error_class(self):
+        self.assertEqual(metrics.telegram_error_class(429, 'Too Many Requests: retry after 5'), 'rate_limited')
+        self.assertEqual(metrics.telegram_error_class(403, 'Forbidden: bot was blocked by the user'), 'forbidden')
+        self.assertEqual(metrics.telegram_error_class(400, 'Bad Request: chat not found'), 'chat_not_found')
+        self.assertEqual(metrics.telegram_error_class(502), 'http_502')
+
+    def test_instrument_handler_counts_db_queries(self):
+        async def handler(update, context):
+            await sync_to_async(lambda: list(City.objects.all()))()
+            await sync_to_async(City.objects.count)()
+
+        update = SimpleNamespace(callback_query=SimpleNamespace(data='city_7'))
+        wrapped = metrics.instrument_handler('test', handler)
+        before = metrics.UPDATE_DB_QUERIES.count(handler='test')
+        state = metrics.UPDATE_DB_QUERIES._values.get(('test',))
+        sum_before = state['sum'] if state else 0
+
+        async_to_sync(wrapped)(update, None)
+
+        self.assertEqual(metrics.UPDATE_DB_QUERIES.count(handler='test'), before + 1)
+        self.assertEqual(metrics.UPDATE_DB_QUERIES._values[('test',)]['sum'] - sum_before, 2)
+        self.assertGreaterEqual(metrics.HANDLER_LATENCY.count(handler='test', route='city'), 1)
+
+
+class MetricsEndpointTests(TestCase):
+    """Test the /metrics view"""
+
+    def test_exposition(self):
+        metrics.ORDER_FANOUT.observe(3)
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'bot_order_fanout_junkyards_count', response.content)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_required(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
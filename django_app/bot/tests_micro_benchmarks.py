@@ -0,0 +1,37 @@
+"""
+Tests for the micro-benchmark suite
+"""
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from benchmarks import micro
+
+
+class MicroBenchmarkCompareTests(SimpleTestCase):
+    """Test regression detection between two runs"""
+
+    def test_compare_statuses(self):
+        baseline = {'results': {'a': {'min_us': 100.0}, 'b': {'min_us': 100.0}, 'c': {'min_us': 100.0}}}
+        current = {'results': {
+            'a': {'min_us': 130.0}, 'b': {'min_us': 70.0}, 'c': {'min_us': 110.0}, 'd': {'min_us': 5.0},
+        }}
+
+        statuses = {row['name']: row['status'] for row in micro.compare(current, baseline, threshold=0.2)}
+        self.assertEqual(statuses, {'a': 'regression', 'b': 'improvement', 'c': 'unchanged', 'd': 'new'})
+
+    def test_arabic_corpus_is_deterministic(self):
+        self.assertEqual(micro.arabic_corpus(20), micro.arabic_corpus(20))
+        self.assertEqual(len(micro.arabic_corpus(20)), 20)
+
+
+class MicroBenchmarkRunTests(TransactionTestCase):
+    """Run a few cheap benchmarks end to end"""
+
+    def test_run_subset(self):
+        names = micro.select(['keyboard.brands', 'render.junkyard_notification', 'order_id.generate[100/day]'])
+        report = micro.run_benchmarks(names, repeat=1)
+
+        self.assertEqual(set(report['results']), set(names))
+        for stats in report['results'].values():
+            self.assertGreater(stats['min_us'], 0)
+        self.assertEqual(report['meta']['database'], 'sqlite')
@@ -0,0 +1,99 @@
+"""
+Tests for the ranked offer comparison board
+"""
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import offer_board
+from .models import Brand, City, Junkyard, Model, Offer, OfferItem, Request, RequestItem, User
+
+
+class OfferBoardTests(TestCase):
+    """Test loading, ranking, paging and caching of the offer board"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user(username='customer', telegram_id=111, first_name='Client')
+        self.city = City.objects.create(name='Riyadh', code='RY')
+        brand = Brand.objects.create(name='Toyota')
+        model = Model.objects.create(brand=brand, name='Camry')
+        self.request = Request.objects.create(
+            user=self.customer, city=self.city, brand=brand, model=model, year=2015,
+            status='active', expires_at=timezone.now(),
+        )
+        self.item = RequestItem.objects.create(request=self.request, name='مصد أمامي', unit_price=0)
+
+    def _offer(self, name, price, rating=0, verified=False, status='pending'):
+        user = User.objects.create_user(
+            username=name, telegram_id=1000 + User.objects.count(), first_name=name, user_type='junkyard',
+        )
+        junkyard = Junkyard.objects.create(
+            user=user, phone='0500000000', city=self.city, location='-',
+            average_rating=rating, is_verified=verified,
+        )
+        offer = Offer.objects.create(request=self.request, junkyard=junkyard, price=price, status=status)
+        OfferItem.objects.create(offer=offer, request_item=self.item, price=price)
+        return offer
+
+    def test_loads_board_in_one_query(self):
+        self._offer('A', 500)
+        self._offer('B', 400)
+        with self.assertNumQueries(1):
+            offers = offer_board.load_offers(self.request.id, self.customer)
+            for offer in offers:
+                offer.junkyard.user.first_name, offer.request.brand.name, offer.request.model.name
+        self.assertEqual([offer.items_count for offer in offers], [1, 1])
+
+    def test_ranks_by_status_then_score(self):
+        cheap = self._offer('Cheap', 400, rating=2)
+        trusted = self._offer('Trusted', 420, rating=5, verified=True)
+        pricey = self._offer('Pricey', 1000, rating=3)
+        accepted = self._offer('Accepted', 2000, status='accepted')
+        locked = self._offer('Locked', 100, rating=5, status='locked')
+
+        offers = offer_board.load_offers(self.request.id, self.customer)
+        ranked = offer_board.rank_offers(offers)
+        self.assertEqual([offer.id for offer in ranked], [accepted.id, trusted.id, cheap.id, pricey.id, locked.id])
+
+        price_only = offer_board.rank_offers(offers, {'price': 1, 'rating': 0, 'verified': 0})
+        self.assertEqual([offer.id for offer in price_only][1:3], [cheap.id, trusted.id])
+
+    @override_settings(OFFER_BOARD_PAGE_SIZE=2)
+    def test_pages_and_buttons(self):
+        for i in range(5):
+            self._offer(f'Y{i}', 100 + i)
+
+        text, buttons = offer_board.get_board(self.request.id, self.customer, page=2)
+        self.assertIn('الصفحة 2 من 3', text)
+        callbacks = [callback for row in buttons for _, callback in row]
+        self.assertEqual(sum(callback.startswith('offer_accept_') for callback in callbacks), 2)
+        self.assertIn(f'view_all_offers_{self.request.id}_1', callbacks)
+        self.assertIn(f'view_all_offers_{self.request.id}_3', callbacks)
+        self.assertEqual(callbacks[-1], 'back_to_main')
+
+        # Other customers see nothing
+        stranger = User.objects.create_user(username='stranger', telegram_id=999)
+        self.assertIsNone(offer_board.get_board(self.request.id, stranger))
+
+    def test_cache_invalidated_by_offer_changes(self):
+        offer = self._offer('A', 500)
+        offer_board.get_board(self.request.id, self.customer)
+        with self.assertNumQueries(0):
+            offer_board.get_board(self.request.id, self.customer)
+
+        offer.price = 450
+        offer.save()
+        text, _ = offer_board.get_board(self.request.id, self.customer)
+        self.assertIn('450', text)
+
+        self._offer('B', 300)
+        text, _ = offer_board.get_board(self.request.id, self.customer)
+        self.assertIn('📊 عدد العروض: 2', text)
+
+        # Bulk updates bypass signals and bump the version explicitly
+        Offer.objects.filter(request=self.request).update(status='locked')
+        offer_board.bump_version(self.request.id)
+        _, buttons = offer_board.get_board(self.request.id, self.customer)
+        self.assertFalse(any(callback.startswith('offer_accept_') for row in buttons for _, callback in row))
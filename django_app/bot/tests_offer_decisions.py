@@ -0,0 +1,91 @@
+"""
+Tests for conditional accept/reject transitions of offers
+"""
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from django.utils import timezone
+
+from . import offer_decisions
+from .models import Brand, ChangeLogEntry, City, Junkyard, Model, Offer, Request, User
+from .services import OrderWorkflowService
+
+
+class OfferDecisionTests(TestCase):
+    """Test that decisions are single-winner and cost a fixed number of statements"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', telegram_id=111, first_name='Client')
+        city = City.objects.create(name='Riyadh', code='RY')
+        brand = Brand.objects.create(name='Toyota')
+        model = Model.objects.create(brand=brand, name='Camry')
+        self.request = Request.objects.create(
+            user=self.customer, city=city, brand=brand, model=model, year=2015,
+            status='active', expires_at=timezone.now(),
+        )
+        self.offers = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'yard{i}', telegram_id=200 + i, first_name=f'Yard{i}', user_type='junkyard')
+            junkyard = Junkyard.objects.create(user=user, phone='050', city=city, location='-')
+            self.offers.append(Offer.objects.create(request=self.request, junkyard=junkyard, price=100 + i))
+        ChangeLogEntry.objects.all().delete()
+
+    def _statuses(self):
+        return list(Offer.objects.order_by('id').values_list('status', flat=True))
+
+    def test_accept_locks_siblings_in_fixed_statements(self):
+        Offer.objects.filter(id=self.offers[3].id).update(status='rejected')
+        offer = Offer.objects.select_related('request').get(id=self.offers[1].id)
+
+        # Savepoint, request claim, offer update, sibling lock, changes-feed insert, release
+        with self.assertNumQueries(6):
+            applied, locked_ids = offer_decisions.accept(offer)
+
+        self.assertTrue(applied)
+        self.assertEqual(sorted(locked_ids), [self.offers[0].id, self.offers[2].id])
+        self.assertEqual(self._statuses(), ['locked', 'accepted', 'locked', 'rejected'])
+        self.assertEqual((offer.status, offer.request.status), ('accepted', 'accepted'))
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'accepted')
+        self.assertEqual(ChangeLogEntry.objects.count(), 4)
+
+    def test_second_accept_loses(self):
+        first, second = self.offers[0], Offer.objects.get(id=self.offers[1].id)
+        self.assertEqual(offer_decisions.accept(first), (True, [o.id for o in self.offers[1:]]))
+
+        # A stale copy still says pending; the database says otherwise
+        self.assertEqual(second.status, 'pending')
+        self.assertEqual(offer_decisions.accept(second), (False, []))
+        self.assertEqual(self._statuses(), ['accepted', 'locked', 'locked', 'locked'])
+
+    def test_accept_of_non_pending_offer_changes_nothing(self):
+        Offer.objects.filter(id=self.offers[0].id).update(status='rejected')
+        self.assertEqual(offer_decisions.accept(self.offers[0]), (False, []))
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'active')
+        self.assertEqual(self._statuses(), ['rejected', 'pending', 'pending', 'pending'])
+
+    def test_accept_on_expired_request_changes_nothing(self):
+        Request.objects.filter(id=self.request.id).update(status='expired')
+        self.assertEqual(offer_decisions.accept(self.offers[0]), (False, []))
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'expired')
+        self.assertEqual(self._statuses(), ['pending', 'pending', 'pending', 'pending'])
+        self.assertFalse(ChangeLogEntry.objects.exists())
+
+    def test_reject_only_pending(self):
+        self.assertTrue(offer_decisions.reject(self.offers[0]))
+        self.assertFalse(offer_decisions.reject(Offer.objects.get(id=self.offers[0].id)))
+        self.assertEqual(self._statuses(), ['rejected', 'pending', 'pending', 'pending'])
+
+    def test_workflow_skips_notifications_for_lost_decision(self):
+        service = OrderWorkflowService()
+        offer_decisions.accept(self.offers[0])
+        with mock.patch.object(service, '_notify_junkyard_about_acceptance') as notify, \
+                mock.patch.object(service, '_send_decision_confirmation_to_customer') as confirm:
+            applied = async_to_sync(service.process_customer_offer_decision)(self.offers[1], 'accept', self.customer)
+        self.assertFalse(applied)
+        notify.assert_not_called()
+        confirm.assert_not_called()
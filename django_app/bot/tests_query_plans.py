@@ -0,0 +1,105 @@
+"""
+Query plan regression tests for the hot query shapes.
+
+Each query is EXPLAINed against a seeded database and the test fails when the
+plan falls back to a full table scan. On PostgreSQL sequential scans are
+disabled for the check, so a Seq Scan in the plan means no usable index exists.
+"""
+
+import re
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Brand, City, Junkyard, JunkyardSpecialization, Model, Offer, Request
+
+User = get_user_model()
+
+
+class QueryPlanTests(TestCase):
+    """Fail when a hot query regresses to a sequential scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cities = [City.objects.create(name=f'City {i}', code=f'C{i}') for i in range(5)]
+        cls.brand = brand = Brand.objects.create(name='Toyota')
+        model = Model.objects.create(brand=brand, name='Camry')
+        cls.users = User.objects.bulk_create([
+            User(username=f'user{i}', telegram_id=10_000 + i) for i in range(50)
+        ])
+        junkyard_users = User.objects.bulk_create([
+            User(username=f'junkyard{i}', telegram_id=20_000 + i, user_type='junkyard') for i in range(20)
+        ])
+        cls.junkyards = Junkyard.objects.bulk_create([
+            Junkyard(user=user, phone='050', city=cls.cities[i % 5], location='-', is_active=i % 4 != 0)
+            for i, user in enumerate(junkyard_users)
+        ])
+
+        now = timezone.now()
+        statuses = ['new', 'active', 'accepted', 'expired', 'cancelled']
+        requests = Request.objects.bulk_create([
+            Request(
+                order_id=f'ORD{i:05d}', user=cls.users[i % 50], city=cls.cities[i % 5],
+                brand=brand, model=model, year=2020, status=statuses[i % 5],
+                expires_at=now + timedelta(hours=(i % 12) - 6),
+            )
+            for i in range(500)
+        ])
+        Offer.objects.bulk_create([
+            Offer(request=request, junkyard=cls.junkyards[i % 20], price=100,
+                  status='pending' if i % 3 else 'rejected')
+            for i, request in enumerate(requests)
+        ])
+        cls.request = requests[0]
+
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, msg=f"Sequential scan in plan:\n{plan}")
+        elif connection.vendor == 'sqlite':
+            # "SCAN <table>" without "USING ... INDEX" is a full table scan
+            full_scans = [
+                line for line in plan.splitlines()
+                if re.search(r'\bSCAN \w+', line) and 'INDEX' not in line
+            ]
+            self.assertEqual(full_scans, [], msg=f"Full table scan in plan:\n{plan}")
+
+    def test_requests_by_status(self):
+        self.assertUsesIndex(Request.objects.filter(status='new'))
+
+    def test_requests_by_city_recent(self):
+        self.assertUsesIndex(Request.objects.filter(city=self.cities[0]).order_by('-created_at')[:20])
+
+    def test_requests_by_user_recent(self):
+        self.assertUsesIndex(Request.objects.filter(user=self.users[0]).order_by('-created_at')[:10])
+
+    def test_expired_requests(self):
+        self.assertUsesIndex(Request.objects.filter(expires_at__lt=timezone.now()))
+
+    def test_open_requests_due(self):
+        self.assertUsesIndex(
+            Request.objects.filter(status__in=Request.OPEN_STATUSES, expires_at__lte=timezone.now())
+        )
+
+    def test_pending_offers_for_request(self):
+        self.assertUsesIndex(Offer.objects.filter(request=self.request, status='pending'))
+
+    def test_active_junkyards_in_city(self):
+        self.assertUsesIndex(Junkyard.objects.filter(city=self.cities[0], is_active=True))
+
+    def test_specialists_for_city_brand(self):
+        self.assertUsesIndex(
+            JunkyardSpecialization.objects.filter(city=self.cities[0], brand=self.brand).order_by('-score')
+        )
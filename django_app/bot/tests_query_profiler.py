@@ -0,0 +1,90 @@
+"""
+Tests for the query profiler and N+1 detector
+"""
+
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import query_profiler
+from .models import Brand, Model
+
+
+class NormalizeSqlTests(SimpleTestCase):
+    """Test statement shape normalization"""
+
+    def test_literals_collapse(self):
+        first = query_profiler.normalize_sql('SELECT * FROM "bot_model" WHERE "bot_model"."brand_id" = 12 LIMIT 21')
+        second = query_profiler.normalize_sql('SELECT *  FROM "bot_model"\nWHERE "bot_model"."brand_id" = 7 LIMIT 21')
+        self.assertEqual(first, second)
+        self.assertEqual(
+            query_profiler.normalize_sql("SELECT 1 FROM t WHERE name = 'O''Brien' AND id IN (%s, %s, %s)"),
+            'SELECT ? FROM t WHERE name = ? AND id IN (...)',
+        )
+
+    def test_identifiers_keep_digits(self):
+        sql = 'SELECT "U0"."id" FROM "bot_offer" U0 WHERE U0."request_id" = %s'
+        self.assertEqual(query_profiler.normalize_sql(sql), sql.replace('%s', '?'))
+
+
+@override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_REPEAT_THRESHOLD=3, QUERY_PROFILER_BUDGET=0)
+class QueryProfilerTests(TestCase):
+    """Test N+1 detection in handlers and dashboard requests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Toyota')
+        for name in ('Camry', 'Corolla', 'Land Cruiser', 'Yaris'):
+            Model.objects.create(brand=brand, name=name)
+
+    def setUp(self):
+        query_profiler.install()
+        query_profiler.reset()
+
+    @staticmethod
+    def _lazy_brand_names():
+        return [model.brand.name for model in Model.objects.all()]
+
+    def test_handler_n_plus_one_logged(self):
+        async def handler(update, context):
+            await sync_to_async(self._lazy_brand_names)()
+
+        update = SimpleNamespace(callback_query=SimpleNamespace(data='brand_5'))
+        wrapped = query_profiler.profile_handler('callback', handler)
+
+        with self.assertLogs('bot.query_profiler', level='WARNING') as logs:
+            async_to_sync(wrapped)(update, None)
+
+        self.assertIn('Possible N+1 in callback:brand: 4×', logs.output[0])
+        offenders = query_profiler.worst_offenders()
+        self.assertEqual(len(offenders), 1)
+        self.assertEqual(offenders[0]['scope'], 'callback:brand')
+        self.assertEqual(offenders[0]['max_repeats'], 4)
+        self.assertIn('"bot_brand"', offenders[0]['shape'])
+
+    def test_select_related_is_clean(self):
+        with query_profiler.profile_scope('clean') as profile:
+            [model.brand.name for model in Model.objects.select_related('brand')]
+        self.assertEqual(profile.total, 1)
+        self.assertEqual(query_profiler.worst_offenders(), [])
+
+    @override_settings(QUERY_PROFILER_BUDGET=2)
+    def test_middleware_budget_and_repeats(self):
+        def view(request):
+            self._lazy_brand_names()
+            return HttpResponse('ok')
+
+        middleware = query_profiler.QueryProfilerMiddleware(view)
+        with self.assertLogs('bot.query_profiler', level='WARNING') as logs:
+            middleware(RequestFactory().get('/dashboard/models/'))
+
+        self.assertTrue(any('ran 5 queries (budget 2)' in line for line in logs.output))
+        self.assertEqual(query_profiler.worst_offenders()[0]['scope'], 'GET /dashboard/models/')
+
+    @override_settings(QUERY_PROFILER_ENABLED=False)
+    def test_middleware_unused_when_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            query_profiler.QueryProfilerMiddleware(lambda request: HttpResponse())
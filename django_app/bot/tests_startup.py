@@ -0,0 +1,56 @@
+"""
+Tests for lazy imports at process startup
+"""
+
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from benchmarks import startup
+
+
+class StartupImportTests(SimpleTestCase):
+    """Boot Django in a fresh interpreter and check what it imports"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.modules = startup.measure()
+
+    def test_urlconf_does_not_import_telegram(self):
+        self.assertIn('bot.views', self.modules)
+        self.assertEqual(startup.heavy_imports(self.modules), [])
+
+    def test_urlconf_import_budget(self):
+        elapsed = startup.cumulative_ms(self.modules, 'auto_parts_bot.urls')
+        self.assertLess(elapsed, startup.URLCONF_BUDGET_MS, f"URLconf took {elapsed:.0f}ms to import")
+
+
+class ImportTimeParsingTests(SimpleTestCase):
+    """Test the -X importtime report parser"""
+
+    def test_parse(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   telegram._bot\n"
+            "import time:        80 |        200 | telegram\n"
+        )
+        modules = startup.parse_importtime(output)
+
+        self.assertEqual(modules, {'telegram._bot': (120, 120), 'telegram': (80, 200)})
+        self.assertEqual(startup.heavy_imports(modules), ['telegram', 'telegram._bot'])
+        self.assertEqual(startup.cumulative_ms(modules, 'telegram'), 0.2)
+
+
+class LazyBotInstanceTests(SimpleTestCase):
+    """Test the lazily created module-level bot"""
+
+    def test_created_once_on_first_use(self):
+        from . import telegram_bot as module
+
+        with mock.patch.object(module, '_telegram_bot', None), \
+                mock.patch.object(module, 'TelegramBot') as bot_class:
+            first = module.telegram_bot
+            self.assertIs(module.get_telegram_bot(), first)
+
+        bot_class.assert_called_once_with()
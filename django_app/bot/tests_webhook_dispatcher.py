@@ -0,0 +1,187 @@
+"""
+Tests for background webhook processing
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from . import webhook_dispatcher
+from .webhook_dispatcher import WebhookDispatcher, chat_key
+
+
+def _message(update_id, chat_id):
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'chat': {'id': chat_id}, 'text': 'hi'}}
+
+
+class _RecordingDispatcher(WebhookDispatcher):
+    """Dispatcher that records updates instead of running the bot"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processed = []
+        self.active = 0
+        self.max_active = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    async def _setup(self):
+        pass
+
+    async def _teardown(self):
+        pass
+
+    async def _process(self, update_data):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        while not self.gate.is_set():
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.01)
+        self.processed.append((chat_key(update_data), update_data['update_id']))
+        self.active -= 1
+
+
+class WebhookDispatcherTests(SimpleTestCase):
+    """Test ordering, concurrency and backpressure of the worker pool"""
+
+    def _start(self, **kwargs):
+        dispatcher = _RecordingDispatcher(**kwargs)
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop, 5)
+        return dispatcher
+
+    def test_chat_key(self):
+        self.assertEqual(chat_key(_message(1, 42)), 42)
+        callback = {'update_id': 2, 'callback_query': {'from': {'id': 7}, 'message': {'chat': {'id': 42}}}}
+        self.assertEqual(chat_key(callback), 42)
+        self.assertEqual(chat_key({'update_id': 3, 'inline_query': {'from': {'id': 7}}}), 7)
+        self.assertEqual(chat_key({'update_id': 4}), 'update:4')
+
+    def test_ordered_per_chat_concurrent_across_chats(self):
+        dispatcher = self._start(workers=4)
+        update_ids = iter(range(1, 1000))
+        for _ in range(5):
+            for chat_id in (1, 2, 3):
+                self.assertTrue(dispatcher.submit(_message(next(update_ids), chat_id)))
+
+        self.assertTrue(dispatcher.wait_idle(5))
+        for chat_id in (1, 2, 3):
+            seen = [update_id for key, update_id in dispatcher.processed if key == chat_id]
+            self.assertEqual(seen, sorted(seen))
+            self.assertEqual(len(seen), 5)
+        self.assertGreater(dispatcher.max_active, 1)
+        self.assertLessEqual(dispatcher.max_active, 3)
+
+    def test_rejects_when_full(self):
+        dispatcher = self._start(workers=1, max_pending=2)
+        dispatcher.gate.clear()
+        rejected_before = webhook_dispatcher.QUEUE_REJECTED.value()
+
+        self.assertTrue(dispatcher.submit(_message(1, 1)))
+        self.assertTrue(dispatcher.submit(_message(2, 2)))
+        self.assertFalse(dispatcher.submit(_message(3, 3)))
+        self.assertEqual(webhook_dispatcher.QUEUE_REJECTED.value(), rejected_before + 1)
+
+        dispatcher.gate.set()
+        self.assertTrue(dispatcher.wait_for_chat(2, 5))
+        self.assertTrue(dispatcher.submit(_message(4, 3)))
+
+
+class WebhookDispatcherLifecycleTests(SimpleTestCase):
+    """Test background tasks and state saving around the real bot setup"""
+
+    def setUp(self):
+        states_dir = tempfile.mkdtemp(prefix='webhook-dispatcher-')
+        self.addCleanup(shutil.rmtree, states_dir, ignore_errors=True)
+        self.states_file = os.path.join(states_dir, 'user_states.pickle')
+
+    def _fake_bot(self):
+        bot = mock.Mock()
+        bot.states_file = self.states_file
+        application = bot.setup_bot.return_value
+        application.initialize = mock.AsyncMock()
+        application.shutdown = mock.AsyncMock()
+        application.process_update = mock.AsyncMock()
+        bot.start_background_tasks = mock.AsyncMock()
+        bot.stop_background_tasks = mock.AsyncMock()
+        bot.dump_user_states.return_value = (b'states', None)
+        bot.writer_threads = []
+        bot.write_user_states.side_effect = lambda dumped: bot.writer_threads.append(threading.current_thread().name)
+        return bot
+
+    @override_settings(WEBHOOK_STATE_SAVE_SECONDS=0.05)
+    def test_background_tasks_and_periodic_saves(self):
+        bot = self._fake_bot()
+        patcher = mock.patch.object(webhook_dispatcher, 'build_update', side_effect=lambda data, _bot: data)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with mock.patch('bot.telegram_bot.TelegramBot', return_value=bot):
+            dispatcher = WebhookDispatcher(workers=2)
+            dispatcher.start()
+            self.addCleanup(dispatcher.stop, 5)
+        bot.start_background_tasks.assert_awaited_once_with(serve_metrics=False)
+
+        for update_id in range(1, 6):
+            self.assertTrue(dispatcher.submit(_message(update_id, 42)))
+        self.assertTrue(dispatcher.wait_idle(5))
+        deadline = time.monotonic() + 5
+        while not bot.writer_threads and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(bot.setup_bot.return_value.process_update.await_count, 5)
+        bot.save_user_states.assert_not_called()
+        self.assertLess(bot.dump_user_states.call_count, 5)
+        self.assertTrue(bot.writer_threads)
+        self.assertNotIn('webhook-dispatcher', bot.writer_threads)
+
+        dispatcher.stop(5)
+        bot.stop_background_tasks.assert_awaited_once()
+        bot.setup_bot.return_value.shutdown.assert_awaited_once()
+
+    def test_second_process_refuses_the_same_state_files(self):
+        with mock.patch('bot.telegram_bot.TelegramBot', side_effect=[self._fake_bot(), self._fake_bot()]):
+            first = WebhookDispatcher(workers=1)
+            first.start()
+            self.addCleanup(first.stop, 5)
+
+            second = WebhookDispatcher(workers=1)
+            with self.assertRaisesRegex(RuntimeError, 'single web worker process'):
+                second.start()
+        second.bot.start_background_tasks.assert_not_awaited()
+
+        # The lock goes with the dispatcher that held it
+        first.stop(5)
+        with mock.patch('bot.telegram_bot.TelegramBot', return_value=self._fake_bot()):
+            third = WebhookDispatcher(workers=1)
+            third.start()
+            self.addCleanup(third.stop, 5)
+
+
+class WebhookViewTests(SimpleTestCase):
+    """Test validation and acknowledgement in TelegramWebhookView"""
+
+    def test_rejects_malformed_updates(self):
+        url = reverse('bot:telegram_webhook')
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'message': {}}, content_type='application/json').status_code, 400)
+
+    def test_acks_and_applies_backpressure(self):
+        dispatcher = mock.Mock(pending=1000)
+        url = reverse('bot:telegram_webhook')
+
+        with mock.patch.object(webhook_dispatcher, 'get_dispatcher', return_value=dispatcher):
+            dispatcher.submit.return_value = True
+            self.assertEqual(self.client.post(url, _message(1, 1), content_type='application/json').status_code, 200)
+
+            dispatcher.submit.return_value = False
+            response = self.client.post(url, _message(2, 1), content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        dispatcher.submit.assert_called_with(_message(2, 1))
@@ -0,0 +1,75 @@
+"""
+Tests for the webhook load harness and the Bot API stub
+"""
+
+import json
+import urllib.request
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from benchmarks.telegram_stub import TelegramApiStub
+from benchmarks.webhook_load import WebhookLoadDriver, percentile
+
+
+class TelegramApiStubTests(SimpleTestCase):
+    """Test the local Bot API stand-in"""
+
+    def _call(self, stub, method, payload):
+        request = urllib.request.Request(
+            f'{stub.base_url}TOKEN/{method}',
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_records_keyboards_and_calls(self):
+        with TelegramApiStub() as stub:
+            status, body = self._call(stub, 'sendMessage', {
+                'chat_id': 5, 'text': 'hi',
+                'reply_markup': {'inline_keyboard': [[{'text': 'Go', 'callback_data': 'city_12'}]]},
+            })
+            self.assertEqual(status, 200)
+            self.assertEqual(body['result']['chat']['id'], 5)
+            self.assertEqual(stub.find_button(5, 'city_'), (body['result']['message_id'], 'city_12'))
+            self.assertIsNone(stub.find_button(5, 'city_1', exact=True))
+            self.assertIsNone(stub.find_button(5, 'city_', after=stub.keyboard_position(5)))
+            self.assertEqual(stub.snapshot()[0], {'sendMessage': 1})
+
+    def test_rate_limit_injection(self):
+        with TelegramApiStub(rate_limit_ratio=1.0, retry_after=3) as stub:
+            status, body = self._call(stub, 'sendMessage', {'chat_id': 5, 'text': 'hi'})
+
+        self.assertEqual(status, 429)
+        self.assertEqual(body['parameters']['retry_after'], 3)
+        self.assertEqual(stub.snapshot()[1], {'sendMessage': 1})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+
+class WebhookLoadDriverTests(TransactionTestCase):
+    """Walk the full customer/junkyard flow through the real webhook"""
+
+    def test_single_deal_end_to_end(self):
+        [result] = WebhookLoadDriver().run([('single', {'customers': 1, 'junkyards': 1, 'items': 1})])
+
+        self.assertEqual(result['deals_completed'], 1, msg=result['failures'])
+        self.assertEqual(result['webhook_errors'], 0)
+        self.assertGreater(result['db_queries'], 0)
+        self.assertIn('offer_accept', result['steps'])
+        # One long-lived application in the dispatcher, answering through the stub
+        self.assertEqual(result['api_calls_by_method']['getMe'], 1)
+
+    def test_single_deal_inline(self):
+        [result] = WebhookLoadDriver().run([('single', {'customers': 1, 'junkyards': 1, 'items': 1})], inline=True)
+
+        self.assertEqual(result['deals_completed'], 1, msg=result['failures'])
+        # Inline processing builds a fresh application for every update
+        self.assertGreaterEqual(result['api_calls_by_method']['getMe'], result['updates'])
@@ -0,0 +1,80 @@
+"""
+Tests for the messages the workflow service sends
+"""
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from django.utils import timezone
+from telegram import InlineKeyboardMarkup
+
+from .models import Brand, City, Junkyard, Model, Offer, Request, RequestItem, User
+from .services import OrderWorkflowService
+
+
+class WorkflowMessageTests(TestCase):
+    """Customers and junkyards get their messages, keyboards included"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', telegram_id=111, first_name='Client')
+        city = City.objects.create(name='Riyadh', code='RY')
+        brand = Brand.objects.create(name='Toyota')
+        model = Model.objects.create(brand=brand, name='Camry')
+        self.request = Request.objects.create(
+            user=self.customer, city=city, brand=brand, model=model, year=2015,
+            status='new', expires_at=timezone.now(),
+        )
+        RequestItem.objects.create(request=self.request, name='مصد أمامي')
+        self.offers = []
+        for i in range(2):
+            user = User.objects.create_user(
+                username=f'yard{i}', telegram_id=200 + i, first_name=f'Yard{i}', user_type='junkyard',
+            )
+            junkyard = Junkyard.objects.create(user=user, phone='050', city=city, location='-')
+            self.offers.append(Offer.objects.create(request=self.request, junkyard=junkyard, price=100 + i))
+        self.service = OrderWorkflowService()
+        self.service.set_telegram_bot(mock.Mock())
+        patcher = mock.patch.object(self.service, '_send_telegram_message')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sent_to(self, telegram_id):
+        """Keyboards of the messages sent to ``telegram_id``"""
+        return [call.args[2] if len(call.args) > 2 else call.kwargs.get('keyboard')
+                for call in self.send.call_args_list if call.args[0] == telegram_id]
+
+    def _offer(self, index):
+        return Offer.objects.select_related('request__user', 'junkyard__user').get(id=self.offers[index].id)
+
+    def test_order_confirmation_sent_to_customer(self):
+        request = Request.objects.select_related('user', 'city', 'brand', 'model').get(id=self.request.id)
+        async_to_sync(self.service.send_order_confirmation_to_customer)(request)
+
+        keyboards = self._sent_to(self.customer.telegram_id)
+        self.assertEqual(len(keyboards), 1)
+        self.assertIsInstance(keyboards[0], InlineKeyboardMarkup)
+
+    def test_accept_confirms_to_customer_and_junkyard(self):
+        applied = async_to_sync(self.service.process_customer_offer_decision)(self._offer(0), 'accept', self.customer)
+
+        self.assertTrue(applied)
+        self.assertEqual(len(self._sent_to(self.customer.telegram_id)), 1)
+        self.assertIsInstance(self._sent_to(self.customer.telegram_id)[0], InlineKeyboardMarkup)
+        self.assertIsInstance(self._sent_to(200)[0], InlineKeyboardMarkup)
+
+    def test_reject_confirms_to_customer(self):
+        applied = async_to_sync(self.service.process_customer_offer_decision)(self._offer(1), 'reject', self.customer)
+
+        self.assertTrue(applied)
+        self.assertIsInstance(self._sent_to(self.customer.telegram_id)[0], InlineKeyboardMarkup)
+
+    def test_expiry_notices_sent(self):
+        async_to_sync(self.service.notify_requests_expiring_soon)([self.request.id])
+        async_to_sync(self.service.notify_requests_expired)([self.request.id])
+
+        keyboards = self._sent_to(self.customer.telegram_id)
+        self.assertEqual(len(keyboards), 2)
+        self.assertTrue(all(isinstance(keyboard, InlineKeyboardMarkup) for keyboard in keyboards))
+        self.assertEqual(len(self._sent_to(200)), 1)
+        self.assertEqual(len(self._sent_to(201)), 1)
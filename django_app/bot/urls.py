@@ -17,6 +17,7 @@ urlpatterns = [
     # API endpoints (keeping some for dashboard/debug purposes)
     path('api/requests/active/', views.get_active_requests, name='active_requests'),
     path('api/junkyards/', views.get_junkyards_by_city, name='junkyards_by_city'),
+    path('api/changes/', views.get_changes, name='changes_feed'),
     # path('api/telegram/send-message/', views.send_telegram_message, name='send_telegram_message'),
     path('api/stats/', views.get_system_stats, name='system_stats'),
     
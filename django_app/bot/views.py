@@ -1,18 +1,18 @@
+import hashlib
 import json
 import logging
-from django.http import JsonResponse, HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Subquery
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.utils import timezone
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.response import Response
-from rest_framework import status
-from telegram import Update
-from .telegram_bot import TelegramBot
-from .models import User, Request, Offer, Junkyard, City, Brand, Model
+from . import webhook_dispatcher
+from .models import User, Request, Offer, Junkyard, City, Brand, Model, ChangeLogEntry
 import asyncio
 
 logger = logging.getLogger(__name__)
@@ -63,6 +63,25 @@ def health_queue(request):
             "timestamp": timezone.now().isoformat()
         }, status=500)
 
+@require_http_methods(["GET"])
+def metrics_endpoint(request):
+    """Prometheus text exposition of this process's metrics"""
+    from django.conf import settings
+    from django.utils.crypto import constant_time_compare
+    from . import metrics
+    
+    if not metrics.enabled():
+        return HttpResponse("Metrics disabled", status=404)
+    
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        auth = request.META.get('HTTP_AUTHORIZATION', '')
+        supplied = auth[7:] if auth.startswith('Bearer ') else request.GET.get('token', '')
+        if not constant_time_compare(supplied, token):
+            return HttpResponse("Forbidden", status=403)
+    
+    return HttpResponse(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_notifications(request):
@@ -95,13 +114,41 @@ class TelegramWebhookView(View):
     """Handle Telegram webhook updates - حل جذري لمشكلة التضارب"""
     
     def post(self, request):
+        from django.conf import settings
+        
         try:
-            logger.info("📡 Webhook received update")
-            
-            # Parse the update
             update_data = json.loads(request.body.decode('utf-8'))
-            logger.info(f"📊 Update data: {update_data}")
-            
+        except (UnicodeDecodeError, ValueError):
+            logger.warning("⚠️ Webhook received a malformed body")
+            return HttpResponse("Bad Request", status=400)
+        if not isinstance(update_data, dict) or not isinstance(update_data.get('update_id'), int):
+            logger.warning("⚠️ Webhook received a payload without update_id")
+            return HttpResponse("Bad Request", status=400)
+        
+        logger.debug("📊 Update data: %s", update_data)
+        
+        if not getattr(settings, 'WEBHOOK_ASYNC_PROCESSING', True):
+            return self._process_inline(update_data)
+        
+        try:
+            dispatcher = webhook_dispatcher.get_dispatcher()
+        except Exception as e:
+            logger.error(f"❌ Webhook dispatcher unavailable: {e}")
+            return HttpResponse("Bot Error", status=500)
+        
+        if not dispatcher.submit(update_data):
+            # Telegram redelivers on non-2xx, which is the backpressure we want
+            logger.warning(f"⚠️ Webhook queue full ({dispatcher.pending}), asking Telegram to retry")
+            response = HttpResponse("Busy", status=503)
+            response['Retry-After'] = '1'
+            return response
+        return HttpResponse("OK")
+    
+    def _process_inline(self, update_data):
+        """Process the update before answering (WEBHOOK_ASYNC_PROCESSING=False)"""
+        from .telegram_bot import TelegramBot
+
+        try:
             # Create bot instance
             bot = TelegramBot()
             app = bot.setup_bot()
@@ -110,86 +157,27 @@ class TelegramWebhookView(View):
                 logger.error("❌ Failed to setup bot application")
                 return HttpResponse("Bot Error", status=500)
             
-            # Create update object with proper bot instance
-            from telegram import Bot
-            bot_instance = Bot(token=app.bot.token)
-            
-            # Handle CallbackQuery creation properly
-            if 'callback_query' in update_data:
-                # Create a proper CallbackQuery object
-                from telegram import CallbackQuery, Message, User, Chat
-                
-                callback_data = update_data['callback_query']
-                from_data = callback_data['from']
-                message_data = callback_data['message']
-                chat_data = message_data['chat']
-                
-                # Create User objects
-                from_user = User(
-                    id=from_data['id'],
-                    is_bot=from_data['is_bot'],
-                    first_name=from_data['first_name'],
-                    last_name=from_data.get('last_name'),
-                    username=from_data.get('username')
-                )
-                
-                # Create Chat object
-                chat = Chat(
-                    id=chat_data['id'],
-                    type=chat_data['type'],
-                    first_name=chat_data.get('first_name'),
-                    last_name=chat_data.get('last_name'),
-                    username=chat_data.get('username')
-                )
-                
-                # Create Message object
-                message = Message(
-                    message_id=message_data['message_id'],
-                    from_user=from_user,
-                    date=message_data['date'],
-                    chat=chat,
-                    text=message_data.get('text', '')
-                )
-                
-                # Create CallbackQuery object
-                callback_query = CallbackQuery(
-                    id=callback_data['id'],
-                    from_user=from_user,
-                    message=message,
-                    data=callback_data.get('data'),
-                    chat_instance=callback_data.get('chat_instance', '')
-                )
-                
-                # Create Update object
-                update = Update(
-                    update_id=update_data['update_id'],
-                    callback_query=callback_query
-                )
-            else:
-                # Regular message update
-                update = Update.de_json(update_data, bot_instance)
-            
-            # Process the update synchronously to avoid conflicts
-            import asyncio
+            # Bind the update to the application's bot so replies go through it
+            # (a bare Bot() is never initialized and breaks command handlers)
+            update = webhook_dispatcher.build_update(update_data, app.bot)
             
             async def process_update():
                 try:
                     await app.initialize()
                     await app.process_update(update)
+                    # Each webhook call gets a fresh TelegramBot, so persist the
+                    # conversation state for the next update to pick up
+                    bot.save_user_states()
                     logger.info("✅ Update processed successfully")
                 except Exception as e:
                     logger.error(f"❌ Error processing update: {e}")
             
             # Run in new event loop to avoid conflicts
+            loop = asyncio.new_event_loop()
             try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
                 loop.run_until_complete(process_update())
+            finally:
                 loop.close()
-            except Exception as e:
-                logger.error(f"❌ Event loop error: {e}")
-                # Fallback to direct processing
-                asyncio.create_task(process_update())
             
             return HttpResponse("OK")
             
@@ -215,10 +203,151 @@ class TelegramWebhookView(View):
 #     """DEPRECATED: Webhook for n8n to handle new offers - now handled directly by workflow service"""
 #     return JsonResponse({'error': 'This endpoint is deprecated. Use workflow service instead.'}, status=410)
 
+class InvalidFeedParam(ValueError):
+    """A feed query parameter that is not a non-negative integer"""
+
+
+def _int_param(request, name, default):
+    value = request.GET.get(name)
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise InvalidFeedParam(f"'{name}' must be a non-negative integer")
+    return number
+
+
+def _invalid_param_response(error):
+    return JsonResponse({'success': False, 'error': str(error)}, status=400)
+
+
+def _parse_feed_paging(request):
+    """Read cursor/limit query params for the paged JSON feeds (InvalidFeedParam if malformed)"""
+    from django.conf import settings
+    
+    max_limit = getattr(settings, 'API_FEED_MAX_PAGE_SIZE', 5000)
+    default_limit = getattr(settings, 'API_FEED_PAGE_SIZE', 1000)
+    
+    cursor = _int_param(request, 'cursor', 0)
+    limit = _int_param(request, 'limit', default_limit)
+    return cursor, max(1, min(limit, max_limit))
+
+
+def _feed_etag(queryset, cursor, limit, model_name):
+    """
+    Cheap ETag for a feed page: one aggregate query instead of rendering the payload.
+    New rows and rows leaving the filter move count/max(id); every other write
+    to a row, or to the names it shows (see bot.signals), adds a ChangeLogEntry
+    for ``model_name``, whose latest id is folded in.
+    """
+    latest_change = ChangeLogEntry.objects.filter(model_name=model_name).order_by('-id').values('id')[:1]
+    aggregates = queryset.filter(id__gt=cursor).aggregate(
+        count=Count('id'), max_id=Max('id'), changed=Max(Subquery(latest_change)),
+    )
+    signature = f"{cursor}:{limit}:" + ":".join(str(aggregates[key]) for key in sorted(aggregates))
+    return hashlib.md5(signature.encode('utf-8')).hexdigest()
+
+
+def _etag_matches(if_none_match, etag):
+    """
+    Weak If-None-Match comparison (RFC 9110 13.1.2): gzip_page sends our ETag
+    back as W/"...", and clients echo that form.
+    """
+    if not if_none_match:
+        return False
+    tags = parse_etags(if_none_match)
+    return '*' in tags or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in tags}
+
+
+def _stream_json_feed(key, rows, limit, transform):
+    """
+    Stream a feed page as JSON without building the payload in memory.
+    `rows` yields up to limit + 1 dicts; the extra row only signals another page.
+    """
+    yield '{"success": true, "%s": [' % key
+    
+    last_id = None
+    has_more = False
+    for index, row in enumerate(rows):
+        if index == limit:
+            has_more = True
+            break
+        last_id = row['id']
+        yield (',' if index else '') + json.dumps(transform(row), cls=DjangoJSONEncoder, ensure_ascii=False)
+    
+    next_cursor = last_id if has_more else None
+    yield '], "next_cursor": %s}' % json.dumps(next_cursor)
+
+
+def _feed_response(request, key, queryset, fields, transform, model_name):
+    """Build a streamed, cursor-paged, ETag-aware JSON feed response"""
+    from django.conf import settings
+    
+    try:
+        cursor, limit = _parse_feed_paging(request)
+    except InvalidFeedParam as e:
+        return _invalid_param_response(e)
+    
+    etag = quote_etag(_feed_etag(queryset, cursor, limit, model_name))
+    if _etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    chunk_size = getattr(settings, 'API_FEED_CHUNK_SIZE', 500)
+    rows = (
+        queryset.filter(id__gt=cursor)
+        .order_by('id')
+        .values(*fields)[:limit + 1]
+        .iterator(chunk_size=chunk_size)
+    )
+    
+    response = StreamingHttpResponse(
+        _stream_json_feed(key, rows, limit, transform),
+        content_type='application/json'
+    )
+    response['ETag'] = etag
+    return response
+
+
+def _active_request_row(row):
+    return {
+        'id': row['id'],
+        'order_id': row['order_id'],
+        'user_telegram_id': row['user__telegram_id'],
+        'city': row['city__name'],
+        'brand': row['brand__name'],
+        'model': row['model__name'],
+        'year': row['year'],
+        'parts': row['parts'],
+        'media_files': row['media_files'],
+        'created_at': row['created_at'].isoformat(),
+        'expires_at': row['expires_at'].isoformat()
+    }
+
+
+def _junkyard_row(row):
+    return {
+        'id': row['id'],
+        'user_telegram_id': row['user__telegram_id'],
+        'name': row['user__first_name'],
+        'phone': row['phone'],
+        'city': row['city__name'],
+        'location': row['location'],
+        'is_verified': row['is_verified'],
+        'average_rating': float(row['average_rating']),
+        'total_ratings': row['total_ratings']
+    }
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@gzip_page
 def get_active_requests(request):
-    """Get active requests for n8n processing"""
+    """Get active requests for n8n processing (streamed, paged with ?cursor=&limit=)"""
     try:
         city_id = request.GET.get('city_id')
         
@@ -226,26 +355,13 @@ def get_active_requests(request):
         if city_id:
             requests_query = requests_query.filter(city_id=city_id)
         
-        requests_data = []
-        for req in requests_query:
-            requests_data.append({
-                'id': req.id,
-                'order_id': req.order_id,
-                'user_telegram_id': req.user.telegram_id,
-                'city': req.city.name,
-                'brand': req.brand.name,
-                'model': req.model.name,
-                'year': req.year,
-                'parts': req.parts,
-                'media_files': req.media_files,
-                'created_at': req.created_at.isoformat(),
-                'expires_at': req.expires_at.isoformat()
-            })
-        
-        return JsonResponse({
-            'success': True,
-            'requests': requests_data
-        })
+        return _feed_response(
+            request, 'requests', requests_query,
+            ('id', 'order_id', 'user__telegram_id', 'city__name', 'brand__name', 'model__name',
+             'year', 'parts', 'media_files', 'created_at', 'expires_at'),
+            _active_request_row,
+            'request',
+        )
         
     except Exception as e:
         logger.error(f"Error getting active requests: {e}")
@@ -256,8 +372,9 @@ def get_active_requests(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@gzip_page
 def get_junkyards_by_city(request):
-    """Get active junkyards by city for n8n"""
+    """Get active junkyards by city for n8n (streamed, paged with ?cursor=&limit=)"""
     try:
         city_id = request.GET.get('city_id')
         
@@ -265,27 +382,110 @@ def get_junkyards_by_city(request):
         if city_id:
             junkyards_query = junkyards_query.filter(city_id=city_id)
         
-        junkyards_data = []
-        for junkyard in junkyards_query:
-            junkyards_data.append({
-                'id': junkyard.id,
-                'user_telegram_id': junkyard.user.telegram_id,
-                'name': junkyard.user.first_name,
-                'phone': junkyard.phone,
-                'city': junkyard.city.name,
-                'location': junkyard.location,
-                'is_verified': junkyard.is_verified,
-                'average_rating': float(junkyard.average_rating),
-                'total_ratings': junkyard.total_ratings
+        return _feed_response(
+            request, 'junkyards', junkyards_query,
+            ('id', 'user__telegram_id', 'user__first_name', 'phone', 'city__name', 'location',
+             'is_verified', 'average_rating', 'total_ratings'),
+            _junkyard_row,
+            'junkyard',
+        )
+        
+    except Exception as e:
+        logger.error(f"Error getting junkyards: {e}")
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+CHANGE_FEED_FIELDS = {
+    'request': (
+        Request,
+        ('id', 'order_id', 'status', 'user__telegram_id', 'city_id', 'brand__name', 'model__name',
+         'year', 'created_at', 'expires_at'),
+    ),
+    'offer': (
+        Offer,
+        ('id', 'request_id', 'request__order_id', 'junkyard_id', 'price', 'status', 'created_at'),
+    ),
+    'junkyard': (
+        Junkyard,
+        ('id', 'user__telegram_id', 'user__first_name', 'city_id', 'is_active', 'is_verified',
+         'average_rating', 'total_ratings'),
+    ),
+}
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@gzip_page
+def get_changes(request):
+    """
+    Incremental changes feed for polling integrations.
+    GET ?since=<cursor>&limit=N&models=request,offer returns objects changed after the cursor,
+    one query for the log page plus one per changed model - independent of table size.
+    """
+    try:
+        from datetime import timedelta
+        from django.conf import settings
+        
+        try:
+            since = _int_param(request, 'since', 0)
+            _, limit = _parse_feed_paging(request)
+        except InvalidFeedParam as e:
+            return _invalid_param_response(e)
+        models_filter = [m for m in request.GET.get('models', '').split(',') if m]
+        unknown = set(models_filter) - set(CHANGE_FEED_FIELDS)
+        if unknown:
+            return JsonResponse({'success': False, 'error': f"Unknown models: {', '.join(sorted(unknown))}"}, status=400)
+        
+        entries = ChangeLogEntry.objects.filter(id__gt=since)
+        if models_filter:
+            entries = entries.filter(model_name__in=models_filter)
+        
+        # Hold back very recent entries so a slower concurrent transaction that got a
+        # lower id can't commit behind the cursor a consumer already moved past
+        safety_lag = getattr(settings, 'CHANGE_FEED_SAFETY_LAG_SECONDS', 2)
+        if safety_lag:
+            entries = entries.filter(created_at__lte=timezone.now() - timedelta(seconds=safety_lag))
+        
+        entries = list(entries.order_by('id').values('id', 'model_name', 'object_id', 'action')[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        
+        # Keep only the latest entry per object inside this page
+        latest = {}
+        for entry in entries:
+            latest[(entry['model_name'], entry['object_id'])] = entry
+        
+        # One query per changed model for the current state of the objects
+        current = {}
+        for model_name in {key[0] for key in latest}:
+            model_class, fields = CHANGE_FEED_FIELDS[model_name]
+            ids = [object_id for name, object_id in latest if name == model_name]
+            for row in model_class.objects.filter(id__in=ids).values(*fields):
+                current[(model_name, row['id'])] = row
+        
+        changes = []
+        for key, entry in sorted(latest.items(), key=lambda item: item[1]['id']):
+            data = current.get(key)
+            changes.append({
+                'cursor': entry['id'],
+                'model': entry['model_name'],
+                'id': entry['object_id'],
+                'action': 'deleted' if data is None else entry['action'],
+                'data': data,
             })
         
+        next_cursor = entries[-1]['id'] if entries else since
         return JsonResponse({
             'success': True,
-            'junkyards': junkyards_data
-        })
+            'changes': changes,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }, encoder=DjangoJSONEncoder, json_dumps_params={'ensure_ascii': False})
         
     except Exception as e:
-        logger.error(f"Error getting junkyards: {e}")
+        logger.error(f"Error getting changes feed: {e}")
         return JsonResponse({
             'success': False,
             'error': str(e)
@@ -366,6 +566,7 @@ async def send_message_async(telegram_id, message, keyboard=None):
                 buttons.append(button_row)
             reply_markup = InlineKeyboardMarkup(buttons)
         
+        from .telegram_bot import TelegramBot
         bot = TelegramBot()
         app = bot.setup_bot()
         if app:
@@ -0,0 +1,370 @@
+"""
+Background processing for webhook updates.
+
+TelegramWebhookView validates an update, hands it to the process-wide
+WebhookDispatcher and returns 200 straight away, so a slow handler (an order
+fan-out, a slow Bot API) never holds the HTTP worker long enough for
+Telegram to time out and redeliver.
+
+The dispatcher owns one long-lived TelegramBot/Application running on its
+own event loop thread. WEBHOOK_WORKERS worker tasks process updates
+concurrently across chats but strictly one at a time, in arrival order,
+within a chat: a chat is scheduled at most once on the ready queue and a
+worker takes a single update from it before putting it back. Updates
+pending across all chats are capped at WEBHOOK_MAX_PENDING; beyond that
+``submit`` refuses and the view answers 503 so Telegram retries later.
+
+The bot's background tasks (request expiry scheduler, broadcast sender,
+event loop lag monitor) run on the same loop, as they do under polling.
+Conversation state is written every WEBHOOK_STATE_SAVE_SECONDS when
+updates were processed, not after each one: it is pickled on the loop and
+written to disk on a thread, so workers never wait on file I/O.
+
+Conversation state, the idempotency cache and those background tasks live
+in this process, so webhook mode needs a single web worker process
+(threads are fine). The dispatcher holds an exclusive lock on
+``<states file>.lock`` while it runs; a dispatcher in a second process
+fails to start (the view answers 500 and Telegram redelivers) instead of
+running a second scheduler and overwriting the same state files.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.REGISTRY.gauge('bot_webhook_queue_depth', 'Webhook updates waiting or in progress')
+QUEUE_REJECTED = metrics.REGISTRY.counter('bot_webhook_rejected_total', 'Webhook updates refused because the queue was full')
+QUEUE_WAIT = metrics.REGISTRY.histogram('bot_webhook_queue_wait_seconds', 'Time from webhook ack to processing start')
+BUSY_WORKERS = metrics.REGISTRY.gauge('bot_webhook_busy_workers', 'Webhook workers currently processing an update')
+
+_MESSAGE_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+
+
+def chat_key(update_data):
+    """Ordering key for an update: its chat id, else the sender id, else the update itself"""
+    for field in _MESSAGE_FIELDS:
+        chat = (update_data.get(field) or {}).get('chat')
+        if chat:
+            return chat['id']
+
+    callback = update_data.get('callback_query')
+    if callback:
+        chat = (callback.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+
+    for value in update_data.values():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return value['from']['id']
+    return f"update:{update_data.get('update_id')}"
+
+
+def build_update(update_data, bot):
+    """Turn a webhook payload into a telegram.Update bound to ``bot``"""
+    from telegram import CallbackQuery, Chat, Message, Update, User
+
+    if 'callback_query' not in update_data:
+        return Update.de_json(update_data, bot)
+
+    # Callback messages often arrive without 'from'/'text', which de_json
+    # rejects, so build the objects by hand
+    callback_data = update_data['callback_query']
+    from_data = callback_data['from']
+    message_data = callback_data['message']
+    chat_data = message_data['chat']
+
+    from_user = User(
+        id=from_data['id'],
+        is_bot=from_data['is_bot'],
+        first_name=from_data['first_name'],
+        last_name=from_data.get('last_name'),
+        username=from_data.get('username')
+    )
+    chat = Chat(
+        id=chat_data['id'],
+        type=chat_data['type'],
+        first_name=chat_data.get('first_name'),
+        last_name=chat_data.get('last_name'),
+        username=chat_data.get('username')
+    )
+    message = Message(
+        message_id=message_data['message_id'],
+        from_user=from_user,
+        date=message_data['date'],
+        chat=chat,
+        text=message_data.get('text', '')
+    )
+    callback_query = CallbackQuery(
+        id=callback_data['id'],
+        from_user=from_user,
+        message=message,
+        data=callback_data.get('data'),
+        chat_instance=callback_data.get('chat_instance', '')
+    )
+    update = Update(update_id=update_data['update_id'], callback_query=callback_query)
+    for telegram_object in (from_user, chat, message, callback_query, update):
+        telegram_object.set_bot(bot)
+    return update
+
+
+def lock_state_files(states_file):
+    """Take the exclusive ``<states_file>.lock``; returns the open lock file (None without fcntl)"""
+    try:
+        import fcntl
+    except ImportError:  # Windows: keeping to one worker is up to the deployment
+        return None
+
+    os.makedirs(os.path.dirname(states_file) or '.', exist_ok=True)
+    lock_file = open(states_file + '.lock', 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(
+            f'{states_file} is in use by another process; webhook mode needs a single web worker process'
+        )
+    return lock_file
+
+
+class WebhookDispatcher:
+    """Bounded, per-chat ordered worker pool on a dedicated event loop thread"""
+
+    def __init__(self, workers=8, max_pending=1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.bot = None
+        self.application = None
+        self._state_lock = None
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = 0
+        self._pending_by_chat = {}
+        self._busy = 0
+
+        # Only touched on the loop thread
+        self._chats = {}
+        self._ready = None
+
+        self._unsaved = False
+
+        self._loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._stopping = None
+        self._start_error = None
+
+    # Lifecycle
+    def start(self, timeout=30):
+        self._thread = threading.Thread(target=self._run, name='webhook-dispatcher', daemon=True)
+        self._thread.start()
+        if not self._started.wait(timeout):
+            raise RuntimeError('Webhook dispatcher did not start in time')
+        if self._start_error:
+            raise RuntimeError(f'Webhook dispatcher failed to start: {self._start_error}')
+        logger.info(f"🧵 Webhook dispatcher started with {self.workers} workers")
+
+    def stop(self, timeout=10):
+        """Finish what is queued (up to ``timeout``), then stop the loop"""
+        if not self._thread:
+            return
+        self.wait_idle(timeout)
+        if self._loop and self._stopping:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
+        self._thread = None
+        logger.info("🛑 Webhook dispatcher stopped")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self):
+        self._ready = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        try:
+            await self._setup()
+        except Exception as e:
+            self._release_state_lock()
+            self._start_error = e
+            self._started.set()
+            return
+
+        tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        saver = asyncio.create_task(self._save_periodically())
+        self._started.set()
+
+        await self._stopping.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await saver
+        await self._save_states()
+        await self._teardown()
+
+    async def _setup(self):
+        from .telegram_bot import TelegramBot
+
+        self.bot = TelegramBot()
+        self._state_lock = lock_state_files(self.bot.states_file)
+        self.application = self.bot.setup_bot()
+        if not self.application:
+            raise RuntimeError('bot application setup failed')
+        await self.application.initialize()
+        # The web process already serves /metrics
+        await self.bot.start_background_tasks(serve_metrics=False)
+
+    async def _teardown(self):
+        await self.bot.stop_background_tasks()
+        await self.application.shutdown()
+        self._release_state_lock()
+
+    def _release_state_lock(self):
+        if self._state_lock:
+            self._state_lock.close()
+            self._state_lock = None
+
+    async def _save_periodically(self):
+        interval = getattr(settings, 'WEBHOOK_STATE_SAVE_SECONDS', 2.0)
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), interval)
+                return
+            except asyncio.TimeoutError:
+                await self._save_states()
+
+    async def _save_states(self):
+        if not self._unsaved:
+            return
+        self._unsaved = False
+        try:
+            dumped = self.bot.dump_user_states()
+            await asyncio.to_thread(self.bot.write_user_states, dumped)
+        except Exception as e:
+            logger.error(f"❌ Error saving user states: {e}")
+
+    # Producer side (any thread)
+    def submit(self, update_data):
+        """Queue an update; False when the queue is full"""
+        key = chat_key(update_data)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                QUEUE_REJECTED.inc()
+                return False
+            self._pending += 1
+            self._pending_by_chat[key] = self._pending_by_chat.get(key, 0) + 1
+            QUEUE_DEPTH.set(self._pending)
+        self._loop.call_soon_threadsafe(self._enqueue, key, update_data, time.monotonic())
+        return True
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def wait_idle(self, timeout=None):
+        with self._changed:
+            return self._changed.wait_for(lambda: self._pending == 0, timeout)
+
+    def wait_for_chat(self, key, timeout=None):
+        """Block until every update queued so far for ``key`` has been processed"""
+        with self._changed:
+            return self._changed.wait_for(lambda: key not in self._pending_by_chat, timeout)
+
+    # Loop side
+    def _enqueue(self, key, update_data, queued_at):
+        queue = self._chats.get(key)
+        if queue is None:
+            self._chats[key] = deque([(update_data, queued_at)])
+            self._ready.put_nowait(key)
+        else:
+            queue.append((update_data, queued_at))
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update_data, queued_at = queue[0]
+            QUEUE_WAIT.observe(time.monotonic() - queued_at)
+            self._set_busy(1)
+            try:
+                await self._process(update_data)
+            except Exception as e:
+                logger.error(f"❌ Error processing update {update_data.get('update_id')}: {e}")
+            finally:
+                self._set_busy(-1)
+                queue.popleft()
+                # Requeue behind other chats instead of draining this one
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                self._done(key)
+
+    async def _process(self, update_data):
+        update = build_update(update_data, self.application.bot)
+        await self.application.process_update(update)
+        self._unsaved = True
+
+    def _set_busy(self, delta):
+        with self._lock:
+            self._busy += delta
+            BUSY_WORKERS.set(self._busy)
+
+    def _done(self, key):
+        with self._changed:
+            self._pending -= 1
+            remaining = self._pending_by_chat[key] - 1
+            if remaining:
+                self._pending_by_chat[key] = remaining
+            else:
+                del self._pending_by_chat[key]
+            QUEUE_DEPTH.set(self._pending)
+            self._changed.notify_all()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """The process-wide dispatcher, started on first use"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                dispatcher = WebhookDispatcher(
+                    workers=getattr(settings, 'WEBHOOK_WORKERS', 8),
+                    max_pending=getattr(settings, 'WEBHOOK_MAX_PENDING', 1000),
+                )
+                dispatcher.start()
+                _dispatcher = dispatcher
+    return _dispatcher
+
+
+def active_dispatcher():
+    return _dispatcher
+
+
+def shutdown_dispatcher(timeout=10):
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher:
+        dispatcher.stop(timeout)
+
+
+atexit.register(shutdown_dispatcher)
@@ -0,0 +1,277 @@
+"""
+Throttled, resumable broadcast campaigns.
+
+Admins create a BroadcastCampaign in the dashboard; queueing it only counts
+the recipients. Sending happens in a BroadcastSender (inside the bot
+process, or ``manage.py run_broadcasts``), never in a web worker.
+
+The sender claims a campaign with a conditional UPDATE (a lease renewed
+every batch, so a crashed worker's campaign is picked up again once the
+lease goes stale). It walks recipients in user id order, BROADCAST_BATCH_SIZE
+at a time, sending each batch concurrently through one pooled HTTP client
+behind a token bucket (BROADCAST_RATE_PER_SECOND). A 429 pauses the whole
+bucket for the retry_after Telegram asks for. After each batch the
+per-recipient outcomes, counters and the last recipient id checkpoint are
+written in one transaction, so a restart resumes after the last recorded
+batch; at most that one in-flight batch is sent twice.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from bot import metrics
+from bot.models import Request, User
+
+from .models import BroadcastCampaign, BroadcastDelivery
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_MESSAGES = metrics.REGISTRY.counter(
+    'bot_broadcast_messages_total', 'Broadcast messages by outcome', ['status']
+)
+
+MAX_ATTEMPTS = 3
+
+
+def recipients_queryset(campaign):
+    """Users targeted by a campaign, in checkpoint (id) order"""
+    users = User.objects.filter(telegram_id__isnull=False)
+    if campaign.target_user_type:
+        users = users.filter(user_type=campaign.target_user_type)
+    if campaign.target_active_only:
+        users = users.filter(is_active=True, is_active_telegram=True)
+    if campaign.target_city_id:
+        # Junkyards belong to a city; clients are in a city if they ordered there
+        in_city = Q(junkyard_profile__city_id=campaign.target_city_id)
+        ordered_in_city = Exists(
+            Request.objects.filter(user=OuterRef('pk'), city_id=campaign.target_city_id)
+        )
+        if campaign.target_user_type == 'junkyard':
+            users = users.filter(in_city)
+        elif campaign.target_user_type == 'client':
+            users = users.filter(ordered_in_city)
+        else:
+            users = users.filter(in_city | Q(ordered_in_city))
+    return users.order_by('id')
+
+
+def queue_campaign(campaign):
+    """Count recipients and hand the campaign to the sender"""
+    campaign.total_recipients = recipients_queryset(campaign).count()
+    campaign.status = 'queued'
+    campaign.save(update_fields=['total_recipients', 'status'])
+
+
+class RateLimiter:
+    """Token bucket spacing sends evenly at ``rate`` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds):
+        """Hold every sender back (Telegram answered 429)"""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+class BroadcastSender:
+    """Claims queued campaigns and sends them at a bounded rate"""
+
+    def __init__(self, worker_id=None, rate=None, concurrency=None, batch_size=None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.rate = rate or getattr(settings, 'BROADCAST_RATE_PER_SECOND', 25)
+        self.concurrency = concurrency or getattr(settings, 'BROADCAST_CONCURRENCY', 20)
+        self.batch_size = batch_size or getattr(settings, 'BROADCAST_BATCH_SIZE', 200)
+        self.lease_seconds = getattr(settings, 'BROADCAST_LEASE_SECONDS', 60)
+        token = getattr(settings, 'TELEGRAM_BOT_TOKEN', '')
+        api_base = getattr(settings, 'TELEGRAM_API_BASE_URL', 'https://api.telegram.org/bot')
+        self.api_url = f"{api_base}{token}"
+
+    # Database side (sync)
+    def _claimable(self):
+        stale = timezone.now() - timedelta(seconds=self.lease_seconds)
+        abandoned = Q(status='running') & (Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True))
+        return Q(status='queued') | abandoned
+
+    def claim_next(self):
+        """Take the oldest queued (or abandoned) campaign; None when idle"""
+        candidates = (
+            BroadcastCampaign.objects.filter(self._claimable())
+            .order_by('created_at').values_list('id', flat=True)[:5]
+        )
+        now = timezone.now()
+        for campaign_id in candidates:
+            claimed = BroadcastCampaign.objects.filter(self._claimable(), id=campaign_id).update(
+                status='running', worker_id=self.worker_id, heartbeat_at=now,
+                started_at=Coalesce('started_at', now),
+            )
+            if claimed:
+                return BroadcastCampaign.objects.get(id=campaign_id)
+        return None
+
+    def _next_batch(self, campaign_id):
+        """Campaign and its next recipients; None when we must stop (paused, cancelled, lease lost)"""
+        campaign = BroadcastCampaign.objects.select_related('target_city').get(id=campaign_id)
+        if campaign.status != 'running' or campaign.worker_id != self.worker_id:
+            return None
+        recipients = list(
+            recipients_queryset(campaign).filter(id__gt=campaign.last_recipient_id)
+            .values_list('id', 'telegram_id')[:self.batch_size]
+        )
+        return campaign, recipients
+
+    def _record(self, campaign_id, outcomes, last_recipient_id):
+        counts = {status: 0 for status, _ in BroadcastDelivery.STATUS_CHOICES}
+        for outcome in outcomes:
+            counts[outcome['status']] += 1
+            BROADCAST_MESSAGES.inc(status=outcome['status'])
+
+        with transaction.atomic():
+            updated = BroadcastCampaign.objects.filter(id=campaign_id, worker_id=self.worker_id).update(
+                sent_count=F('sent_count') + counts['sent'],
+                failed_count=F('failed_count') + counts['failed'],
+                blocked_count=F('blocked_count') + counts['blocked'],
+                last_recipient_id=last_recipient_id,
+                heartbeat_at=timezone.now(),
+            )
+            if not updated:
+                return False
+            BroadcastDelivery.objects.bulk_create(
+                [
+                    BroadcastDelivery(
+                        campaign_id=campaign_id, user_id=outcome['user_id'], status=outcome['status'],
+                        error=outcome['error'][:255], telegram_message_id=outcome['message_id'],
+                    )
+                    for outcome in outcomes
+                ],
+                ignore_conflicts=True,
+            )
+            blocked = [outcome['user_id'] for outcome in outcomes if outcome['status'] == 'blocked']
+            if blocked:
+                User.objects.filter(id__in=blocked).update(is_active_telegram=False)
+        return True
+
+    def _finish(self, campaign_id):
+        BroadcastCampaign.objects.filter(id=campaign_id, worker_id=self.worker_id, status='running').update(
+            status='completed', finished_at=timezone.now(), worker_id='', heartbeat_at=None,
+        )
+
+    def _release(self, campaign_id, retry_later=False):
+        """Give up the lease; ``retry_later`` keeps it stale-able instead of free at once"""
+        BroadcastCampaign.objects.filter(id=campaign_id, worker_id=self.worker_id).update(
+            worker_id='', heartbeat_at=timezone.now() if retry_later else None,
+        )
+
+    # Sending side (async)
+    async def _send(self, client, limiter, semaphore, campaign, user_id, chat_id):
+        payload = {'chat_id': chat_id, 'text': campaign.message}
+        if campaign.parse_mode:
+            payload['parse_mode'] = campaign.parse_mode
+
+        outcome = {'user_id': user_id, 'status': 'failed', 'error': '', 'message_id': None}
+        async with semaphore:
+            for _ in range(MAX_ATTEMPTS):
+                await limiter.wait()
+                started = time.perf_counter()
+                try:
+                    response = await client.post(f"{self.api_url}/sendMessage", json=payload)
+                    data = response.json()
+                except (httpx.HTTPError, ValueError) as e:
+                    metrics.observe_telegram_call('sendMessage', time.perf_counter() - started, None)
+                    outcome['error'] = str(e) or e.__class__.__name__
+                    continue
+
+                description = data.get('description', '')
+                metrics.observe_telegram_call(
+                    'sendMessage', time.perf_counter() - started, response.status_code, description
+                )
+                if response.status_code == 200 and data.get('ok'):
+                    outcome.update(status='sent', error='', message_id=data['result'].get('message_id'))
+                    return outcome
+                if response.status_code == 429:
+                    retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+                    limiter.pause(retry_after)
+                    outcome['error'] = description
+                    continue
+                outcome['status'] = 'blocked' if response.status_code == 403 else 'failed'
+                outcome['error'] = description
+                return outcome
+        return outcome
+
+    async def run_campaign(self, campaign_id):
+        """Send a claimed campaign until done, paused or cancelled"""
+        limiter = RateLimiter(self.rate)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        async with httpx.AsyncClient(timeout=15, limits=limits) as client:
+            while True:
+                batch = await sync_to_async(self._next_batch)(campaign_id)
+                if batch is None:
+                    logger.info(f"⏸️ Broadcast {campaign_id} stopped by the dashboard")
+                    await sync_to_async(self._release)(campaign_id)
+                    return
+                campaign, recipients = batch
+                if not recipients:
+                    await sync_to_async(self._finish)(campaign_id)
+                    logger.info(
+                        f"📣 Broadcast {campaign_id} finished: {campaign.sent_count} sent, "
+                        f"{campaign.failed_count} failed, {campaign.blocked_count} blocked"
+                    )
+                    return
+
+                outcomes = await asyncio.gather(*(
+                    self._send(client, limiter, semaphore, campaign, user_id, chat_id)
+                    for user_id, chat_id in recipients
+                ))
+                if not await sync_to_async(self._record)(campaign_id, outcomes, recipients[-1][0]):
+                    logger.warning(f"⚠️ Lost the lease on broadcast {campaign_id}")
+                    return
+
+    async def run_pending(self):
+        """Send every claimable campaign, then return"""
+        while True:
+            campaign = await sync_to_async(self.claim_next)()
+            if not campaign:
+                return
+            logger.info(f"📣 Sending broadcast {campaign.id} '{campaign.title}' to {campaign.total_recipients} users")
+            try:
+                await self.run_campaign(campaign.id)
+            except asyncio.CancelledError:
+                await sync_to_async(self._release)(campaign.id)
+                raise
+            except Exception as e:
+                logger.error(f"❌ Broadcast {campaign.id} failed, retrying after the lease expires: {e}")
+                await sync_to_async(self._release)(campaign.id, retry_later=True)
+
+    async def run_forever(self, poll_seconds=None):
+        poll_seconds = poll_seconds or getattr(settings, 'BROADCAST_POLL_SECONDS', 5)
+        while True:
+            try:
+                await self.run_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Broadcast sender error: {e}")
+            await asyncio.sleep(poll_seconds)
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('parse_mode', models.CharField(blank=True, help_text='HTML / Markdown أو فارغ للنص العادي', max_length=20)),
+                ('target_user_type', models.CharField(blank=True, choices=[('', 'الكل'), ('client', 'العملاء'), ('junkyard', 'التشاليح')], max_length=20)),
+                ('target_active_only', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('draft', 'مسودة'), ('queued', 'في الانتظار'), ('running', 'قيد الإرسال'), ('paused', 'متوقفة مؤقتاً'), ('completed', 'مكتملة'), ('cancelled', 'ملغاة')], default='draft', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('total_recipients', models.PositiveIntegerField(default=0)),
+                ('sent_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('blocked_count', models.PositiveIntegerField(default=0)),
+                ('last_recipient_id', models.BigIntegerField(default=0)),
+                ('worker_id', models.CharField(blank=True, max_length=100)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('target_city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bot.city')),
+            ],
+            options={
+                'verbose_name': 'حملة رسائل',
+                'verbose_name_plural': 'حملات الرسائل',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BroadcastDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('sent', 'تم الإرسال'), ('failed', 'فشل'), ('blocked', 'حظر البوت')], max_length=20)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('telegram_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='dashboard.broadcastcampaign')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'نتيجة إرسال',
+                'verbose_name_plural': 'نتائج الإرسال',
+                'indexes': [models.Index(fields=['campaign', 'status'], name='dash_delivery_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='broadcastdelivery',
+            constraint=models.UniqueConstraint(fields=('campaign', 'user'), name='dash_broadcast_delivery_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='broadcastcampaign',
+            index=models.Index(fields=['status', 'heartbeat_at'], name='dash_broadcast_status_idx'),
+        ),
+    ]
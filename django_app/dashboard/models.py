@@ -20,3 +20,94 @@ class DashboardStats(models.Model):
     
     def __str__(self):
         return f'إحصائيات {self.date}'
+
+
+class BroadcastCampaign(models.Model):
+    """A message sent to every user matching a target query"""
+    STATUS_CHOICES = [
+        ('draft', 'مسودة'),
+        ('queued', 'في الانتظار'),
+        ('running', 'قيد الإرسال'),
+        ('paused', 'متوقفة مؤقتاً'),
+        ('completed', 'مكتملة'),
+        ('cancelled', 'ملغاة'),
+    ]
+    TARGET_USER_TYPES = [
+        ('', 'الكل'),
+        ('client', 'العملاء'),
+        ('junkyard', 'التشاليح'),
+    ]
+    
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    parse_mode = models.CharField(max_length=20, blank=True, help_text='HTML / Markdown أو فارغ للنص العادي')
+    
+    # Target query
+    target_user_type = models.CharField(max_length=20, choices=TARGET_USER_TYPES, blank=True)
+    target_city = models.ForeignKey('bot.City', on_delete=models.SET_NULL, null=True, blank=True)
+    target_active_only = models.BooleanField(default=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    created_by = models.ForeignKey('bot.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    # Progress; recipients are walked in user id order and last_recipient_id
+    # is the resume checkpoint
+    total_recipients = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    blocked_count = models.PositiveIntegerField(default=0)
+    last_recipient_id = models.BigIntegerField(default=0)
+    
+    # Sender lease so only one worker runs a campaign at a time
+    worker_id = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'حملة رسائل'
+        verbose_name_plural = 'حملات الرسائل'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at'], name='dash_broadcast_status_idx'),
+        ]
+    
+    def __str__(self):
+        return self.title
+    
+    @property
+    def processed_count(self):
+        return self.sent_count + self.failed_count + self.blocked_count
+    
+    @property
+    def progress_percent(self):
+        if not self.total_recipients:
+            return 100 if self.status == 'completed' else 0
+        return min(100, round(self.processed_count * 100 / self.total_recipients))
+
+
+class BroadcastDelivery(models.Model):
+    """Outcome of a campaign message for one recipient"""
+    STATUS_CHOICES = [
+        ('sent', 'تم الإرسال'),
+        ('failed', 'فشل'),
+        ('blocked', 'حظر البوت'),
+    ]
+    
+    campaign = models.ForeignKey(BroadcastCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    user = models.ForeignKey('bot.User', on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    error = models.CharField(max_length=255, blank=True)
+    telegram_message_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'نتيجة إرسال'
+        verbose_name_plural = 'نتائج الإرسال'
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'user'], name='dash_broadcast_delivery_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'status'], name='dash_delivery_status_idx'),
+        ]
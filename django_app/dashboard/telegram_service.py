@@ -1,26 +1,99 @@
 import asyncio
+import atexit
 import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
 import requests
 from django.conf import settings
-from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter
+
+from bot import metrics
 
 logger = logging.getLogger(__name__)
 
+BACKGROUND_PENDING = metrics.REGISTRY.gauge(
+    'bot_dashboard_sends_pending', 'Dashboard Telegram sends queued or in progress'
+)
+
+# Background and async sends retry 429 answers after Telegram's retry_after, up
+# to this many attempts; a plain send_message_sync returns the 429 at once
+MAX_ATTEMPTS = 3
+MAX_RETRY_AFTER = 30
+
+
 class TelegramService:
-    """Service for sending Telegram messages from dashboard"""
+    """Service for sending Telegram messages from dashboard
+
+    One pooled ``requests.Session`` is kept per process, so repeated sends
+    reuse the TLS connection to the Bot API instead of opening a new one per
+    message. ``send_many`` fans out over a bounded thread pool,
+    ``send_message_async`` is the asyncio variant (pooled ``httpx`` client
+    per event loop), and ``enqueue`` hands a send to a background pool so
+    dashboard views don't wait on Telegram.
+    """
     
     def __init__(self):
         self.bot_token = getattr(settings, 'TELEGRAM_BOT_TOKEN', None)
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        api_base = getattr(settings, 'TELEGRAM_API_BASE_URL', 'https://api.telegram.org/bot')
+        self.base_url = f"{api_base}{self.bot_token}"
+        # Files are served from <root>/file/bot<token>/<file_path> (python-telegram-bot's base_file_url)
+        root, _, prefix = api_base.rpartition('/')
+        self.file_base_url = f"{root}/file/{prefix}{self.bot_token}"
+        self.pool_size = getattr(settings, 'TELEGRAM_SERVICE_POOL_SIZE', 20)
+        self.timeout = getattr(settings, 'TELEGRAM_SERVICE_TIMEOUT', 10)
+        self.background_workers = getattr(settings, 'TELEGRAM_SERVICE_WORKERS', 4)
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._pending = 0
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
     
-    def send_message_sync(self, chat_id: int, text: str, parse_mode: str = None) -> Dict[str, Any]:
-        """Send message synchronously using requests"""
-        if not self.bot_token:
-            logger.error("TELEGRAM_BOT_TOKEN not configured")
-            return {"success": False, "error": "Bot token not configured"}
-        
-        url = f"{self.base_url}/sendMessage"
-        
+    # Connection pools
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+    
+    def _async_client(self) -> 'httpx.AsyncClient':
+        import httpx  # Only async senders need it; keeps dashboard imports light
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            self._async_clients[loop] = client
+        return client
+    
+    def close(self):
+        """Close the pooled session and stop the background pool"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            session, self._session = self._session, None
+        if executor:
+            executor.shutdown(wait=True)
+        if session:
+            session.close()
+    
+    async def aclose(self):
+        """Close the async client of the running event loop"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client:
+            await client.aclose()
+    
+    # Sending
+    def _payload(self, chat_id: int, text: str, parse_mode: str = None) -> Dict[str, Any]:
         data = {
             "chat_id": chat_id,
             "text": text
@@ -28,25 +101,158 @@ class TelegramService:
         
         if parse_mode:
             data["parse_mode"] = parse_mode
+        return data
+    
+    def _result(self, chat_id, status_code, response_data, elapsed) -> Optional[Dict[str, Any]]:
+        """Result dict for a reply; None when it was a 429 to retry"""
+        description = response_data.get("description", "")
+        metrics.observe_telegram_call("sendMessage", elapsed, status_code, description)
+        
+        if status_code == 200 and response_data.get("ok"):
+            logger.info(f"Message sent successfully to {chat_id}")
+            return {"success": True, "data": response_data}
+        if status_code == 429:
+            return None
+        error_msg = description or "Unknown error"
+        logger.error(f"Failed to send message to {chat_id}: {error_msg}")
+        return {"success": False, "error": error_msg}
+    
+    @staticmethod
+    def _retry_after(response_data) -> float:
+        retry_after = (response_data.get("parameters") or {}).get("retry_after", 1)
+        return min(retry_after, MAX_RETRY_AFTER)
+    
+    def send_message_sync(self, chat_id: int, text: str, parse_mode: str = None,
+                          retry_rate_limited: bool = False) -> Dict[str, Any]:
+        """Send message synchronously over the pooled session
+
+        A 429 is returned as an error straight away, so a view calling this
+        never sleeps through retry_after; ``retry_rate_limited`` (used by the
+        background and batch senders) waits and retries instead.
+        """
+        if not self.bot_token:
+            logger.error("TELEGRAM_BOT_TOKEN not configured")
+            return {"success": False, "error": "Bot token not configured"}
         
-        try:
-            response = requests.post(url, json=data, timeout=10)
-            response_data = response.json()
+        url = f"{self.base_url}/sendMessage"
+        data = self._payload(chat_id, text, parse_mode)
+        
+        for _ in range(MAX_ATTEMPTS if retry_rate_limited else 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, json=data, timeout=self.timeout)
+                response_data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                metrics.observe_telegram_call("sendMessage", time.perf_counter() - started, None)
+                logger.error(f"Request error sending message to {chat_id}: {e}")
+                return {"success": False, "error": str(e)}
+            except Exception as e:
+                logger.error(f"Unexpected error sending message to {chat_id}: {e}")
+                return {"success": False, "error": str(e)}
             
-            if response.status_code == 200 and response_data.get("ok"):
-                logger.info(f"Message sent successfully to {chat_id}")
-                return {"success": True, "data": response_data}
-            else:
-                error_msg = response_data.get("description", "Unknown error")
-                logger.error(f"Failed to send message to {chat_id}: {error_msg}")
-                return {"success": False, "error": error_msg}
-                
-        except requests.RequestException as e:
-            logger.error(f"Request error sending message to {chat_id}: {e}")
-            return {"success": False, "error": str(e)}
-        except Exception as e:
-            logger.error(f"Unexpected error sending message to {chat_id}: {e}")
-            return {"success": False, "error": str(e)}
+            result = self._result(chat_id, response.status_code, response_data, time.perf_counter() - started)
+            if result is not None:
+                return result
+            if retry_rate_limited:
+                time.sleep(self._retry_after(response_data))
+        
+        logger.error(f"Failed to send message to {chat_id}: rate limited")
+        return {"success": False, "error": response_data.get("description", "Too Many Requests")}
+    
+    async def send_message_async(self, chat_id: int, text: str, parse_mode: str = None) -> Dict[str, Any]:
+        """Send message from async code without blocking the event loop"""
+        if not self.bot_token:
+            logger.error("TELEGRAM_BOT_TOKEN not configured")
+            return {"success": False, "error": "Bot token not configured"}
+        
+        import httpx
+
+        url = f"{self.base_url}/sendMessage"
+        data = self._payload(chat_id, text, parse_mode)
+        client = self._async_client()
+        
+        for _ in range(MAX_ATTEMPTS):
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=data)
+                response_data = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                metrics.observe_telegram_call("sendMessage", time.perf_counter() - started, None)
+                logger.error(f"Request error sending message to {chat_id}: {e}")
+                return {"success": False, "error": str(e) or e.__class__.__name__}
+            
+            result = self._result(chat_id, response.status_code, response_data, time.perf_counter() - started)
+            if result is not None:
+                return result
+            await asyncio.sleep(self._retry_after(response_data))
+        
+        logger.error(f"Failed to send message to {chat_id}: rate limited")
+        return {"success": False, "error": response_data.get("description", "Too Many Requests")}
+    
+    def send_many(self, messages: Iterable[Dict[str, Any]], concurrency: int = None) -> List[Dict[str, Any]]:
+        """Send several messages, at most ``concurrency`` at a time
+
+        ``messages`` are send_message_sync keyword dicts (chat_id, text,
+        parse_mode); results come back in the same order. Rate-limited
+        messages are retried.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        concurrency = max(1, min(concurrency or self.pool_size, self.pool_size, len(messages)))
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='telegram-send') as executor:
+            return list(executor.map(
+                lambda message: self.send_message_sync(**{'retry_rate_limited': True, **message}), messages
+            ))
+    
+    async def send_many_async(self, messages: Iterable[Dict[str, Any]], concurrency: int = None) -> List[Dict[str, Any]]:
+        """Async send_many"""
+        semaphore = asyncio.Semaphore(max(1, min(concurrency or self.pool_size, self.pool_size)))
+        
+        async def send(message):
+            async with semaphore:
+                return await self.send_message_async(**message)
+        
+        return await asyncio.gather(*(send(message) for message in messages))
+    
+    # Background sends
+    def _background(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.background_workers, thread_name_prefix='telegram-background'
+                    )
+        return self._executor
+    
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Run ``func`` on the background pool (inline when TELEGRAM_SERVICE_BACKGROUND is off)"""
+        if not getattr(settings, 'TELEGRAM_SERVICE_BACKGROUND', True):
+            future = Future()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        
+        self._track_pending(1)
+        future = self._background().submit(func, *args, **kwargs)
+        future.add_done_callback(self._background_done)
+        return future
+    
+    def _track_pending(self, delta):
+        with self._lock:
+            self._pending += delta
+            BACKGROUND_PENDING.set(self._pending)
+    
+    def _background_done(self, future):
+        self._track_pending(-1)
+        if not future.cancelled() and future.exception():
+            logger.error(f"Background Telegram send failed: {future.exception()}")
+    
+    def enqueue(self, chat_id: int, text: str, parse_mode: str = None) -> Future:
+        """Queue a message and return at once; the Future holds the result"""
+        return self.submit(self.send_message_sync, chat_id, text, parse_mode, retry_rate_limited=True)
     
     def send_unban_notification(self, user) -> Dict[str, Any]:
         """Send unban notification to user"""
@@ -102,3 +308,4 @@ class TelegramService:
 
 # Global instance
 telegram_service = TelegramService()
+atexit.register(telegram_service.close)
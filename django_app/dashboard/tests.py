@@ -1,3 +1,137 @@
-from django.test import TestCase
+import io
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .telegram_service import TelegramService
+from .thumbnails import generate_thumbnail, render_thumbnail, thumbnail_path, thumbnail_source
+
+
+class ThumbnailTests(TestCase):
+    """اختبارات الصور المصغرة للوحة التحكم"""
+
+    def _make_image(self, size=(1280, 960)):
+        output = io.BytesIO()
+        Image.new('RGB', size, color='red').save(output, format='JPEG')
+        return output.getvalue()
+
+    def test_render_thumbnail_is_small(self):
+        original = self._make_image()
+        data = render_thumbnail(original)
+
+        with Image.open(io.BytesIO(data)) as thumb:
+            self.assertLessEqual(max(thumb.size), 320)
+            self.assertEqual(thumb.format, 'WEBP')
+        self.assertLess(len(data), len(original))
+
+    @override_settings(THUMBNAIL_FORMAT='JPEG')
+    def test_render_thumbnail_jpeg_fallback(self):
+        data = render_thumbnail(self._make_image())
+        with Image.open(io.BytesIO(data)) as thumb:
+            self.assertEqual(thumb.format, 'JPEG')
+
+    def test_thumbnail_source_prefers_small_size(self):
+        media = {"type": "photo", "file_id": "big", "thumb_file_id": "small"}
+        self.assertEqual(thumbnail_source(media), "small")
+        self.assertEqual(thumbnail_source({"type": "photo", "file_id": "big"}), "big")
+        self.assertIsNone(thumbnail_source({"type": "video", "file_id": "vid"}))
+
+    def test_thumbnail_view_serves_cached_file(self):
+        from django.urls import reverse
+        from bot.models import User
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            path = thumbnail_path('cached_file')
+            path.parent.mkdir(parents=True)
+            path.write_bytes(render_thumbnail(self._make_image()))
+
+            response = self.client.get(reverse('dashboard:telegram_thumbnail', args=['cached_file']))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/webp')
+            self.assertEqual(response['Cache-Control'], 'private, max-age=2592000, immutable')
+            b''.join(response.streaming_content)
+
+    @override_settings(TELEGRAM_API_BASE_URL='http://telegram.test/bot', TELEGRAM_BOT_TOKEN='123:TEST')
+    def test_failed_download_uses_configured_api_and_marks_asset(self):
+        from bot.models import Brand, City, MediaAsset, Model, Request, User
+
+        brand = Brand.objects.create(name='Toyota')
+        request = Request.objects.create(
+            user=User.objects.create_user(username='customer', telegram_id=111),
+            city=City.objects.create(name='Riyadh', code='RY'),
+            brand=brand, model=Model.objects.create(brand=brand, name='Camry'), year=2020,
+        )
+        asset = MediaAsset.objects.create(request=request, file_id='big', file_unique_id='u1', thumb_file_id='small')
+
+        service = TelegramService()
+        service._session = mock.Mock()
+        service._session.get.side_effect = [
+            mock.Mock(status_code=200, json=mock.Mock(return_value={'ok': True, 'result': {'file_path': 'photos/1.jpg'}})),
+            mock.Mock(status_code=404),
+        ]
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                mock.patch('dashboard.thumbnails.telegram_service', service):
+            self.assertIsNone(generate_thumbnail('small'))
+
+        urls = [call.args[0] for call in service._session.get.call_args_list]
+        self.assertEqual(urls, [
+            'http://telegram.test/bot123:TEST/getFile',
+            'http://telegram.test/file/bot123:TEST/photos/1.jpg',
+        ])
+        asset.refresh_from_db()
+        self.assertEqual(asset.thumbnail_status, 'failed')
+
+
+class EditJunkyardIndexTests(TestCase):
+    """اختبارات تحديث فهرس التخصص عند تعديل التشليح"""
+
+    def setUp(self):
+        from bot.models import Brand, City, Junkyard, User
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        self.riyadh = City.objects.create(name='Riyadh', code='RY')
+        self.jeddah = City.objects.create(name='Jeddah', code='JD')
+        self.toyota = Brand.objects.create(name='Toyota')
+        self.nissan = Brand.objects.create(name='Nissan')
+        owner = User.objects.create_user(username='yard', telegram_id=12345678, first_name='Yard', user_type='junkyard')
+        self.junkyard = Junkyard.objects.create(user=owner, phone='0500000000', city=self.riyadh, location='-')
+        self.junkyard.brands.set([self.toyota])
+
+    def _edit(self, city, brands):
+        from bot import matching
+
+        # Counts the view's own rebuilds; the m2m_changed signal rebuilds through bot.signals
+        with mock.patch('dashboard.views.matching', wraps=matching) as view_matching:
+            self.client.post(reverse('dashboard:edit_junkyard', args=[self.junkyard.id]), {
+                'first_name': 'Yard', 'username': 'yard', 'phone': '0500000000', 'location': '-',
+                'telegram_id': '12345678', 'city': city.id, 'brands': [brand.id for brand in brands],
+            })
+        return view_matching.rebuild_index.call_count
+
+    def test_brand_change_is_left_to_the_signal(self):
+        from bot.models import JunkyardSpecialization
+
+        self.assertEqual(self._edit(self.jeddah, [self.nissan]), 0)
+        self.assertEqual(
+            list(JunkyardSpecialization.objects.filter(junkyard=self.junkyard).values_list('city_id', 'brand_id')),
+            [(self.jeddah.id, self.nissan.id)],
+        )
+
+    def test_city_change_alone_rebuilds(self):
+        from bot.models import JunkyardSpecialization
+
+        self.assertEqual(self._edit(self.jeddah, [self.toyota]), 1)
+        self.assertEqual(
+            list(JunkyardSpecialization.objects.filter(junkyard=self.junkyard).values_list('city_id', flat=True)),
+            [self.jeddah.id],
+        )
+
+    def test_unchanged_junkyard_is_not_rebuilt(self):
+        self.assertEqual(self._edit(self.riyadh, [self.toyota]), 0)
@@ -0,0 +1,189 @@
+"""
+Tests for throttled, resumable broadcast campaigns
+"""
+
+import time
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from benchmarks.telegram_stub import TelegramApiStub
+from bot.models import Brand, City, Junkyard, Model, Request, User
+
+from .broadcasts import BroadcastSender, RateLimiter, queue_campaign, recipients_queryset
+from .models import BroadcastCampaign, BroadcastDelivery
+
+BLOCKED_CHAT = 1003
+
+
+class _BlockingStub(TelegramApiStub):
+    """Answers 403 for one chat, like a user who blocked the bot"""
+
+    def handle(self, method, params):
+        if method == 'sendMessage' and int(params.get('chat_id', 0)) == BLOCKED_CHAT:
+            self.calls[method] += 1
+            return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+        return super().handle(method, params)
+
+
+class BroadcastTestMixin:
+    def setUp(self):
+        self.riyadh = City.objects.create(name='الرياض', code='RUH')
+        self.jeddah = City.objects.create(name='جدة', code='JED')
+        brand = Brand.objects.create(name='Toyota')
+        self.model = Model.objects.create(brand=brand, name='Camry')
+
+        self.clients = [
+            User.objects.create(username=f'client{i}', telegram_id=1000 + i, user_type='client')
+            for i in range(1, 6)
+        ]
+        self.junkyard_user = User.objects.create(username='junkyard', telegram_id=2001, user_type='junkyard')
+        Junkyard.objects.create(user=self.junkyard_user, phone='0500000000', city=self.riyadh, location='-')
+        User.objects.create(username='no_telegram', user_type='client')
+        User.objects.create(username='inactive', telegram_id=3001, user_type='client', is_active_telegram=False)
+
+    def _campaign(self, **kwargs):
+        kwargs.setdefault('title', 'عرض')
+        kwargs.setdefault('message', 'مرحبا')
+        return BroadcastCampaign.objects.create(**kwargs)
+
+
+class RecipientsTests(BroadcastTestMixin, TestCase):
+    """Test campaign targeting"""
+
+    def test_filters(self):
+        everyone = self._campaign()
+        self.assertEqual(recipients_queryset(everyone).count(), 6)
+
+        clients = self._campaign(target_user_type='client', target_active_only=False)
+        self.assertEqual(recipients_queryset(clients).count(), 6)
+
+    def test_city(self):
+        Request.objects.create(
+            order_id='R1', user=self.clients[0], city=self.riyadh, brand=self.model.brand,
+            model=self.model, year=2015, expires_at='2030-01-01T00:00:00Z',
+        )
+        campaign = self._campaign(target_city=self.riyadh)
+        self.assertEqual(
+            set(recipients_queryset(campaign).values_list('username', flat=True)), {'client1', 'junkyard'}
+        )
+        self.assertFalse(recipients_queryset(self._campaign(target_city=self.jeddah)).exists())
+
+
+class BroadcastSenderTests(BroadcastTestMixin, TestCase):
+    """Test sending, checkpointing and leasing"""
+
+    def setUp(self):
+        super().setUp()
+        self.stub = _BlockingStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = override_settings(TELEGRAM_API_BASE_URL=self.stub.base_url, TELEGRAM_BOT_TOKEN='123456:TEST')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def _sender(self, **kwargs):
+        kwargs.setdefault('rate', 1000)
+        return BroadcastSender(worker_id='test', **kwargs)
+
+    def test_sends_campaign(self):
+        campaign = self._campaign(target_user_type='client')
+        queue_campaign(campaign)
+        async_to_sync(self._sender(batch_size=2).run_pending)()
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(campaign.total_recipients, 5)
+        self.assertEqual((campaign.sent_count, campaign.failed_count, campaign.blocked_count), (4, 0, 1))
+        self.assertEqual(campaign.progress_percent, 100)
+        self.assertEqual(self.stub.calls['sendMessage'], 5)
+        self.assertEqual(campaign.deliveries.count(), 5)
+        self.assertFalse(User.objects.get(telegram_id=BLOCKED_CHAT).is_active_telegram)
+
+    def test_resumes_after_checkpoint(self):
+        campaign = self._campaign(target_user_type='client')
+        queue_campaign(campaign)
+        # A crashed worker recorded the first two recipients
+        BroadcastCampaign.objects.filter(id=campaign.id).update(
+            status='running', worker_id='crashed', heartbeat_at=None,
+            sent_count=2, last_recipient_id=self.clients[1].id,
+        )
+
+        async_to_sync(self._sender().run_pending)()
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(self.stub.calls['sendMessage'], 3)
+        self.assertEqual(campaign.processed_count, 5)
+
+    def test_live_lease_not_claimed(self):
+        campaign = self._campaign()
+        queue_campaign(campaign)
+        self.assertIsNotNone(self._sender().claim_next())
+        self.assertIsNone(BroadcastSender(worker_id='other').claim_next())
+
+    def test_paused_campaign_stops(self):
+        campaign = self._campaign()
+        queue_campaign(campaign)
+        sender = self._sender()
+        sender.claim_next()
+        BroadcastCampaign.objects.filter(id=campaign.id).update(status='paused')
+
+        async_to_sync(sender.run_campaign)(campaign.id)
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'paused')
+        self.assertEqual(campaign.worker_id, '')
+        self.assertEqual(self.stub.calls['sendMessage'], 0)
+
+    def test_rate_limiter_spaces_sends(self):
+        limiter = RateLimiter(rate=100)
+
+        async def burst():
+            for _ in range(5):
+                await limiter.wait()
+
+        started = time.monotonic()
+        async_to_sync(burst)()
+        self.assertGreaterEqual(time.monotonic() - started, 0.035)
+
+
+class BroadcastViewTests(BroadcastTestMixin, TestCase):
+    """Test the dashboard campaign pages"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(self.admin)
+
+    def test_create_and_queue(self):
+        response = self.client.post(reverse('dashboard:broadcasts_list'), {
+            'title': 'تخفيضات', 'message': 'نص', 'target_user_type': 'junkyard',
+            'target_active_only': 'on', 'send_now': '1',
+        })
+        campaign = BroadcastCampaign.objects.get()
+        self.assertRedirects(response, reverse('dashboard:broadcast_detail', args=[campaign.id]))
+        self.assertEqual(campaign.status, 'queued')
+        self.assertEqual(campaign.total_recipients, 1)
+        self.assertEqual(campaign.created_by, self.admin)
+
+        self.assertEqual(self.client.get(reverse('dashboard:broadcasts_list')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('dashboard:broadcast_detail', args=[campaign.id])).status_code, 200)
+
+    def test_actions_and_progress(self):
+        campaign = self._campaign()
+        action = lambda name: self.client.post(reverse('dashboard:broadcast_action', args=[campaign.id, name]))
+
+        action('start')
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'queued')
+        action('pause')
+        action('start')  # not allowed from paused
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'paused')
+
+        BroadcastDelivery.objects.create(campaign=campaign, user=self.clients[0], status='sent')
+        BroadcastCampaign.objects.filter(id=campaign.id).update(sent_count=3)
+        data = self.client.get(reverse('dashboard:broadcast_progress', args=[campaign.id])).json()
+        self.assertEqual((data['status'], data['sent'], data['total']), ('paused', 3, 6))
+        self.assertEqual(data['percent'], 50)
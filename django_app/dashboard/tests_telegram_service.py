@@ -0,0 +1,99 @@
+"""
+Tests for the pooled dashboard TelegramService
+"""
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from benchmarks.telegram_stub import TelegramApiStub
+from bot.models import User
+
+from .telegram_service import TelegramService
+
+
+class TelegramServiceTests(SimpleTestCase):
+    """Test sending through the pooled session, in batches and async"""
+
+    def setUp(self):
+        self.stub = TelegramApiStub().start()
+        self.addCleanup(self.stub.stop)
+        overrides = override_settings(TELEGRAM_API_BASE_URL=self.stub.base_url, TELEGRAM_BOT_TOKEN='123456:TEST')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.service = TelegramService()
+        self.addCleanup(self.service.close)
+
+    def test_send_message_reuses_session(self):
+        result = self.service.send_message_sync(1, 'hi')
+        session = self.service.session
+        self.service.send_message_sync(1, 'again')
+
+        self.assertTrue(result['success'])
+        self.assertIs(self.service.session, session)
+        self.assertEqual(self.stub.calls['sendMessage'], 2)
+
+    def test_send_many_keeps_order(self):
+        results = self.service.send_many([{'chat_id': chat_id, 'text': 'hi'} for chat_id in range(1, 11)], concurrency=3)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual([r['data']['result']['chat']['id'] for r in results], list(range(1, 11)))
+        self.assertEqual(self.service.send_many([]), [])
+
+    def test_send_many_async(self):
+        results = async_to_sync(self.service.send_many_async)(
+            [{'chat_id': chat_id, 'text': 'hi', 'parse_mode': 'HTML'} for chat_id in (1, 2, 3)], concurrency=2
+        )
+        self.assertTrue(all(r['success'] for r in results))
+        self.assertEqual(self.stub.calls['sendMessage'], 3)
+
+    def test_rate_limited_retries_then_fails(self):
+        self.stub.rate_limit_ratio = 1.0
+        self.stub.retry_after = 0
+
+        result = self.service.enqueue(1, 'hi').result(timeout=5)
+
+        self.assertFalse(result['success'])
+        self.assertEqual(self.stub.calls['sendMessage'], 3)
+
+    def test_rate_limited_sync_send_returns_at_once(self):
+        self.stub.rate_limit_ratio = 1.0
+        self.stub.retry_after = 30
+
+        with mock.patch('dashboard.telegram_service.time.sleep') as sleep:
+            result = self.service.send_message_sync(1, 'hi')
+
+        self.assertFalse(result['success'])
+        self.assertEqual(self.stub.calls['sendMessage'], 1)
+        sleep.assert_not_called()
+
+    def test_enqueue(self):
+        future = self.service.enqueue(1, 'hi')
+        self.assertTrue(future.result(timeout=5)['success'])
+
+        with override_settings(TELEGRAM_SERVICE_BACKGROUND=False):
+            future = self.service.enqueue(1, 'inline')
+            self.assertTrue(future.done())
+
+    @override_settings(TELEGRAM_BOT_TOKEN='')
+    def test_missing_token(self):
+        self.assertFalse(TelegramService().send_message_sync(1, 'hi')['success'])
+
+
+class ToggleUserStatusTests(TestCase):
+    """Test that unblocking a user doesn't wait on Telegram"""
+
+    def test_unban_notification_is_queued(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        user = User.objects.create(username='client', telegram_id=1001, is_active=False)
+        self.client.force_login(admin)
+
+        with mock.patch('dashboard.views.telegram_service') as service:
+            self.client.post(reverse('dashboard:toggle_user_status', args=[user.id]))
+
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+        service.submit.assert_called_once_with(service.send_unban_notification, user)
+        service.send_unban_notification.assert_not_called()
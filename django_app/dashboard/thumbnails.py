@@ -0,0 +1,190 @@
+"""
+Thumbnail pipeline for Telegram media shown in the dashboard.
+
+Thumbnails are generated with Pillow from the smallest suitable Telegram
+photo size and cached on disk under MEDIA_ROOT, so list/detail pages only
+ever download a few KB per photo. Generation runs in a small background
+thread pool; the thumbnail view only falls back to inline generation when
+a thumbnail was not pre-generated yet.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+from django.conf import settings
+
+from .telegram_service import telegram_service
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _thumbnail_dir() -> Path:
+    return Path(settings.MEDIA_ROOT) / 'thumbnails'
+
+
+def _thumbnail_format() -> str:
+    fmt = getattr(settings, 'THUMBNAIL_FORMAT', 'WEBP').upper()
+    return 'JPEG' if fmt in ('JPG', 'JPEG') else 'WEBP'
+
+
+def thumbnail_content_type() -> str:
+    return 'image/jpeg' if _thumbnail_format() == 'JPEG' else 'image/webp'
+
+
+def thumbnail_path(file_id: str) -> Path:
+    """Return the on-disk cache path for the thumbnail of a Telegram file_id"""
+    digest = hashlib.sha1(file_id.encode('utf-8')).hexdigest()
+    extension = 'jpg' if _thumbnail_format() == 'JPEG' else 'webp'
+    # Two-level fan-out keeps directories small on busy installs
+    return _thumbnail_dir() / digest[:2] / f"{digest}.{extension}"
+
+
+def has_thumbnail(file_id: str) -> bool:
+    return thumbnail_path(file_id).exists()
+
+
+def _download_telegram_file(file_id: str) -> Optional[bytes]:
+    """Download a file from the Telegram Bot API, returning its bytes"""
+    if not telegram_service.bot_token:
+        logger.error("TELEGRAM_BOT_TOKEN not configured")
+        return None
+
+    response = telegram_service.session.get(
+        f"{telegram_service.base_url}/getFile",
+        params={'file_id': file_id},
+        timeout=10,
+    )
+    if response.status_code != 200 or not response.json().get('ok'):
+        logger.warning(f"Telegram getFile failed for {file_id}: {response.status_code}")
+        return None
+
+    file_path = response.json()['result']['file_path']
+    file_response = telegram_service.session.get(
+        f"{telegram_service.file_base_url}/{file_path}",
+        timeout=30,
+    )
+    if file_response.status_code != 200:
+        logger.warning(f"Telegram file download failed for {file_id}: {file_response.status_code}")
+        return None
+    return file_response.content
+
+
+def render_thumbnail(image_bytes: bytes) -> bytes:
+    """Resize raw image bytes to a thumbnail and encode it"""
+    from PIL import Image
+
+    size = getattr(settings, 'THUMBNAIL_SIZE', 320)
+    fmt = _thumbnail_format()
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format=fmt, quality=getattr(settings, 'THUMBNAIL_QUALITY', 70))
+        return output.getvalue()
+
+
+def generate_thumbnail(file_id: str) -> Optional[Path]:
+    """Generate and cache the thumbnail for a Telegram file_id"""
+    path = thumbnail_path(file_id)
+    if path.exists():
+        return path
+
+    try:
+        image_bytes = _download_telegram_file(file_id)
+        if not image_bytes:
+            _set_asset_status(file_id, 'failed')
+            return None
+
+        data = render_thumbnail(image_bytes)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Atomic write so concurrent readers never see a partial file
+        temp_path = path.with_suffix(path.suffix + f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        logger.debug(f"Generated thumbnail for {file_id} ({len(data)} bytes)")
+        _set_asset_status(file_id, 'ready')
+        return path
+    except Exception as e:
+        logger.error(f"Error generating thumbnail for {file_id}: {e}")
+        _set_asset_status(file_id, 'failed')
+        return None
+
+
+def _set_asset_status(file_id: str, status: str):
+    """Track thumbnail state on the MediaAsset rows built from this file"""
+    try:
+        from bot.models import MediaAsset
+        MediaAsset.objects.filter(thumb_file_id=file_id).exclude(thumbnail_status=status).update(thumbnail_status=status)
+    except Exception as e:
+        logger.warning(f"Could not update thumbnail status for {file_id}: {e}")
+
+
+def thumbnail_source(media: dict) -> Optional[str]:
+    """Return the file_id to build a thumbnail from (smallest suitable size)"""
+    if not media or media.get('type') != 'photo':
+        return None
+    return media.get('thumb_file_id') or media.get('file_id')
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def _run_pending(file_id: str):
+    from django.db import close_old_connections
+    try:
+        generate_thumbnail(file_id)
+    finally:
+        with _pending_lock:
+            _pending.discard(file_id)
+        close_old_connections()
+
+
+def schedule_thumbnails(media_files: Iterable[dict]) -> int:
+    """
+    Queue thumbnail generation for photos in a media_files list.
+    Returns the number of thumbnails queued.
+    """
+    queued = 0
+    for media in media_files or []:
+        file_id = thumbnail_source(media)
+        if not file_id or has_thumbnail(file_id):
+            continue
+        with _pending_lock:
+            if file_id in _pending:
+                continue
+            _pending.add(file_id)
+        _get_executor().submit(_run_pending, file_id)
+        queued += 1
+    return queued
+
+
+def schedule_request_thumbnails(request) -> int:
+    """Queue thumbnails for a request and all of its items"""
+    media_files = list(request.media_files or [])
+    for item in request.items.all():
+        media_files.extend(item.media_files or [])
+    return schedule_thumbnails(media_files)
@@ -11,6 +11,7 @@ urlpatterns = [
     # Requests
     path('requests/', views.requests_list, name='requests_list'),
     path('requests/<int:request_id>/', views.request_detail, name='request_detail'),
+    path('requests/archived/<str:order_id>/', views.archived_request_detail, name='archived_request_detail'),
     
     # Junkyards
     path('junkyards/', views.junkyards_list, name='junkyards_list'),
@@ -29,6 +30,12 @@ urlpatterns = [
     path('users/<int:user_id>/toggle-status/', views.toggle_user_status, name='toggle_user_status'),
     path('users/<int:user_id>/delete/', views.delete_user, name='delete_user'),
     
+    # Broadcasts
+    path('broadcasts/', views.broadcasts_list, name='broadcasts_list'),
+    path('broadcasts/<int:campaign_id>/', views.broadcast_detail, name='broadcast_detail'),
+    path('broadcasts/<int:campaign_id>/progress/', views.broadcast_progress, name='broadcast_progress'),
+    path('broadcasts/<int:campaign_id>/<str:action>/', views.broadcast_action, name='broadcast_action'),
+    
     # Settings
     path('settings/', views.settings_view, name='settings'),
     
@@ -40,6 +47,7 @@ urlpatterns = [
     
     # Telegram Media
     path('telegram/image/<str:file_id>/', views.telegram_image, name='telegram_image'),
+    path('telegram/thumbnail/<str:file_id>/', views.telegram_thumbnail, name='telegram_thumbnail'),
     path('telegram/video/<str:file_id>/', views.telegram_video, name='telegram_video'),
     
     # API endpoints
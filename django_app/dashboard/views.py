@@ -8,6 +8,7 @@ from django.db.models import Count, Avg, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 from bot.models import User, Request, Offer, Junkyard, City, Brand, Model, JunkyardRating, SystemSetting, JunkyardStaff
+from bot import junkyard_stats, matching
 from .telegram_service import telegram_service
 import logging
 
@@ -125,6 +126,17 @@ def requests_list(request):
     city_filter = request.GET.get('city')
     brand_filter = request.GET.get('brand')
     expired_filter = request.GET.get('expired')
+    order_filter = request.GET.get('order', '').strip()
+    
+    if order_filter:
+        # Old closed orders live in the archive; open them there if they left the hot table
+        from bot.archive import find_order
+        tier, found = find_order(order_filter)
+        if tier == 'hot':
+            return redirect('dashboard:request_detail', request_id=found.id)
+        if tier == 'archived':
+            return redirect('dashboard:archived_request_detail', order_id=found.order_id)
+        messages.error(request, f'لم يتم العثور على الطلب {order_filter}')
     
     if status_filter:
         requests = requests.filter(status=status_filter)
@@ -159,6 +171,7 @@ def requests_list(request):
         'current_city': city_filter,
         'current_brand': brand_filter,
         'current_expired': expired_filter,
+        'current_order': order_filter,
     }
     
     return render(request, 'dashboard/requests_list.html', context)
@@ -169,6 +182,10 @@ def request_detail(request, request_id):
     req = get_object_or_404(Request.objects.prefetch_related('items'), id=request_id)
     offers = req.offers.select_related('junkyard__user').order_by('-created_at')
     
+    # Warm thumbnails in the background for photos that don't have one yet
+    from .thumbnails import schedule_request_thumbnails
+    schedule_request_thumbnails(req)
+    
     context = {
         'request': req,
         'offers': offers,
@@ -176,6 +193,19 @@ def request_detail(request, request_id):
     
     return render(request, 'dashboard/request_detail.html', context)
 
+@staff_member_required
+def archived_request_detail(request, order_id):
+    """Read-only view of an archived order snapshot"""
+    from bot.models import ArchivedRequest
+    
+    archived = get_object_or_404(ArchivedRequest.objects.select_related('user', 'city'), order_id=order_id)
+    context = {
+        'archived': archived,
+        'snapshot': archived.data,
+    }
+    
+    return render(request, 'dashboard/archived_request_detail.html', context)
+
 @staff_member_required
 def junkyards_list(request):
     """List all junkyards"""
@@ -230,6 +260,7 @@ def junkyard_detail(request, junkyard_id):
         'junkyard': junkyard,
         'offers': offers,
         'ratings': ratings,
+        'stats': junkyard_stats.stats_for(junkyard),
     }
     
     return render(request, 'dashboard/junkyard_detail.html', context)
@@ -240,26 +271,15 @@ def test_junkyard_notification(request, junkyard_id):
     junkyard = get_object_or_404(Junkyard, id=junkyard_id)
     
     if request.method == 'POST':
-        try:
-            from bot.telegram_bot import TelegramBot
-            import asyncio
-            from django.utils import timezone
-            
-            # Check if junkyard has telegram_id
-            if not junkyard.user.telegram_id:
-                messages.error(request, 'التشليح ليس لديه معرف تليجرام')
-                return redirect('dashboard:junkyard_detail', junkyard_id=junkyard_id)
-            
-            # Setup bot
-            bot = TelegramBot()
-            app = bot.setup_bot()
-            
-            if not app:
-                messages.error(request, 'فشل في إعداد البوت')
-                return redirect('dashboard:junkyard_detail', junkyard_id=junkyard_id)
-            
-            # Test message
-            test_message = f"""
+        from django.utils import timezone
+        
+        # Check if junkyard has telegram_id
+        if not junkyard.user.telegram_id:
+            messages.error(request, 'التشليح ليس لديه معرف تليجرام')
+            return redirect('dashboard:junkyard_detail', junkyard_id=junkyard_id)
+        
+        # Test message
+        test_message = f"""
 🧪 رسالة اختبار من لوحة التحكم
 
 مرحباً {junkyard.user.first_name}!
@@ -271,21 +291,15 @@ def test_junkyard_notification(request, junkyard_id):
 تم الإرسال في: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 🔔 ستبدأ في استقبال إشعارات الطلبات الجديدة من الآن.
-            """
-            
-            # Send test message
-            async def send_test():
-                await app.bot.send_message(
-                    chat_id=junkyard.user.telegram_id,
-                    text=test_message.strip()
-                )
-            
-            asyncio.run(send_test())
-            
+        """
+        
+        # Sent inline: the admin is waiting for the result of the test
+        result = telegram_service.send_message_sync(junkyard.user.telegram_id, test_message.strip())
+        
+        if result["success"]:
             messages.success(request, f'تم إرسال رسالة اختبار بنجاح للتشليح {junkyard.user.first_name}')
-            
-        except Exception as e:
-            error_msg = str(e)
+        else:
+            error_msg = result.get("error", "")
             
             if "Forbidden" in error_msg:
                 messages.error(request, f'لا يمكن إرسال الرسالة للتشليح. السبب: التشليح لم يبدأ محادثة مع البوت. يجب على {junkyard.user.first_name} إرسال /start للبوت أولاً.')
@@ -327,23 +341,22 @@ def diagnose_junkyard_issues(request, junkyard_id):
     else:
         success_items.append(f"✅ المدينة: {junkyard.city.name}")
     
-    # Check offers history
-    offers_count = junkyard.offers.count()
-    if offers_count == 0:
+    # Check offers history (maintained counters, see bot.junkyard_stats)
+    stats = junkyard_stats.stats_for(junkyard)
+    if stats.offers_made == 0:
         warnings.append(f"⚠️ لم يُقدم أي عروض بعد")
     else:
-        success_items.append(f"✅ قدم {offers_count} عرض سابق")
+        success_items.append(f"✅ قدم {stats.offers_made} عرض على {stats.requests_received} طلب وصله")
     
     # Check recent activity
     from django.utils import timezone
     from datetime import timedelta
     last_week = timezone.now() - timedelta(days=7)
-    recent_offers = junkyard.offers.filter(created_at__gte=last_week).count()
     
-    if recent_offers == 0:
+    if not stats.last_offer_at or stats.last_offer_at < last_week:
         warnings.append("⚠️ لا توجد عروض في الأسبوع الماضي")
     else:
-        success_items.append(f"✅ {recent_offers} عرض في الأسبوع الماضي")
+        success_items.append(f"✅ آخر عرض: {timezone.localtime(stats.last_offer_at):%Y-%m-%d %H:%M}")
     
     # Check if junkyard is in same city as recent requests
     if junkyard.city:
@@ -457,20 +470,16 @@ def test_order_workflow(request):
                 quantity=1
             )
             
-            # Test the workflow
+            # Test the workflow: the junkyard fan-out runs on the background
+            # pool, so the admin isn't kept waiting on every notification
             try:
                 # Setup bot and workflow service
                 bot = TelegramBot()
                 workflow_service.set_telegram_bot(bot)
                 
-                # Process the order
-                async def test_workflow():
-                    await workflow_service.process_confirmed_order(test_request)
-                
-                # Run the async function
-                asyncio.run(test_workflow())
+                telegram_service.submit(asyncio.run, workflow_service.process_confirmed_order(test_request))
                 
-                messages.success(request, f'تم إنشاء طلب اختبار بنجاح! رقم الطلب: {test_request.order_id} في مدينة {city.name}. تم إرسال الإشعارات للتشاليح ({active_junkyards} تشليح).')
+                messages.success(request, f'تم إنشاء طلب اختبار بنجاح! رقم الطلب: {test_request.order_id} في مدينة {city.name}. جاري إرسال الإشعارات للتشاليح ({active_junkyards} تشليح).')
                 
             except Exception as workflow_error:
                 messages.warning(request, f'تم إنشاء الطلب لكن فشل في إرسال الإشعارات: {str(workflow_error)}')
@@ -520,23 +529,13 @@ def quick_fix_junkyard(request, junkyard_id):
             
         elif action == 'test_telegram':
             # Test sending a message
-            try:
-                from bot.telegram_bot import TelegramBot
-                import asyncio
-                from django.utils import timezone
-                
-                if not junkyard.user.telegram_id:
-                    messages.error(request, 'التشليح ليس لديه معرف تليجرام')
-                    return redirect('dashboard:quick_fix_junkyard', junkyard_id=junkyard_id)
-                
-                bot = TelegramBot()
-                app = bot.setup_bot()
-                
-                if not app:
-                    messages.error(request, 'فشل في إعداد البوت')
-                    return redirect('dashboard:quick_fix_junkyard', junkyard_id=junkyard_id)
-                
-                test_message = f"""
+            from django.utils import timezone
+            
+            if not junkyard.user.telegram_id:
+                messages.error(request, 'التشليح ليس لديه معرف تليجرام')
+                return redirect('dashboard:quick_fix_junkyard', junkyard_id=junkyard_id)
+            
+            test_message = f"""
 🔧 اختبار سريع للنظام
 
 مرحباً {junkyard.user.first_name}!
@@ -548,19 +547,13 @@ def quick_fix_junkyard(request, junkyard_id):
 🔄 جرب الآن الضغط على "إضافة عرض" في أي طلب جديد.
 
 الوقت: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}
-                """
-                
-                async def send_test():
-                    await app.bot.send_message(
-                        chat_id=junkyard.user.telegram_id,
-                        text=test_message.strip()
-                    )
-                
-                asyncio.run(send_test())
+            """
+            
+            result = telegram_service.send_message_sync(junkyard.user.telegram_id, test_message.strip())
+            if result["success"]:
                 messages.success(request, f'تم إرسال رسالة اختبار بنجاح للتشليح {junkyard.user.first_name}')
-                
-            except Exception as e:
-                error_msg = str(e)
+            else:
+                error_msg = result.get("error", "")
                 if "Forbidden" in error_msg:
                     messages.error(request, f'لا يمكن إرسال الرسالة. السبب: التشليح لم يبدأ محادثة مع البوت. يجب على {junkyard.user.first_name} إرسال /start للبوت أولاً.')
                 else:
@@ -610,11 +603,12 @@ def quick_fix_junkyard(request, junkyard_id):
     from datetime import timedelta
     
     last_week = timezone.now() - timedelta(days=7)
-    recent_offers = junkyard.offers.filter(created_at__gte=last_week).count()
-    total_offers = junkyard.offers.count()
+    stats = junkyard_stats.stats_for(junkyard)
     
-    if total_offers == 0:
+    if stats.offers_made == 0:
         warnings.append('⚠️ لم يقدم أي عروض بعد')
+    elif stats.last_offer_at < last_week:
+        warnings.append('⚠️ لا توجد عروض في الأسبوع الماضي')
     
     # Check if bot can send messages
     can_test_telegram = junkyard.user.telegram_id is not None
@@ -625,8 +619,7 @@ def quick_fix_junkyard(request, junkyard_id):
         'fixes': fixes,
         'warnings': warnings,
         'can_test_telegram': can_test_telegram,
-        'recent_offers': recent_offers,
-        'total_offers': total_offers,
+        'stats': stats,
     }
     
     return render(request, 'dashboard/quick_fix_junkyard.html', context)
@@ -661,6 +654,7 @@ def edit_junkyard(request, junkyard_id):
         telegram_id = request.POST.get('telegram_id', '').strip()
         is_active = request.POST.get('is_active') == 'on'
         is_verified = request.POST.get('is_verified') == 'on'
+        brand_ids = request.POST.getlist('brands')
         
         # Debug: Print extracted values
         print(f"🔍 EDIT DEBUG: Form data - first_name={first_name}, username={username}, phone={phone}, city_id={city_id}, telegram_id={telegram_id}")
@@ -728,12 +722,19 @@ def edit_junkyard(request, junkyard_id):
             
             # Update junkyard
             print(f"🔍 EDIT DEBUG: Starting junkyard update - Junkyard ID: {junkyard.id}")
+            city_changed = junkyard.city_id != city.id
             junkyard.phone = phone
             junkyard.city = city
             junkyard.location = location
             junkyard.is_active = is_active
             junkyard.is_verified = is_verified
             junkyard.save()
+            # Changed makes reindex through the m2m_changed signal; a move to another
+            # city with the same makes fires none, so refresh the index rows here
+            declared_ids = set(junkyard.brands.values_list('id', flat=True))
+            junkyard.brands.set(Brand.objects.filter(id__in=brand_ids))
+            if city_changed and set(junkyard.brands.values_list('id', flat=True)) == declared_ids:
+                matching.rebuild_index([junkyard.id])
             
             print(f"🔍 EDIT DEBUG: After junkyard save - Junkyard ID: {junkyard.id}")
             
@@ -760,10 +761,13 @@ def edit_junkyard(request, junkyard_id):
     
     # GET request - show form with current data
     cities = City.objects.filter(is_active=True).order_by('name')
+    brands = Brand.objects.filter(is_active=True).order_by('name')
     
     context = {
         'junkyard': junkyard,
         'cities': cities,
+        'brands': brands,
+        'selected_brand_ids': set(junkyard.brands.values_list('id', flat=True)),
         'is_edit': True,
     }
     
@@ -1183,6 +1187,27 @@ def telegram_image(request, file_id):
         logger.error(f"Error fetching Telegram image {file_id}: {e}")
         return HttpResponse("Error loading image", status=500)
 
+@staff_member_required
+def telegram_thumbnail(request, file_id):
+    """Serve a cached thumbnail for a Telegram photo, generating it on a cache miss"""
+    from django.http import FileResponse, HttpResponseRedirect
+    from django.urls import reverse
+    from .thumbnails import generate_thumbnail, thumbnail_content_type, thumbnail_path
+
+    path = thumbnail_path(file_id)
+    if not path.exists():
+        path = generate_thumbnail(file_id)
+
+    if not path:
+        # Fall back to the original image rather than a broken thumbnail
+        return HttpResponseRedirect(reverse('dashboard:telegram_image', args=[file_id]))
+
+    response = FileResponse(open(path, 'rb'), content_type=thumbnail_content_type())
+    # Telegram file_ids are immutable, so thumbnails can be cached aggressively,
+    # but only by the staff member's browser: these are customers' photos
+    response['Cache-Control'] = 'private, max-age=2592000, immutable'
+    return response
+
 @staff_member_required
 def telegram_video(request, file_id):
     """Proxy Telegram video to dashboard"""
@@ -1388,22 +1413,11 @@ def toggle_user_status(request, user_id):
         
         status = "تم إلغاء حجب" if user.is_active else "تم حجب"
         
-        # Send Telegram notification if user was unblocked
-        if was_inactive and user.is_active:
-            print(f"DEBUG: Sending unban notification to user {user.telegram_id}")
-            try:
-                result = telegram_service.send_unban_notification(user)
-                if result["success"]:
-                    messages.success(request, f'{status} المستخدم "{user.first_name} {user.last_name}" بنجاح وتم إرسال إشعار التفعيل')
-                    print(f"DEBUG: Unban notification sent successfully to {user.telegram_id}")
-                else:
-                    messages.success(request, f'{status} المستخدم "{user.first_name} {user.last_name}" بنجاح')
-                    messages.warning(request, f'تعذر إرسال إشعار التفعيل: {result.get("error", "خطأ غير معروف")}')
-                    print(f"DEBUG: Failed to send unban notification: {result.get('error')}")
-            except Exception as e:
-                messages.success(request, f'{status} المستخدم "{user.first_name} {user.last_name}" بنجاح')
-                messages.warning(request, f'تعذر إرسال إشعار التفعيل: {str(e)}')
-                print(f"DEBUG: Exception sending unban notification: {e}")
+        # Send Telegram notification if user was unblocked (in the background,
+        # the result is logged by the service)
+        if was_inactive and user.is_active and user.telegram_id:
+            telegram_service.submit(telegram_service.send_unban_notification, user)
+            messages.success(request, f'{status} المستخدم "{user.first_name} {user.last_name}" بنجاح وجاري إرسال إشعار التفعيل')
         else:
             messages.success(request, f'{status} المستخدم "{user.first_name} {user.last_name}" بنجاح')
         
@@ -1459,3 +1473,118 @@ def delete_user(request, user_id):
         messages.error(request, f'حدث خطأ أثناء حذف المستخدم: {str(e)}')
     
     return redirect('dashboard:users_list')
+
+# Broadcast campaigns
+BROADCAST_ACTIONS = {
+    # action: (allowed from statuses, new status, message)
+    'start': (('draft',), 'queued', 'تمت جدولة الحملة للإرسال'),
+    'pause': (('queued', 'running'), 'paused', 'تم إيقاف الحملة مؤقتاً'),
+    'resume': (('paused',), 'queued', 'تم استئناف الحملة'),
+    'cancel': (('draft', 'queued', 'running', 'paused'), 'cancelled', 'تم إلغاء الحملة'),
+}
+
+
+def _broadcast_progress(campaign):
+    return {
+        'id': campaign.id,
+        'status': campaign.status,
+        'status_display': campaign.get_status_display(),
+        'total': campaign.total_recipients,
+        'sent': campaign.sent_count,
+        'failed': campaign.failed_count,
+        'blocked': campaign.blocked_count,
+        'processed': campaign.processed_count,
+        'percent': campaign.progress_percent,
+        'started_at': campaign.started_at.isoformat() if campaign.started_at else None,
+        'finished_at': campaign.finished_at.isoformat() if campaign.finished_at else None,
+    }
+
+
+@staff_member_required
+def broadcasts_list(request):
+    """List broadcast campaigns and create new ones"""
+    from .broadcasts import queue_campaign, recipients_queryset
+    from .models import BroadcastCampaign
+    
+    if request.method == 'POST':
+        title = request.POST.get('title', '').strip()
+        message_text = request.POST.get('message', '').strip()
+        if not title or not message_text:
+            messages.error(request, 'العنوان ونص الرسالة مطلوبان')
+            return redirect('dashboard:broadcasts_list')
+        
+        campaign = BroadcastCampaign(
+            title=title,
+            message=message_text,
+            parse_mode=request.POST.get('parse_mode', ''),
+            target_user_type=request.POST.get('target_user_type', ''),
+            target_city_id=request.POST.get('target_city') or None,
+            target_active_only=request.POST.get('target_active_only') == 'on',
+            created_by=request.user,
+        )
+        campaign.total_recipients = recipients_queryset(campaign).count()
+        campaign.save()
+        
+        if request.POST.get('send_now'):
+            queue_campaign(campaign)
+            messages.success(request, f'تمت جدولة الحملة "{campaign.title}" لـ {campaign.total_recipients} مستخدم')
+        else:
+            messages.success(request, f'تم حفظ الحملة "{campaign.title}" كمسودة')
+        return redirect('dashboard:broadcast_detail', campaign_id=campaign.id)
+    
+    context = {
+        'campaigns': BroadcastCampaign.objects.select_related('target_city')[:50],
+        'cities': City.objects.filter(is_active=True).order_by('name'),
+        'user_types': BroadcastCampaign.TARGET_USER_TYPES,
+    }
+    return render(request, 'dashboard/broadcasts_list.html', context)
+
+
+@staff_member_required
+def broadcast_detail(request, campaign_id):
+    """Campaign progress page (polls broadcast_progress while sending)"""
+    from .models import BroadcastCampaign
+    
+    campaign = get_object_or_404(BroadcastCampaign.objects.select_related('target_city', 'created_by'), id=campaign_id)
+    context = {
+        'campaign': campaign,
+        'progress': _broadcast_progress(campaign),
+        'recent_failures': campaign.deliveries.exclude(status='sent').select_related('user').order_by('-id')[:20],
+    }
+    return render(request, 'dashboard/broadcast_detail.html', context)
+
+
+@staff_member_required
+def broadcast_progress(request, campaign_id):
+    """JSON progress for the live campaign page"""
+    from .models import BroadcastCampaign
+    
+    campaign = get_object_or_404(BroadcastCampaign, id=campaign_id)
+    return JsonResponse(_broadcast_progress(campaign))
+
+
+@staff_member_required
+def broadcast_action(request, campaign_id, action):
+    """Start, pause, resume or cancel a campaign"""
+    from .broadcasts import queue_campaign
+    from .models import BroadcastCampaign
+    
+    if request.method != 'POST' or action not in BROADCAST_ACTIONS:
+        messages.error(request, 'طريقة غير صحيحة')
+        return redirect('dashboard:broadcast_detail', campaign_id=campaign_id)
+    
+    allowed_from, new_status, success_message = BROADCAST_ACTIONS[action]
+    campaign = get_object_or_404(BroadcastCampaign, id=campaign_id)
+    if campaign.status not in allowed_from:
+        messages.error(request, f'لا يمكن تنفيذ هذا الإجراء على حملة {campaign.get_status_display()}')
+    elif action == 'start':
+        queue_campaign(campaign)
+        messages.success(request, success_message)
+    else:
+        # Conditional update: the sender may have finished the campaign meanwhile
+        updated = BroadcastCampaign.objects.filter(id=campaign.id, status__in=allowed_from).update(status=new_status)
+        if updated:
+            messages.success(request, success_message)
+        else:
+            messages.error(request, 'تغيرت حالة الحملة، يرجى المحاولة مرة أخرى')
+    return redirect('dashboard:broadcast_detail', campaign_id=campaign_id)